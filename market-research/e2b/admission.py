@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+自适应并发准入控制（Admission Control）
+
+扇出 / Master-Worker 在规模上去之后会一次性向控制面发起成百上千个 Sandbox.create，
+固定的 max_concurrency 要么太保守，要么直接打满服务端配额，引发限流和重试风暴。
+
+AdmissionController 在沙箱创建和命令执行外面加一层准入：
+- 并发上限由观测到的延迟和错误自动调整：
+  - AIMDLimit：成功时加性增加，失败 / 超时时乘性减少
+  - GradientLimit：比较短期与长期延迟，延迟上升（服务端开始排队）时收缩，平稳时增长
+- 超过上限的请求在 FIFO 队列中等待，带截止时间：超时抛出 AdmissionTimeout，
+  队列满时立即抛出 AdmissionRejected，而不是继续给服务端加压
+- metrics() 导出当前上限、在途数、排队数、排队等待和执行延迟分位数；
+  传入 tracer 时上限变化记录为 tracing 事件
+- 线程（acquire / call）和 asyncio（acquire_async / call_async）共用同一个控制器
+
+用法：
+    admission = AdmissionController(AIMDLimit(initial=8), timeout=30)
+    factory = limited_factory(Sandbox.create, create=admission)
+    fan_out(tasks, factory=factory, max_concurrency=200)
+
+直接运行本文件会用 FaultInjector（容量有限、过载时变慢并失败的本地服务）
+离线对比 无准入 / AIMD / Gradient 三种方式下的成功率、延迟和收敛后的并发上限。
+"""
+
+import asyncio
+import collections
+import inspect
+import threading
+import time
+
+from fan_out import acall
+from sandbox_pool import _percentile
+from tracing import NULL_TRACER
+
+
+class AdmissionRejected(RuntimeError):
+    """排队请求数已达上限，请求被直接拒绝"""
+
+
+class AdmissionTimeout(AdmissionRejected):
+    """请求在截止时间之前没有获得执行许可"""
+
+
+class AIMDLimit:
+    """
+    加性增 / 乘性减（AIMD）并发上限
+
+    与 TCP 拥塞控制相同：每成功一个 "窗口"（约 limit 个请求）上限 +1，
+    即每次成功 +1/limit，在途请求不到上限的一半时不增长（请求量不足，无法说明服务端还有余量）；
+    请求失败，或延迟超过 timeout（秒）时上限乘以 backoff_ratio。
+    """
+
+    def __init__(self, initial=10, min_limit=1, max_limit=200, backoff_ratio=0.9, timeout=None):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.timeout = timeout
+
+    def update(self, rtt, inflight, dropped):
+        if dropped or (self.timeout is not None and rtt > self.timeout):
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        elif inflight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        return self.limit
+
+
+class GradientLimit:
+    """
+    基于延迟梯度的并发上限
+
+    长期延迟（long_window 个样本的 EMA）代表无排队时的延迟，短期延迟（short_window）代表当前延迟：
+        gradient = clamp(tolerance * long / short, 0.5, 1.0)
+        new_limit = limit * gradient + queue_size
+    延迟平稳时 gradient = 1，上限按 queue_size 增长；服务端排队导致短期延迟上升时上限收缩。
+    smoothing 平滑每次调整的幅度；请求失败时上限乘以 backoff_ratio。
+    """
+
+    def __init__(self, initial=10, min_limit=1, max_limit=200, tolerance=1.5, smoothing=0.2,
+                 queue_size=1, short_window=10, long_window=100, backoff_ratio=0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.queue_size = queue_size
+        self.backoff_ratio = backoff_ratio
+        self._short_alpha = 2 / (short_window + 1)
+        self._long_alpha = 2 / (long_window + 1)
+        self.short_rtt = None
+        self.long_rtt = None
+
+    def update(self, rtt, inflight, dropped):
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            return self.limit
+
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+        else:
+            self.short_rtt += self._short_alpha * (rtt - self.short_rtt)
+            self.long_rtt += self._long_alpha * (rtt - self.long_rtt)
+        # 长期延迟远高于当前延迟说明过载已经过去，让基线更快地回落
+        if self.long_rtt > 2 * self.short_rtt:
+            self.long_rtt *= 0.95
+
+        if inflight * 2 < self.limit:
+            return self.limit
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        new_limit = self.limit * gradient + self.queue_size
+        self.limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+        return self.limit
+
+
+class Permit:
+    """
+    一次执行许可；作为上下文管理器使用
+
+    正常退出记为成功；抛出 drop_on 中的异常记为失败（上限收缩）；
+    其他异常只释放许可，不参与上限调整（如业务代码自己的错误）。
+    """
+
+    __slots__ = ("controller", "admitted_at", "queue_wait", "_released")
+
+    def __init__(self, controller, queue_wait):
+        self.controller = controller
+        self.admitted_at = time.perf_counter()
+        self.queue_wait = queue_wait
+        self._released = False
+
+    def release(self, dropped=False, sample=True):
+        if not self._released:
+            self._released = True
+            self.controller._release(self, dropped, sample)
+
+    def drop(self):
+        """显式记为失败（如收到 429 响应但没有抛异常）"""
+        self.release(dropped=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.release()
+        elif issubclass(exc_type, self.controller.drop_on):
+            self.release(dropped=True)
+        else:
+            self.release(sample=False)
+        return False
+
+
+class _Waiter:
+    __slots__ = ("granted", "event", "future", "loop")
+
+    def __init__(self, event=None, future=None, loop=None):
+        self.granted = False
+        self.event = event
+        self.future = future
+        self.loop = loop
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    自适应并发准入控制器
+
+    limit:     并发上限算法（AIMDLimit / GradientLimit），默认 AIMDLimit()
+    max_queue: 最多排队的请求数，超出后直接拒绝
+    timeout:   默认的排队截止时间（秒），None 表示一直等待
+    drop_on:   计为失败（触发上限收缩）的异常类型
+    name:      指标和追踪事件中使用的名称
+    tracer:    tracing.Tracer，上限变化时记录 admission_limit 事件
+    """
+
+    def __init__(self, limit=None, max_queue=1000, timeout=None, drop_on=(Exception,),
+                 name="admission", tracer=None, history=1000):
+        self.algorithm = limit or AIMDLimit()
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.drop_on = drop_on
+        self.name = name
+        self.tracer = tracer or NULL_TRACER
+        self.inflight = 0
+        self.history = collections.deque(maxlen=history)    # (时间, 上限)
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "succeeded": 0,
+                      "dropped": 0, "max_queued": 0}
+        self._origin = time.perf_counter()
+        self._waiters = collections.deque()
+        self._queue_waits = collections.deque(maxlen=1024)
+        self._rtts = collections.deque(maxlen=1024)
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return max(1, int(self.algorithm.limit))
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    # ---------- 线程 ----------
+
+    def acquire(self, timeout=None, deadline=None):
+        """
+        获取执行许可，必要时排队等待
+
+        timeout 为相对时间（秒，默认使用控制器的 timeout），deadline 为 time.monotonic() 绝对时间，
+        两者取较早者；到期仍未获得许可时抛出 AdmissionTimeout。
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self._admit():
+                return self._permit(start)
+            waiter = self._enqueue(_Waiter(event=threading.Event()))
+
+        waiter.event.wait(self._wait_time(timeout, deadline))
+        with self._lock:
+            if not waiter.granted:
+                self._abandon(waiter)
+                raise AdmissionTimeout(f"{self.name}: not admitted before deadline")
+            return self._permit(start)
+
+    def call(self, fn, *args, **kwargs):
+        """在准入控制下调用 fn（排队截止时间使用控制器的 timeout）"""
+        with self.acquire():
+            return fn(*args, **kwargs)
+
+    # ---------- asyncio ----------
+
+    async def acquire_async(self, timeout=None, deadline=None):
+        """acquire 的 asyncio 版本：排队时不阻塞事件循环"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._admit():
+                return self._permit(start)
+            waiter = self._enqueue(_Waiter(future=loop.create_future(), loop=loop))
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=self._wait_time(timeout, deadline))
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._give_back()
+                else:
+                    self._abandon(waiter, timed_out=False)
+            raise
+        with self._lock:
+            if not waiter.granted:
+                self._abandon(waiter)
+                raise AdmissionTimeout(f"{self.name}: not admitted before deadline")
+            return self._permit(start)
+
+    async def call_async(self, fn, *args, **kwargs):
+        """在准入控制下调用 fn（协程函数直接 await，同步函数放到线程池）"""
+        with await self.acquire_async():
+            return await acall(fn, *args, **kwargs)
+
+    # ---------- 指标 ----------
+
+    def metrics(self):
+        with self._lock:
+            waits = list(self._queue_waits)
+            rtts = list(self._rtts)
+            metrics = {"name": self.name, "limit": self.limit, "inflight": self.inflight,
+                       "queued": len(self._waiters), **self.stats}
+        metrics.update({
+            "queue_wait_p50_ms": _percentile(waits, 50) * 1000 if waits else 0.0,
+            "queue_wait_p99_ms": _percentile(waits, 99) * 1000 if waits else 0.0,
+            "rtt_p50_ms": _percentile(rtts, 50) * 1000 if rtts else 0.0,
+            "rtt_p99_ms": _percentile(rtts, 99) * 1000 if rtts else 0.0,
+        })
+        return metrics
+
+    # ---------- 内部实现（调用方持有 _lock） ----------
+
+    def _admit(self):
+        # 有人在排队时新请求也要排队，保证 FIFO
+        if not self._waiters and self.inflight < self.limit:
+            self.inflight += 1
+            return True
+        return False
+
+    def _enqueue(self, waiter):
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(f"{self.name}: queue is full ({self.max_queue})")
+        self._waiters.append(waiter)
+        self.stats["max_queued"] = max(self.stats["max_queued"], len(self._waiters))
+        return waiter
+
+    def _abandon(self, waiter, timed_out=True):
+        self._waiters.remove(waiter)
+        if timed_out:
+            self.stats["timed_out"] += 1
+
+    def _give_back(self):
+        # 已分配但没有被使用的许可：不调整上限，直接让给下一个排队者
+        self.inflight -= 1
+        for waiter in self._grant():
+            waiter.wake()
+
+    def _grant(self):
+        granted = []
+        while self._waiters and self.inflight < self.limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.inflight += 1
+            granted.append(waiter)
+        return granted
+
+    def _wait_time(self, timeout, deadline):
+        timeout = self.timeout if timeout is None else timeout
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _permit(self, start):
+        permit = Permit(self, time.perf_counter() - start)
+        self.stats["admitted"] += 1
+        self._queue_waits.append(permit.queue_wait)
+        return permit
+
+    def _release(self, permit, dropped, sample):
+        rtt = time.perf_counter() - permit.admitted_at
+        with self._lock:
+            previous = self.limit
+            if sample:
+                # 用释放前的在途数判断上限是否被用满
+                self.algorithm.update(rtt, self.inflight, dropped)
+                self._rtts.append(rtt)
+                self.stats["dropped" if dropped else "succeeded"] += 1
+            self.inflight -= 1
+            granted = self._grant()
+            limit, inflight, queued = self.limit, self.inflight, len(self._waiters)
+            if limit != previous:
+                self.history.append((time.perf_counter() - self._origin, limit))
+        for waiter in granted:
+            waiter.wake()
+        if limit != previous:
+            self.tracer.event("admission_limit", controller=self.name, limit=limit,
+                              inflight=inflight, queued=queued)
+
+
+class LimitedSandbox:
+    """沙箱代理：commands.run 经过准入控制，其余属性直接转发给原沙箱"""
+
+    def __init__(self, sandbox, controller):
+        self._sandbox = sandbox
+        self.commands = _LimitedCommands(sandbox.commands, controller)
+
+    def __getattr__(self, name):
+        return getattr(self._sandbox, name)
+
+
+class _LimitedCommands:
+    def __init__(self, commands, controller):
+        self._commands = commands
+        self._controller = controller
+
+    def __getattr__(self, name):
+        return getattr(self._commands, name)
+
+    def run(self, cmd, **kwargs):
+        if inspect.iscoroutinefunction(self._commands.run):
+            return self._controller.call_async(self._commands.run, cmd, **kwargs)
+        return self._controller.call(self._commands.run, cmd, **kwargs)
+
+
+def limited_factory(factory, create=None, commands=None):
+    """
+    包装沙箱工厂（同步或协程函数）：创建沙箱经过 create 控制器，
+    返回的沙箱 commands.run 经过 commands 控制器（为 None 时不限制对应环节）
+    """
+    def wrap(sandbox):
+        return LimitedSandbox(sandbox, commands) if commands else sandbox
+
+    if inspect.iscoroutinefunction(factory):
+        async def create_async():
+            sandbox = await create.call_async(factory) if create else await factory()
+            return wrap(sandbox)
+        return create_async
+
+    def create_sandbox():
+        return wrap(create.call(factory) if create else factory())
+    return create_sandbox
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    from local_sandbox import FaultInjector, LocalSandbox
+
+    parser = argparse.ArgumentParser(description="自适应并发准入控制演示（离线）")
+    parser.add_argument("--requests", type=int, default=300, help="突发请求数（创建 + 执行 + 销毁）")
+    parser.add_argument("--capacity", type=int, default=20, help="模拟服务端的并发容量")
+    parser.add_argument("--create-delay", type=float, default=0.2, help="未过载时的沙箱创建耗时（秒）")
+    parser.add_argument("--latency", type=float, default=0.02, help="未过载时的请求往返延迟（秒）")
+    parser.add_argument("--overload-failure-rate", type=float, default=0.5,
+                        help="过载时的最大失败率")
+    parser.add_argument("--timeout", type=float, default=60.0, help="排队截止时间（秒）")
+    args = parser.parse_args()
+
+    def run(label, make_controller):
+        faults = FaultInjector(capacity=args.capacity, jitter=0.1,
+                               overload_failure_rate=args.overload_failure_rate, seed=1)
+
+        def factory():
+            return LocalSandbox.create(create_delay=args.create_delay, latency=args.latency,
+                                       faults=faults)
+
+        controller = make_controller()
+        if controller:
+            factory = limited_factory(factory, create=controller, commands=controller)
+
+        def task(_):
+            start = time.perf_counter()
+            sandbox = None
+            try:
+                sandbox = factory()
+                result = sandbox.commands.run("echo ok")
+                return result.exit_code == 0, time.perf_counter() - start
+            except Exception:
+                return False, time.perf_counter() - start
+            finally:
+                if sandbox is not None:
+                    sandbox.kill()
+
+        start = time.perf_counter()
+        # 所有请求同时到达，模拟扩大规模后的扇出循环
+        with ThreadPoolExecutor(max_workers=args.requests) as executor:
+            outcomes = list(executor.map(task, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+        ok = [latency * 1000 for success, latency in outcomes if success]
+        print(f"\n   {label}")
+        print(f"      成功 {len(ok)}/{args.requests}   总耗时 {elapsed:.2f}s"
+              f"   p50={_percentile(ok, 50) if ok else 0:.0f} ms"
+              f"   p99={_percentile(ok, 99) if ok else 0:.0f} ms")
+        print(f"      服务端: 请求 {faults.stats['requests']}, 失败 {faults.stats['failures']}, "
+              f"峰值并发 {faults.stats['peak_inflight']}")
+        if controller:
+            m = controller.metrics()
+            print(f"      准入: 最终上限 {m['limit']}, 最多排队 {m['max_queued']}, "
+                  f"排队 p50={m['queue_wait_p50_ms']:.0f} ms, 超时 {m['timed_out']}, "
+                  f"失败样本 {m['dropped']}")
+
+    print("=" * 60)
+    print(f"突发 {args.requests} 个请求, 服务端容量 {args.capacity}"
+          f"（过载时延迟按负载增长, 最多 {args.overload_failure_rate:.0%} 失败）")
+    print("=" * 60)
+    run("无准入控制", lambda: None)
+    run("AIMD", lambda: AdmissionController(AIMDLimit(initial=4), timeout=args.timeout))
+    run("Gradient", lambda: AdmissionController(GradientLimit(initial=4), timeout=args.timeout))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+常驻 Agent 运行时（Agent Host）
+
+run_agent 的默认路径每一步都要：写 /home/user/input.json → 启动新的 python3 进程 → 解析 stdout，
+即一次解释器冷启动 + 两次文件 I/O。
+
+Agent Host 在沙箱内常驻一个 Python 进程，协调器通过一条持久的 stdin/stdout 通道
+发送 (script, input) 消息并收回结构化结果：
+- 脚本按路径编译一次后缓存（文件修改后自动重新编译）
+- 输入以 input_data 变量直接注入脚本，不落盘
+- 一行一条紧凑 JSON 消息，不再有 indent=2 的文件写入
+
+直接运行本文件会用 LocalSandbox 离线对比两种方式的单步延迟。
+"""
+
+import itertools
+import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+HOST_PATH = "/home/user/.agent_host.py"
+
+# 沙箱内常驻进程：逐行读取请求，执行脚本，逐行返回结果
+HOST_SCRIPT = r'''
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+_out = sys.stdout
+_cache = {}
+
+
+def _load(path):
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+    _cache[path] = (mtime, code)
+    return code
+
+
+def _reply(message):
+    _out.write(json.dumps(message, separators=(",", ":")) + "\n")
+    _out.flush()
+
+
+_reply({"ready": True, "pid": os.getpid()})
+
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    request = json.loads(line)
+    if request.get("op") == "exit":
+        break
+
+    start = time.perf_counter()
+    buffer = io.StringIO()
+    try:
+        scope = {"__name__": "__main__", "__file__": request["path"]}
+        if "input" in request:
+            scope["input_data"] = request["input"]
+        with contextlib.redirect_stdout(buffer):
+            exec(_load(request["path"]), scope)
+        stdout = buffer.getvalue()
+        try:
+            output = json.loads(stdout)
+        except ValueError:
+            output = stdout
+        _reply({"id": request["id"], "ok": True, "output": output,
+                "elapsed": time.perf_counter() - start})
+    except (Exception, SystemExit):
+        _reply({"id": request["id"], "ok": False, "error": traceback.format_exc(),
+                "stdout": buffer.getvalue(), "elapsed": time.perf_counter() - start})
+'''
+
+
+class AgentHostError(RuntimeError):
+    """Agent 在常驻进程中执行失败，或常驻进程无响应"""
+
+
+class AgentHostTimeout(AgentHostError):
+    """常驻进程在超时时间内没有返回结果（进程可能仍卡在该脚本上）"""
+
+
+class AgentHost:
+    """
+    协调器侧的 Agent Host 客户端
+
+    用法：
+        host = AgentHost(sandbox).start()
+        output = host.call("/home/user/agent_a.py", {"data": [1, 2, 3]})
+        host.close()
+
+    脚本通过 input_data 变量获得输入，把结果以 JSON 打印到 stdout（与 run_agent 的约定相同）。
+    常驻进程串行执行请求；多个线程可以同时调用 call。
+    e2b 只在 handle.wait() / 迭代句柄时送达后台命令的输出（传给 run 的回调会被忽略），
+    因此由一个读取线程阻塞在 handle.wait(on_stdout=...) 上接收结果；wait 返回或抛出即常驻进程已退出。
+    """
+
+    def __init__(self, sandbox, path=HOST_PATH):
+        self.sandbox = sandbox
+        self.path = path
+        self._handle = None
+        self._buffer = ""
+        self._stderr = []
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._reader = None
+        self._exit_error = None
+        self.last_elapsed = None
+
+    def start(self, timeout=10):
+        """上传并启动常驻进程，等待其就绪"""
+        self.sandbox.files.write(self.path, HOST_SCRIPT)
+        self._handle = self.sandbox.commands.run(
+            f"python3 -u {self.path}",
+            background=True,
+            stdin=True,
+            timeout=0,
+        )
+        self._reader = threading.Thread(target=self._read, args=(self._handle,),
+                                        name="agent-host-reader", daemon=True)
+        self._reader.start()
+        if not self._ready.wait(timeout) or self._exit_error:
+            self.close()
+            raise AgentHostError(f"agent host did not start: {''.join(self._stderr)[-500:]}")
+        return self
+
+    def call(self, script_path, input_data=None, timeout=60):
+        """在常驻进程中执行脚本，返回解析后的输出"""
+        request_id = next(self._ids)
+        future = Future()
+        request = {"id": request_id, "path": script_path}
+        if input_data is not None:
+            request["input"] = input_data
+        line = json.dumps(request, separators=(",", ":")) + "\n"
+
+        with self._lock:
+            if self._exit_error:
+                raise AgentHostError(self._exit_error)
+            self._pending[request_id] = future
+            self.sandbox.commands.send_stdin(self._handle.pid, line)
+
+        try:
+            response = future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise AgentHostTimeout(f"{script_path} timed out after {timeout}s")
+
+        self.last_elapsed = response.get("elapsed")
+        if not response["ok"]:
+            raise AgentHostError(response["error"].strip().splitlines()[-1])
+        return response["output"]
+
+    @property
+    def alive(self):
+        """常驻进程已启动且仍在运行"""
+        return self._handle is not None and self._exit_error is None
+
+    def close(self):
+        """通知常驻进程退出并终止它"""
+        if self._handle is None:
+            return
+        try:
+            self.sandbox.commands.send_stdin(self._handle.pid, '{"op":"exit"}\n')
+        except Exception:
+            pass
+        try:
+            self._handle.kill()
+        except Exception:
+            pass
+        self._handle = None
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(AgentHostError("agent host closed"))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, handle):
+        """读取线程：把输出交给 _on_stdout，直到常驻进程退出"""
+        try:
+            handle.wait(on_stdout=self._on_stdout, on_stderr=self._stderr.append)
+            error = "agent host exited"
+        except Exception as e:
+            # CommandExitException：常驻进程崩溃或被 kill
+            error = f"agent host exited: {getattr(e, 'exit_code', e)}"
+        stderr = "".join(self._stderr).strip()
+        if stderr:
+            error += f": {stderr[-500:]}"
+        with self._lock:
+            self._exit_error = error
+            pending, self._pending = self._pending, {}
+        self._ready.set()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(AgentHostError(error))
+
+    def _on_stdout(self, chunk):
+        # 输出可能被拆成任意大小的片段，按行重新组装
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                continue   # 脚本绕过重定向直接写到了进程 stdout
+            if message.get("ready"):
+                self._ready.set()
+                continue
+            with self._lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import time
+
+    from local_sandbox import LocalSandbox
+    from orchestrator_pattern import AgentOrchestrator, INITIAL_INPUT
+    from sandbox_pool import SandboxPool, _percentile
+
+    parser = argparse.ArgumentParser(description="Agent Host 单步延迟基准测试（离线）")
+    parser.add_argument("--steps", type=int, default=50)
+    args = parser.parse_args()
+
+    def bench(label, orchestrator):
+        latencies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            orchestrator.create_sandbox()
+            orchestrator._create_agents()
+            try:
+                for _ in range(args.steps):
+                    start = time.perf_counter()
+                    output = orchestrator.run_agent("Agent A", "/home/user/agent_a.py",
+                                                    INITIAL_INPUT)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    assert output and output["total"] == 850
+            finally:
+                orchestrator.cleanup()
+        print(f"   {label:<14} p50={_percentile(latencies, 50):7.2f} ms"
+              f"   p99={_percentile(latencies, 99):7.2f} ms")
+
+    print("=" * 60)
+    print(f"单步延迟: {args.steps} 次 Agent A")
+    print("=" * 60)
+    with SandboxPool(factory=LocalSandbox.create, size=1) as pool:
+        bench("文件 + 新进程", AgentOrchestrator(pool=pool))
+        bench("Agent Host", AgentOrchestrator(pool=pool, use_agent_host=True))
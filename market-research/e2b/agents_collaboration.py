@@ -12,6 +12,10 @@ E2B Agents 协作示例
 from pathlib import Path
 from dotenv import load_dotenv
 from e2b import Sandbox
+from bulk_files import write_many
+from dag_workflow import DagWorkflow
+from shared_state import install as install_shared_state
+import asyncio
 import json
 import time
 
@@ -236,8 +240,7 @@ print(json.dumps(final_result, indent=2))
     }
     sandbox.files.write("/tmp/parallel/input.json", json.dumps(shared_input))
 
-    # Agent A: 文本处理
-    print("\n📝 Agent A: 文本分析")
+    # Agent A: 文本处理（只依赖共享输入）
     text_agent = """
 import json
 
@@ -258,12 +261,7 @@ with open('/tmp/parallel/agent_a_result.json', 'w') as f:
 print(f"文本处理完成: {result['word_count']} words")
 """
 
-    sandbox.files.write("/tmp/parallel/agent_a.py", text_agent)
-    result = sandbox.commands.run("python3 /tmp/parallel/agent_a.py")
-    print(f"✅ {result.stdout}")
-
-    # Agent B: 数值处理
-    print("\n🔢 Agent B: 数值计算")
+    # Agent B: 数值处理（同样只依赖共享输入，可以与 Agent A 并行）
     number_agent = """
 import json
 
@@ -284,12 +282,7 @@ with open('/tmp/parallel/agent_b_result.json', 'w') as f:
 print(f"数值处理完成: sum={result['sum']}")
 """
 
-    sandbox.files.write("/tmp/parallel/agent_b.py", number_agent)
-    result = sandbox.commands.run("python3 /tmp/parallel/agent_b.py")
-    print(f"✅ {result.stdout}")
-
-    # Coordinator Agent: 整合结果
-    print("\n🎯 Coordinator Agent: 整合所有结果")
+    # Coordinator Agent: 整合结果（Agent A 和 Agent B 都完成后立即执行）
     coordinator = """
 import json
 
@@ -314,9 +307,20 @@ print('所有 Agents 协作完成！')
 print(json.dumps(combined, indent=2))
 """
 
-    sandbox.files.write("/tmp/parallel/coordinator.py", coordinator)
-    result = sandbox.commands.run("python3 /tmp/parallel/coordinator.py")
-    print(f"✅ {result.stdout}")
+    # 用 DAG 声明数据依赖，由调度器并发执行就绪的步骤
+    parallel_workflow = (DagWorkflow()
+                         .add_step("agent_a", text_agent, path="/tmp/parallel/agent_a.py",
+                                   parse_json=False)
+                         .add_step("agent_b", number_agent, path="/tmp/parallel/agent_b.py",
+                                   parse_json=False)
+                         .add_step("coordinator", coordinator, path="/tmp/parallel/coordinator.py",
+                                   needs=["agent_a", "agent_b"], parse_json=False))
+
+    print("\n📝 Agent A: 文本分析 ∥ 🔢 Agent B: 数值计算 → 🎯 Coordinator: 整合所有结果")
+    parallel_run = asyncio.run(parallel_workflow.run(sandbox))
+    for name, output in parallel_run.outputs.items():
+        print(f"✅ [{name}] {output}")
+    print(parallel_run.report())
 
     # ============================================
     # 场景 4: 状态共享与同步
@@ -325,56 +329,72 @@ print(json.dumps(combined, indent=2))
     print("场景 4: Agent 状态共享")
     print("=" * 60)
 
-    # 使用锁文件和状态文件进行协调
+    # 使用 SQLite (WAL) 任务队列协调：领取 / 完成都是原子操作，多个 agent 进程可以并发访问
     print("\n🔄 初始化共享状态")
-    initial_state = {
-        "task_queue": ["task1", "task2", "task3", "task4"],
-        "completed_tasks": [],
-        "agents_status": {}
-    }
-    sandbox.files.write("/tmp/state/shared_state.json", json.dumps(initial_state, indent=2))
+    install_shared_state(sandbox)
+    state_files = {"/tmp/state/init.py": """
+import sys
+sys.path.insert(0, '/home/user/.lib')
+from shared_state import TaskQueue
+
+TaskQueue('/tmp/state/tasks.db').put_many(['task1', 'task2', 'task3', 'task4'])
+"""}
 
     # 模拟多个 agent 处理任务
     for i in range(1, 4):
         agent_id = f"Agent_{i}"
-        print(f"\n🤖 {agent_id} 处理任务")
 
         # Agent 工作器脚本
         worker_script = f"""
-import json
+import sys
+sys.path.insert(0, '/home/user/.lib')
+from shared_state import TaskQueue
 
 agent_id = '{agent_id}'
+queue = TaskQueue('/tmp/state/tasks.db')
 
-# 读取共享状态
-with open('/tmp/state/shared_state.json', 'r') as f:
-    state = json.load(f)
-
-# 从队列中获取任务
-if state['task_queue']:
-    task = state['task_queue'].pop(0)
-
+# 从队列中原子领取任务
+task = queue.claim(agent_id)
+if task is not None:
     # 执行任务（模拟）
-    result = agent_id + " completed " + task
-    state['completed_tasks'].append(result)
-    state['agents_status'][agent_id] = 'completed'
-
-    # 更新状态
-    with open('/tmp/state/shared_state.json', 'w') as f:
-        json.dump(state, f, indent=2)
-
+    result = agent_id + " completed " + task.payload
+    queue.complete(task.id, result)
+    queue.set_state(agent_id, 'completed')
     print(agent_id + ': ' + result)
 else:
     print(agent_id + ': No tasks available')
 """
 
-        script = worker_script
-        sandbox.files.write(f"/tmp/state/worker_{i}.py", script)
-        result = sandbox.commands.run(f"python3 /tmp/state/worker_{i}.py")
-        print(f"   {result.stdout.strip()}")
+        state_files[f"/tmp/state/worker_{i}.py"] = worker_script
+
+    state_files["/tmp/state/show.py"] = """
+import json, sys
+sys.path.insert(0, '/home/user/.lib')
+from shared_state import TaskQueue
+
+queue = TaskQueue('/tmp/state/tasks.db')
+print(json.dumps({
+    'task_counts': queue.counts(),
+    'completed_tasks': [result for _, _, result in queue.results()],
+    'agents_status': queue.state(),
+}, indent=2))
+"""
+
+    # 初始化脚本和全部工作器脚本合并为一次批量上传
+    write_many(sandbox, state_files)
+    sandbox.commands.run("python3 /tmp/state/init.py")
+    print(f"   批量上传 {len(state_files)} 个文件，任务队列已就绪")
+
+    # 所有 agent 同时启动，并发领取任务
+    print("\n🤖 Agent_1 ∥ Agent_2 ∥ Agent_3 并发处理任务")
+    handles = [sandbox.commands.run(f"python3 /tmp/state/worker_{i}.py", background=True)
+               for i in range(1, 4)]
+    for handle in handles:
+        print(f"   {handle.wait().stdout.strip()}")
 
     # 查看最终状态
     print("\n📊 查看最终共享状态")
-    final_state = sandbox.files.read("/tmp/state/shared_state.json")
+    final_state = sandbox.commands.run("python3 /tmp/state/show.py").stdout
     print(f"✅ 最终状态:\n{final_state}")
 
     # ============================================
@@ -402,6 +422,6 @@ finally:
 print("\n💡 总结:")
 print("   1. 文件系统共享 - Agents 通过 JSON 文件交换数据")
 print("   2. 流水线处理 - Agent 链式处理，输出作为下一个的输入")
-print("   3. 并行协作 - 多个 Agents 同时处理，Coordinator 整合结果")
-print("   4. 状态同步 - 共享状态文件协调任务分配")
+print("   3. 并行协作 - 多个 Agents 同时处理，Coordinator 整合结果（dag_workflow.py）")
+print("   4. 状态同步 - SQLite 任务队列原子领取任务（shared_state.py）")
 print("\n🔗 这些模式可以组合使用，构建复杂的 Multi-Agent 系统")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+跨沙箱产物传递（Artifacts）
+
+multi_sandbox_agents.py 场景 1 原来的做法：协调器 json.loads 上一阶段的 stdout，
+再用 f-string 把 json.dumps 的结果拼进下一阶段的脚本源码（input_data = {...}）。
+每份数据被解析、复制两次，还变成了 Python 源码的一部分——数据越大，内存和耗时增长越明显。
+
+本模块让协调器只搬运不透明的字节流：
+- 阶段把输出写成文件（产物），下一阶段通过 AGENT_INPUT 指向的文件读取
+- relay()：两个沙箱都存活时，读端以 format="stream" 逐块读取，写端以文件对象流式上传，
+  协调器内存中同一时刻只有一个数据块
+- ArtifactStore：本地内容寻址的对象存储。上一阶段的沙箱可以先销毁，
+  产物以 ArtifactRef（sha256 + 大小）的形式在协调器中流转，同一产物可以分发给多个沙箱
+- 协调器全程不解码产物内容
+
+直接运行本文件会对比 "解析 + 拼接源码" 与 产物传递 在不同数据量下的耗时和协调器内存峰值。
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+
+CHUNK_SIZE = 1 << 20
+ARTIFACT_DIR = "/home/user/artifacts"
+
+
+@dataclass(frozen=True)
+class ArtifactRef:
+    """对象存储中一个产物的引用"""
+    digest: str
+    size: int
+
+    def __str__(self):
+        return f"artifact:{self.digest[:12]} ({self.size} bytes)"
+
+
+def iter_file(sandbox, path):
+    """逐块读取沙箱内的文件（e2b files.read 的 stream 格式）"""
+    for chunk in sandbox.files.read(path, format="stream"):
+        yield bytes(chunk)
+
+
+class ChunkReader(io.RawIOBase):
+    """把字节块迭代器包装成只读文件对象，供 files.write 流式上传"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._view = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._view:
+            try:
+                self._view = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(buffer), len(self._view))
+        buffer[:n] = self._view[:n]
+        self._view = self._view[n:]
+        return n
+
+
+def relay(src, src_path, dst, dst_path):
+    """把 src 沙箱中的文件以字节流形式直接写入 dst 沙箱（协调器不缓存完整内容）"""
+    dst.files.write(dst_path, io.BufferedReader(ChunkReader(iter_file(src, src_path)),
+                                                CHUNK_SIZE))
+
+
+class ArtifactStore:
+    """
+    协调器侧的内容寻址对象存储
+
+    用法：
+        store = ArtifactStore()
+        ref = store.put_from(sandbox1, "/home/user/artifacts/stage1.json")
+        sandbox1.kill()
+        store.get_into(sandbox2, ref, "/home/user/artifacts/stage1.json")
+
+    root: 存储目录，默认新建临时目录（close() 时删除）
+    """
+
+    def __init__(self, root=None):
+        self._owns_root = root is None
+        self.root = root or tempfile.mkdtemp(prefix="artifacts-")
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {"puts": 0, "gets": 0, "dedup_hits": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def put_from(self, sandbox, path):
+        """把沙箱内的文件流式存入对象存储，返回 ArtifactRef"""
+        return self._put(iter_file(sandbox, path))
+
+    def put_bytes(self, data):
+        """把协调器自己产生的数据存入对象存储"""
+        return self._put([data.encode() if isinstance(data, str) else data])
+
+    def get_into(self, sandbox, ref, path):
+        """把产物流式写入沙箱内的 path"""
+        with open(self.path(ref), "rb") as f:
+            sandbox.files.write(path, f)
+        with self._lock:
+            self.stats["gets"] += 1
+            self.stats["bytes_out"] += ref.size
+        return path
+
+    def open(self, ref):
+        """在协调器本地以只读二进制方式打开产物（确实需要查看内容时使用）"""
+        return open(self.path(ref), "rb")
+
+    def path(self, ref):
+        return os.path.join(self.root, ref.digest[:2], ref.digest)
+
+    def __contains__(self, ref):
+        return os.path.exists(self.path(ref))
+
+    def close(self):
+        if self._owns_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, chunks):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".partial")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            ref = ArtifactRef(digest.hexdigest(), size)
+            final_path = self.path(ref)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            with self._lock:
+                self.stats["puts"] += 1
+                self.stats["bytes_in"] += size
+                if os.path.exists(final_path):
+                    self.stats["dedup_hits"] += 1
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, final_path)
+            return ref
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+    import tracemalloc
+
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="跨沙箱产物传递基准测试（离线）")
+    parser.add_argument("--sizes", default="1,10,100", help="产物大小（MB），逗号分隔")
+    args = parser.parse_args()
+
+    # 上一阶段：生成指定大小的 JSON 产物
+    producer = """
+import json, os, sys
+size = int(sys.argv[1])
+os.makedirs('/home/user/artifacts', exist_ok=True)
+with open('/home/user/artifacts/out.json', 'w') as f:
+    json.dump({'sensor_id': 'SENSOR_001', 'blob': 'x' * size}, f)
+"""
+    # 下一阶段：从 AGENT_INPUT 读取产物
+    consumer = """
+import json, os
+with open(os.environ['AGENT_INPUT']) as f:
+    data = json.load(f)
+print(len(data['blob']))
+"""
+
+    def legacy(src, dst):
+        # 原来的做法：解析 → 拼接进脚本源码 → 上传
+        data = json.loads(src.files.read("/home/user/artifacts/out.json"))
+        script = f"import json\ninput_data = {json.dumps(data)}\nprint(len(input_data['blob']))\n"
+        dst.files.write("/tmp/stage.py", script)
+        return dst.commands.run("python3 /tmp/stage.py")
+
+    def via_store(src, dst, store):
+        ref = store.put_from(src, "/home/user/artifacts/out.json")
+        path = store.get_into(dst, ref, "/home/user/artifacts/in.json")
+        return dst.commands.run("python3 /tmp/consumer.py", envs={"AGENT_INPUT": path})
+
+    def via_relay(src, dst):
+        relay(src, "/home/user/artifacts/out.json", dst, "/home/user/artifacts/in.json")
+        return dst.commands.run("python3 /tmp/consumer.py",
+                                envs={"AGENT_INPUT": "/home/user/artifacts/in.json"})
+
+    def measure(fn, *fn_args):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert result.exit_code == 0, result.stderr
+        return elapsed, peak
+
+    print("=" * 60)
+    print("跨沙箱传递：耗时 / 协调器内存峰值（tracemalloc）")
+    print("=" * 60)
+
+    src, dst = LocalSandbox.create(), LocalSandbox.create()
+    try:
+        src.files.write("/tmp/producer.py", producer)
+        dst.files.write("/tmp/consumer.py", consumer)
+        with ArtifactStore() as store:
+            for size_mb in (int(s) for s in args.sizes.split(",")):
+                src.commands.run(f"python3 /tmp/producer.py {size_mb << 20}", timeout=0)
+                print(f"\n   {size_mb} MB:")
+                for label, fn, fn_args in (("解析 + 拼接源码", legacy, (src, dst)),
+                                           ("ArtifactStore", via_store, (src, dst, store)),
+                                           ("relay", via_relay, (src, dst))):
+                    elapsed, peak = measure(fn, *fn_args)
+                    print(f"   {label:<16} {elapsed:7.2f}s   内存峰值 {peak / (1 << 20):8.1f} MB")
+    finally:
+        src.kill()
+        dst.kill()
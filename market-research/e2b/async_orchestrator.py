@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+异步 Agent 协调器（AsyncAgentOrchestrator）
+
+与 orchestrator_pattern.py 中的 AgentOrchestrator 接口形状一致
+（create_sandbox / run_agent / execute_workflow / cleanup），
+但所有沙箱调用都是 await 的，因此一个事件循环可以同时驱动成百上千个独立工作流。
+
+ppio/browser-use/demo.py 也基于 asyncio，两条路径共用同一种并发模型。
+
+直接运行本文件会用 AsyncLocalSandbox 离线并发执行多个工作流。
+"""
+
+import asyncio
+import json
+import time
+
+from codec import DEFAULT_CODEC
+from fan_out import acommand_result
+from orchestrator_pattern import AGENT_WORKFLOW, INITIAL_INPUT
+
+
+async def _default_factory():
+    from e2b import AsyncSandbox
+    return await AsyncSandbox.create()
+
+
+class AsyncAgentOrchestrator:
+    """
+    异步外部协调器 - 每个实例负责一个工作流（一个沙箱）
+
+    factory: 返回沙箱的协程函数，默认 e2b.AsyncSandbox.create
+    verbose: 是否打印执行日志（并发跑大量工作流时建议关闭）
+    codec:   输入输出的序列化方式（codec.JsonCodec / OrjsonCodec），默认紧凑 JSON
+    """
+
+    def __init__(self, factory=None, verbose=True, codec=None):
+        self.factory = factory or _default_factory
+        self.codec = codec or DEFAULT_CODEC
+        self.verbose = verbose
+        self.sandbox = None
+        self.execution_log = []
+        self.last_run = None
+
+    def log(self, message):
+        """记录执行流程"""
+        self.execution_log.append(message)
+        if self.verbose:
+            print(f"   📝 {message}")
+
+    async def create_sandbox(self):
+        """创建沙箱"""
+        self.sandbox = await self.factory()
+        self.log(f"创建沙箱: {self.sandbox.sandbox_id[:12]}...")
+
+    async def run_agent(self, agent_name, script_path, input_data=None):
+        """
+        运行单个 agent（与同步版本相同的数据流：注入输入 → 执行 → 提取输出）
+
+        等待沙箱 I/O 期间事件循环可以调度其他工作流。
+        """
+        self.log(f"运行 {agent_name}")
+
+        # 📍 步骤 1: 协调器注入输入数据
+        if input_data:
+            payload = self.codec.encode(input_data)
+            await self.sandbox.files.write("/home/user/input.json", payload)
+            self.log(f"  → 协调器注入输入: {len(payload)} bytes")
+
+        # 📍 步骤 2: 执行 agent
+        result = await acommand_result(self.sandbox.commands.run, f"python3 {script_path}")
+
+        if result.exit_code != 0:
+            self.log(f"  ✗ Agent 执行失败: {result.stderr}")
+            return None
+
+        # 📍 步骤 3: 协调器提取输出
+        try:
+            output = self.codec.decode(result.stdout)
+            self.log(f"  ← 协调器提取输出: {len(result.stdout)} bytes")
+            return output
+        except ValueError:
+            self.log(f"  ✗ 无法解析输出: {result.stdout[:100]}")
+            return None
+
+    async def execute_workflow(self, initial_input=None, workflow=None):
+        """
+        执行 DAG 工作流（默认 Agent A → Agent B → Agent C）
+
+        就绪的步骤并发执行；返回最后一个步骤的输出，任一步骤失败时返回 None。
+        完整的执行记录（每步耗时、关键路径）保存在 self.last_run。
+        """
+        workflow = workflow or AGENT_WORKFLOW
+        run = await workflow.run(self.sandbox, initial_input or INITIAL_INPUT)
+        self.last_run = run
+
+        for step in run.steps.values():
+            if step.status == "done":
+                self.log(f"{step.name}: {step.duration:.2f}s")
+            else:
+                self.log(f"{step.name}: {step.status} {step.error or ''}")
+
+        if not run.ok:
+            self.log("❌ 工作流失败")
+            return None
+
+        self.log(f"✅ 工作流完成，关键路径: {' → '.join(run.critical_path)}")
+        return run.outputs[workflow.topological_order()[-1]]
+
+    async def cleanup(self):
+        """清理资源"""
+        if self.sandbox:
+            await self.sandbox.kill()
+            self.sandbox = None
+            self.log("清理沙箱")
+
+    async def __aenter__(self):
+        await self.create_sandbox()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cleanup()
+
+
+async def run_workflows(count, factory=None, max_concurrency=None, initial_input=None):
+    """
+    在同一个事件循环里并发执行 count 个独立工作流
+
+    max_concurrency 限制同时存活的沙箱数量（None 表示不限制）。
+    返回每个工作流的结果列表（失败的为 None）。
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def one():
+        async with AsyncAgentOrchestrator(factory=factory, verbose=False) as orchestrator:
+            return await orchestrator.execute_workflow(initial_input)
+
+    async def guarded():
+        if semaphore is None:
+            return await one()
+        async with semaphore:
+            return await one()
+
+    return await asyncio.gather(*(guarded() for _ in range(count)))
+
+
+if __name__ == "__main__":
+    import argparse
+    from local_sandbox import AsyncLocalSandbox
+
+    parser = argparse.ArgumentParser(description="异步协调器离线演示（AsyncLocalSandbox）")
+    parser.add_argument("--workflows", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--create-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    async def factory():
+        return await AsyncLocalSandbox.create(create_delay=args.create_delay)
+
+    async def main():
+        print("=" * 60)
+        print("单个工作流（异步）")
+        print("=" * 60)
+        async with AsyncAgentOrchestrator(factory=factory) as orchestrator:
+            result = await orchestrator.execute_workflow()
+        print(f"\n最终结果:\n{json.dumps(result, indent=2, ensure_ascii=False)}")
+
+        print("\n" + "=" * 60)
+        print(f"并发工作流: {args.workflows} 个, 最多同时 {args.concurrency} 个沙箱")
+        print("=" * 60)
+        start = time.perf_counter()
+        results = await run_workflows(args.workflows, factory=factory,
+                                      max_concurrency=args.concurrency)
+        elapsed = time.perf_counter() - start
+        ok = sum(r is not None for r in results)
+        print(f"✅ 完成 {ok}/{len(results)} 个工作流, 耗时 {elapsed:.2f}s "
+              f"({len(results) / elapsed:.1f} workflows/s)")
+
+    asyncio.run(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+沙箱生命周期与 Agent 步骤延迟基准测试套件
+
+multi_sandbox_agents.py 里 "创建沙箱约2秒" 只是一句提示，仓库里没有任何地方真正测量过。
+本套件在可插拔的后端上运行仓库中的现有场景：
+- pipeline：     单沙箱流水线（AgentOrchestrator，Agent A → B → C）
+- cross_sandbox：跨沙箱流水线（每个阶段独立沙箱，ArtifactStore 传递产物）
+- fan_out：      并行扇出（fan_out，每个任务一个沙箱）
+- master_worker：Master-Worker 调度（常驻 Worker 沙箱）
+- shared_state： 同一沙箱内多个 worker 进程通过 SQLite 任务队列领取任务
+
+对每个场景、每个并发度报告：
+- create / exec / write / read / kill 各操作的延迟分布（p50 / p90 / p99 / max）
+- 吞吐（完成的工作单元数 / 秒）
+- 协调器进程的内存峰值（后台线程采样 RSS）
+
+后端：
+- local：LocalSandbox（可用 --create-delay / --latency 模拟远端开销，离线运行）
+- e2b：  e2b.Sandbox（需要 E2B_API_KEY）
+- module:callable：任意返回沙箱对象的工厂函数
+
+结果保存为 JSON（--output），--compare 与之前的结果对比，标出退化超过阈值的指标：
+    python3 benchmark_suite.py --output baseline.json
+    python3 benchmark_suite.py --compare baseline.json
+"""
+
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fan_out import command_result
+from sandbox_pool import _percentile
+
+SCENARIOS = ("pipeline", "cross_sandbox", "fan_out", "master_worker", "shared_state")
+
+
+# ============================================
+# 延迟记录与插桩
+# ============================================
+
+class LatencyRecorder:
+    """按操作名记录延迟（毫秒），线程安全"""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, elapsed_ms):
+        with self._lock:
+            self._samples.setdefault(op, []).append(elapsed_ms)
+
+    @contextlib.contextmanager
+    def timed(self, op):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(op, (time.perf_counter() - start) * 1000)
+
+    def summary(self):
+        with self._lock:
+            samples = {op: list(values) for op, values in self._samples.items()}
+        return {op: {
+            "count": len(values),
+            "p50": _percentile(values, 50),
+            "p90": _percentile(values, 90),
+            "p99": _percentile(values, 99),
+            "mean": sum(values) / len(values),
+            "max": max(values),
+        } for op, values in sorted(samples.items())}
+
+
+class _Timed:
+    """把对象上指定的方法包装为计时调用，其他属性原样转发"""
+
+    def __init__(self, target, recorder, ops):
+        self._target = target
+        self._recorder = recorder
+        self._ops = ops
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        op = self._ops.get(name)
+        if op is None or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            label = op + "_bg" if kwargs.get("background") else op
+            with self._recorder.timed(label):
+                return attr(*args, **kwargs)
+        return timed
+
+
+class InstrumentedSandbox:
+    """
+    记录每个请求延迟的沙箱代理
+
+    files.write / write_files → write，files.read → read，
+    commands.run → exec（后台命令记为 exec_bg，只计启动耗时），kill → kill
+    """
+
+    def __init__(self, sandbox, recorder):
+        self._sandbox = sandbox
+        self._recorder = recorder
+        self.files = _Timed(sandbox.files, recorder,
+                            {"write": "write", "write_files": "write", "read": "read"})
+        self.commands = _Timed(sandbox.commands, recorder, {"run": "exec"})
+
+    def __getattr__(self, name):
+        return getattr(self._sandbox, name)
+
+    def kill(self):
+        with self._recorder.timed("kill"):
+            return self._sandbox.kill()
+
+
+def instrumented_factory(factory, recorder):
+    """包装工厂函数：记录 create 延迟，返回插桩后的沙箱"""
+    def create():
+        with recorder.timed("create"):
+            sandbox = factory()
+        return InstrumentedSandbox(sandbox, recorder)
+    return create
+
+
+def make_backend(name, create_delay=0.0, latency=0.0):
+    """按名称返回沙箱工厂：local / e2b / module:callable"""
+    if name == "local":
+        from local_sandbox import LocalSandbox
+        return lambda: LocalSandbox.create(create_delay=create_delay, latency=latency)
+    if name == "e2b":
+        from e2b import Sandbox
+        return Sandbox.create
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"unknown backend {name!r}, expected local / e2b / module:callable")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class PeakRSS:
+    """后台线程定期采样当前进程的 RSS，记录区间内的峰值（MB）"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current_mb():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+        except OSError:
+            # 没有 /proc 时退化为进程生命周期内的峰值
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss / (1 << 20) if sys.platform == "darwin" else maxrss / 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = self.current_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+
+
+# ============================================
+# 场景（返回完成的工作单元数）
+# ============================================
+
+class _FactoryPool:
+    """让 AgentOrchestrator 通过 pool 参数使用任意工厂：lease 即创建，release 即销毁"""
+
+    def __init__(self, factory):
+        self.lease = factory
+
+    @staticmethod
+    def release(sandbox, discard=False):
+        sandbox.kill()
+
+
+def scenario_pipeline(factory, concurrency, size):
+    """size 条单沙箱 A → B → C 工作流，最多 concurrency 条同时运行"""
+    from orchestrator_pattern import AgentOrchestrator
+
+    def workflow(_):
+        orchestrator = AgentOrchestrator(pool=_FactoryPool(factory))
+        try:
+            orchestrator.create_sandbox()
+            return orchestrator.execute_workflow() is not None
+        finally:
+            orchestrator.cleanup()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(workflow, range(size)))
+
+
+_STAGES = [
+    ("/tmp/generate.py", """
+import json, os
+os.makedirs('/home/user/artifacts', exist_ok=True)
+with open('/home/user/artifacts/out.json', 'w') as f:
+    json.dump({'sensor_readings': list(range(20, 30))}, f)
+"""),
+    ("/tmp/process.py", """
+import json, os
+with open(os.environ['AGENT_INPUT']) as f:
+    readings = json.load(f)['sensor_readings']
+os.makedirs('/home/user/artifacts', exist_ok=True)
+with open('/home/user/artifacts/out.json', 'w') as f:
+    json.dump({'avg': sum(readings) / len(readings), 'count': len(readings)}, f)
+"""),
+    ("/tmp/report.py", """
+import json, os
+with open(os.environ['AGENT_INPUT']) as f:
+    stats = json.load(f)
+print(f"avg={stats['avg']:.2f} count={stats['count']}")
+"""),
+]
+
+
+def scenario_cross_sandbox(factory, concurrency, size):
+    """size 条三阶段流水线，每个阶段一个新沙箱，产物经 ArtifactStore 传递"""
+    from artifacts import ArtifactStore
+
+    def pipeline(store):
+        ref = None
+        for script_path, script in _STAGES:
+            sandbox = factory()
+            try:
+                sandbox.files.write(script_path, script)
+                envs = None
+                if ref is not None:
+                    envs = {"AGENT_INPUT": store.get_into(sandbox, ref, "/home/user/input.json")}
+                result = command_result(sandbox.commands.run, f"python3 {script_path}", envs=envs)
+                if result.exit_code != 0:
+                    return False
+                if script_path != _STAGES[-1][0]:
+                    ref = store.put_from(sandbox, "/home/user/artifacts/out.json")
+            finally:
+                sandbox.kill()
+        return True
+
+    with ArtifactStore() as store, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(lambda _: pipeline(store), range(size)))
+
+
+def scenario_fan_out(factory, concurrency, size):
+    """size 个独立任务扇出到各自的沙箱"""
+    from fan_out import TaskSpec, fan_out
+
+    tasks = [TaskSpec(script=f"import json\nprint(json.dumps({{'task': {i}, 'sum': sum(range({i * 100}))}}))",
+                      name=f"task-{i}") for i in range(size)]
+    return sum(r.ok for r in fan_out(tasks, factory=factory, max_concurrency=concurrency))
+
+
+def scenario_master_worker(factory, concurrency, size):
+    """size 个任务交给最多 concurrency 个常驻 Worker 沙箱"""
+    from master_worker import MasterWorker
+
+    worker_script = """
+import json, os
+if 'input_data' not in globals():
+    with open(os.environ['AGENT_INPUT']) as f:
+        input_data = json.load(f)
+print(json.dumps({'task_id': input_data['task_id'], 'sum': sum(range(input_data['n']))}))
+"""
+    with MasterWorker(worker_script, factory=factory, max_workers=concurrency,
+                      queue_size=max(size, 1)) as workers:
+        results = workers.map({"task_id": i, "n": i * 100} for i in range(size))
+    return sum(r.ok for r in results)
+
+
+def scenario_shared_state(factory, concurrency, size):
+    """一个沙箱内 concurrency 个 worker 进程通过 SQLite 任务队列领取 size 个任务"""
+    from shared_state import DEFAULT_DB, LIB_DIR, install
+
+    init = f"""
+import sys
+sys.path.insert(0, {LIB_DIR!r})
+from shared_state import TaskQueue
+TaskQueue({DEFAULT_DB!r}).put_many(f'task{{i}}' for i in range({size}))
+"""
+    worker = f"""
+import sys
+sys.path.insert(0, {LIB_DIR!r})
+from shared_state import TaskQueue
+queue = TaskQueue({DEFAULT_DB!r})
+claimed = 0
+while (task := queue.claim(sys.argv[1])) is not None:
+    queue.complete(task.id, task.payload)
+    claimed += 1
+print(claimed)
+"""
+    sandbox = factory()
+    try:
+        install(sandbox)
+        sandbox.files.write("/tmp/init.py", init)
+        sandbox.files.write("/tmp/worker.py", worker)
+        sandbox.commands.run("python3 /tmp/init.py")
+        handles = [sandbox.commands.run(f"python3 /tmp/worker.py agent_{i}", background=True)
+                   for i in range(concurrency)]
+        results = [command_result(handle.wait) for handle in handles]
+        return sum(int(r.stdout) for r in results if r.exit_code == 0)
+    finally:
+        sandbox.kill()
+
+
+_SCENARIO_FUNCS = {
+    "pipeline": scenario_pipeline,
+    "cross_sandbox": scenario_cross_sandbox,
+    "fan_out": scenario_fan_out,
+    "master_worker": scenario_master_worker,
+    "shared_state": scenario_shared_state,
+}
+
+
+# ============================================
+# 运行与对比
+# ============================================
+
+def run_scenario(name, factory, concurrency, size, quiet=True):
+    """运行一个场景，返回包含延迟分布、吞吐和内存峰值的结果字典"""
+    recorder = LatencyRecorder()
+    sandbox_factory = instrumented_factory(factory, recorder)
+    output = io.StringIO() if quiet else sys.stdout
+    with PeakRSS() as rss, contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        completed = _SCENARIO_FUNCS[name](sandbox_factory, concurrency, size)
+        elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "size": size,
+        "completed": completed,
+        "elapsed": elapsed,
+        "throughput": completed / elapsed if elapsed else 0.0,
+        "peak_rss_mb": rss.peak_mb,
+        "ops": recorder.summary(),
+    }
+
+
+def run_suite(backend="local", scenarios=SCENARIOS, concurrency=(1, 4), sizes=None,
+              create_delay=0.0, latency=0.0):
+    """在指定后端上依次运行各场景 × 各并发度"""
+    factory = make_backend(backend, create_delay=create_delay, latency=latency)
+    sizes = sizes or {}
+    results = []
+    for name in scenarios:
+        for c in concurrency:
+            result = run_scenario(name, factory, c, sizes.get(name, 8))
+            print_result(result)
+            results.append(result)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "backend": backend,
+            "create_delay": create_delay,
+            "latency": latency,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def print_result(result):
+    print(f"\n▶ {result['scenario']} (并发 {result['concurrency']}): "
+          f"{result['completed']}/{result['size']} 完成, {result['elapsed']:.2f}s, "
+          f"{result['throughput']:.2f}/s, 内存峰值 {result['peak_rss_mb']:.1f} MB")
+    for op, s in result["ops"].items():
+        print(f"   {op:<8} n={s['count']:<5} p50={s['p50']:8.1f} ms  p90={s['p90']:8.1f} ms"
+              f"  p99={s['p99']:8.1f} ms  max={s['max']:8.1f} ms")
+
+
+def compare(current, baseline, threshold=0.10):
+    """对比两次结果，返回退化超过 threshold 的指标描述列表"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["scenario"], result["concurrency"])
+        before = previous.get(key)
+        if before is None:
+            continue
+        label = f"{key[0]}@{key[1]}"
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(f"{label} throughput {before['throughput']:.2f} → "
+                               f"{result['throughput']:.2f}/s")
+        for op, stats in result["ops"].items():
+            old = before["ops"].get(op)
+            if old and old["p50"] and stats["p50"] > old["p50"] * (1 + threshold):
+                regressions.append(f"{label} {op} p50 {old['p50']:.1f} → {stats['p50']:.1f} ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="沙箱生命周期与 Agent 步骤延迟基准测试")
+    parser.add_argument("--backend", default="local", help="local / e2b / module:callable")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4", help="并发度，逗号分隔")
+    parser.add_argument("--size", type=int, default=8, help="每个场景的工作单元数")
+    parser.add_argument("--create-delay", type=float, default=0.0,
+                        help="local 后端模拟的沙箱创建耗时（秒）")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="local 后端模拟的请求往返延迟（秒）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定退化的相对阈值")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print("=" * 60)
+    print(f"基准测试: backend={args.backend}, 并发 {args.concurrency}, size={args.size}")
+    print("=" * 60)
+
+    report = run_suite(
+        backend=args.backend,
+        scenarios=scenarios,
+        concurrency=[int(c) for c in args.concurrency.split(",")],
+        sizes={name: args.size for name in scenarios},
+        create_delay=args.create_delay,
+        latency=args.latency,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\n📊 对比 {args.compare}（{baseline['meta']['timestamp']}）:")
+        if regressions:
+            for line in regressions:
+                print(f"   ⚠️  {line}")
+            sys.exit(1)
+        print(f"   ✅ 没有超过 {args.threshold:.0%} 的退化")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+批量文件传输（Bulk Files）
+
+示例代码里每个文件都单独调用一次 sandbox.files.write：_create_agents 的三个 agent 脚本、
+agents_collaboration.py 中的阶段脚本和 JSON 状态文件……每次调用都要经过一次云端隧道网关的往返。
+文件数一多，总耗时 ≈ 文件数 × RTT，而真正的数据量往往只有几 KB。
+
+本模块把多个文件合并成一次请求：
+- write_many(sandbox, {路径: 内容})
+    * "write_files"：使用 SDK 的批量写入接口（e2b files.write_files）
+    * "tar"：打包为一个 tar.gz 上传，再用一条 tar 命令解包（SDK 不支持批量写入时使用）
+    * "auto"（默认）：有 write_files 就用，否则退回 tar
+- read_many(sandbox, 路径列表)
+    * 一条 `tar -czf - ... | base64` 命令把所有文件打包成 stdout 一次取回
+    * 不存在的文件不会出现在返回结果中
+- 两者都有 asyncio 版本（async_write_many / async_read_many），同时兼容同步和异步 SDK
+
+直接运行本文件会在模拟的高延迟链路上对比逐个调用与批量调用的耗时。
+"""
+
+import base64
+import io
+import posixpath
+import shlex
+import tarfile
+import uuid
+
+from fan_out import acall, acommand_result, command_result
+
+MODES = ("auto", "write_files", "tar")
+
+
+def _as_bytes(data):
+    return data.encode() if isinstance(data, str) else bytes(data)
+
+
+def _choose_mode(sandbox, mode):
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+    if mode == "auto":
+        return "write_files" if hasattr(sandbox.files, "write_files") else "tar"
+    return mode
+
+
+def _pack(files):
+    """
+    把 {绝对路径: 内容} 打包成 tar.gz，返回 (解包目录, 压缩包字节)
+
+    成员名相对于所有文件的公共父目录，解包时用 -C 指定该目录。
+    """
+    base = posixpath.commonpath([posixpath.dirname(path) for path in files])
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for path, data in files.items():
+            data = _as_bytes(data)
+            info = tarfile.TarInfo(posixpath.relpath(path, base))
+            info.size = len(data)
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(data))
+    return base, buffer.getvalue()
+
+
+def _unpack_command(base, archive_path):
+    base, archive_path = shlex.quote(base), shlex.quote(archive_path)
+    return f"mkdir -p {base} && tar -xzf {archive_path} -C {base} && rm -f {archive_path}"
+
+
+def _read_command(paths):
+    # --ignore-failed-read：缺失的文件只告警，其余文件照常打包
+    quoted = " ".join(shlex.quote(path) for path in paths)
+    return f"tar -czf - --ignore-failed-read {quoted} 2>/dev/null | base64 -w0"
+
+
+def _unpack_read(paths, encoded, format):
+    """
+    把 tar 输出映射回请求的路径
+
+    tar 会去掉开头的 "/"，沙箱实现也可能把路径映射到别的根目录下，
+    因此按成员名的后缀匹配请求的路径。
+    """
+    wanted = {path.lstrip("/"): path for path in paths}
+    contents = {}
+    if not encoded.strip():
+        return contents
+    with tarfile.open(fileobj=io.BytesIO(base64.b64decode(encoded)), mode="r:gz") as archive:
+        for member in archive.getmembers():
+            if not member.isfile():
+                continue
+            for suffix, path in wanted.items():
+                if member.name == suffix or member.name.endswith("/" + suffix):
+                    data = archive.extractfile(member).read()
+                    contents[path] = data if format == "bytes" else data.decode()
+                    break
+    return contents
+
+
+def write_many(sandbox, files, mode="auto"):
+    """
+    一次请求写入多个文件
+
+    files: {沙箱内绝对路径: str 或 bytes}
+    mode:  "auto" / "write_files" / "tar"
+    """
+    if not files:
+        return
+    mode = _choose_mode(sandbox, mode)
+    if mode == "write_files":
+        sandbox.files.write_files([{"path": path, "data": data} for path, data in files.items()])
+        return
+
+    base, archive = _pack(files)
+    archive_path = f"/tmp/.bulk-{uuid.uuid4().hex}.tar.gz"
+    sandbox.files.write(archive_path, archive)
+    result = command_result(sandbox.commands.run, _unpack_command(base, archive_path))
+    if result.exit_code != 0:
+        raise RuntimeError(f"bulk write failed: {result.stderr}")
+
+
+def read_many(sandbox, paths, format="text"):
+    """
+    一次请求读取多个文件，返回 {路径: 内容}（format 为 'text' 或 'bytes'）
+
+    不存在的文件不会出现在结果中。
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    result = command_result(sandbox.commands.run, _read_command(paths))
+    if result.exit_code != 0:
+        raise RuntimeError(f"bulk read failed: {result.stderr}")
+    return _unpack_read(paths, result.stdout, format)
+
+
+async def async_write_many(sandbox, files, mode="auto"):
+    """write_many 的 asyncio 版本（兼容 AsyncSandbox 和 Sandbox）"""
+    if not files:
+        return
+    mode = _choose_mode(sandbox, mode)
+    if mode == "write_files":
+        await acall(sandbox.files.write_files,
+                    [{"path": path, "data": data} for path, data in files.items()])
+        return
+
+    base, archive = _pack(files)
+    archive_path = f"/tmp/.bulk-{uuid.uuid4().hex}.tar.gz"
+    await acall(sandbox.files.write, archive_path, archive)
+    result = await acommand_result(sandbox.commands.run, _unpack_command(base, archive_path))
+    if result.exit_code != 0:
+        raise RuntimeError(f"bulk write failed: {result.stderr}")
+
+
+async def async_read_many(sandbox, paths, format="text"):
+    """read_many 的 asyncio 版本（兼容 AsyncSandbox 和 Sandbox）"""
+    paths = list(paths)
+    if not paths:
+        return {}
+    result = await acommand_result(sandbox.commands.run, _read_command(paths))
+    if result.exit_code != 0:
+        raise RuntimeError(f"bulk read failed: {result.stderr}")
+    return _unpack_read(paths, result.stdout, format)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="批量文件传输基准测试（离线，模拟高延迟链路）")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size", type=int, default=2048, help="每个文件的字节数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每次请求的模拟往返延迟（秒）")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    files = {f"/home/user/bulk/file_{i:03d}.txt": f"{i:03d}".ljust(args.size, "x")
+             for i in range(args.files)}
+
+    def per_file_write(sandbox):
+        for path, data in files.items():
+            sandbox.files.write(path, data)
+
+    def per_file_read(sandbox):
+        return {path: sandbox.files.read(path) for path in files}
+
+    cases = [
+        ("逐个 files.write", per_file_write),
+        ("write_many (write_files)", lambda sb: write_many(sb, files, mode="write_files")),
+        ("write_many (tar)", lambda sb: write_many(sb, files, mode="tar")),
+        ("逐个 files.read", per_file_read),
+        ("read_many (tar)", lambda sb: read_many(sb, files)),
+    ]
+
+    print("=" * 60)
+    print(f"{args.files} 个文件 × {args.size} bytes, 模拟 RTT {args.latency * 1000:.0f} ms")
+    print("=" * 60)
+
+    sandbox = LocalSandbox.create(latency=args.latency)
+    try:
+        write_many(sandbox, files)
+        for label, fn in cases:
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                result = fn(sandbox)
+                timings.append(time.perf_counter() - start)
+                if isinstance(result, dict):
+                    assert result == files, "读取内容与写入内容不一致"
+            best = min(timings)
+            print(f"   {label:<26} {best * 1000:8.1f} ms")
+    finally:
+        sandbox.kill()
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+有状态的代码执行会话（Code Session）
+
+ppio/agent-runtime/01-hello.py 每次 sbx.run_code(...)，e2b 示例每次 python3 -c / 脚本文件：
+每一步都是一个新的解释器，重新 import、重新加载数据，多步 agent 把大量时间花在重复的启动上。
+
+CodeSession 提供 Jupyter 内核式的会话，两种 SDK 都适用：
+- 多个命名上下文（context）：同一个沙箱里互相隔离的变量空间，变量在多次调用之间保留
+- 后端自动选择：
+  interpreter - 沙箱支持 create_code_context 时（e2b_code_interpreter / ppio_sandbox.code_interpreter），
+                每个上下文对应一个原生的代码上下文；取消时重启该上下文（变量丢失）
+  kernel      - 其他沙箱（e2b.Sandbox、LocalSandbox 等），每个上下文在沙箱内常驻一个 Python 进程，
+                通过 stdin / stdout 逐行收发 JSON；取消时发送 SIGINT，中断当前代码但保留变量
+- 每个单元（cell）返回 stdout / stderr、最后一个表达式的值、异常，以及执行耗时和往返耗时
+
+用法：
+    session = CodeSession(sandbox)
+    session.run("import pandas as pd\\ndf = pd.read_csv('/home/user/sales.csv')", context="analysis")
+    cell = session.run("df['amount'].sum()", context="analysis")
+    print(cell.text, cell.elapsed)
+    session.close()
+
+直接运行本文件会用 LocalSandbox 离线对比 "每步新解释器并重新加载数据" 与会话的单步延迟，
+并演示上下文隔离和取消。
+"""
+
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+
+KERNEL_PATH = "/home/user/.code_kernel.py"
+
+# 沙箱内常驻进程：一个变量空间，逐行读取代码并返回结果；只在执行代码时响应 SIGINT
+KERNEL_SCRIPT = r'''
+import ast
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+_out = sys.stdout
+_running = False
+namespace = {"__name__": "__main__"}
+
+
+def _interrupt(signum, frame):
+    if _running:
+        raise KeyboardInterrupt
+
+
+signal.signal(signal.SIGINT, _interrupt)
+
+
+def _reply(message):
+    _out.write(json.dumps(message, separators=(",", ":")) + "\n")
+    _out.flush()
+
+
+def _execute(code):
+    global _running
+    tree = ast.parse(code, "<cell>")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    _running = True
+    try:
+        exec(compile(tree, "<cell>", "exec"), namespace)
+        if last is not None:
+            value = eval(compile(last, "<cell>", "eval"), namespace)
+            return None if value is None else repr(value)
+    finally:
+        _running = False
+
+
+_reply({"ready": True, "pid": os.getpid()})
+
+count = 0
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    request = json.loads(line)
+    if request.get("op") == "exit":
+        break
+
+    count += 1
+    stdout, stderr = io.StringIO(), io.StringIO()
+    reply = {"id": request["id"], "execution_count": count, "text": None, "error": None}
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            reply["text"] = _execute(request["code"])
+    except BaseException as e:
+        reply["error"] = {"name": type(e).__name__, "value": str(e),
+                          "traceback": traceback.format_exc()}
+    reply["elapsed"] = time.perf_counter() - start
+    reply["stdout"] = stdout.getvalue()
+    reply["stderr"] = stderr.getvalue()
+    _reply(reply)
+'''
+
+
+class CodeSessionError(RuntimeError):
+    """会话无法执行代码（上下文启动失败、进程退出或后端不支持该操作）"""
+
+
+class CodeSessionTimeout(CodeSessionError):
+    """单元在超时时间内没有完成（已尝试取消）"""
+
+
+@dataclass
+class CellError:
+    name: str
+    value: str
+    traceback: str
+
+
+@dataclass
+class Cell:
+    """一次执行的结果"""
+    context: str
+    code: str
+    stdout: str = ""
+    stderr: str = ""
+    text: str = None            # 最后一个表达式的 repr
+    error: CellError = None
+    execution_count: int = None
+    elapsed: float = None       # 执行耗时（秒）；interpreter 后端无法单独测量，等于往返耗时
+    round_trip: float = None    # 协调器侧从发送到收到结果的耗时（秒）
+
+    @property
+    def cancelled(self):
+        return self.error is not None and self.error.name == "KeyboardInterrupt"
+
+
+class _KernelContext:
+    """
+    沙箱内常驻的 Python 进程（一个上下文）
+
+    e2b 只在 handle.wait() / 迭代句柄时送达后台命令的输出，由读取线程阻塞在 wait(on_stdout=...) 上接收结果
+    """
+
+    def __init__(self, sandbox, name, path, start_timeout):
+        self.sandbox = sandbox
+        self.name = name
+        self.pid = None
+        self._buffer = ""
+        self._stderr = []
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._exit_error = None
+        self._handle = sandbox.commands.run(
+            f"python3 -u {path}", background=True, stdin=True, timeout=0)
+        threading.Thread(target=self._read, args=(self._handle,),
+                         name=f"code-kernel-{name}", daemon=True).start()
+        if not self._ready.wait(start_timeout) or self._exit_error:
+            self.close()
+            raise CodeSessionError(
+                f"context {name!r} did not start: {''.join(self._stderr)[-500:]}")
+
+    def submit(self, code):
+        request_id = next(self._ids)
+        future = Future()
+        line = json.dumps({"id": request_id, "code": code}, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._handle is None:
+                raise CodeSessionError(f"context {self.name!r} is closed")
+            if self._exit_error:
+                raise CodeSessionError(self._exit_error)
+            self._pending[request_id] = future
+            self.sandbox.commands.send_stdin(self._handle.pid, line)
+        return future
+
+    def interrupt(self):
+        self.sandbox.commands.run(f"kill -INT {self.pid}")
+
+    def close(self):
+        with self._lock:
+            handle, self._handle = self._handle, None
+            pending, self._pending = self._pending, {}
+        if handle is not None:
+            try:
+                self.sandbox.commands.send_stdin(handle.pid, '{"op":"exit"}\n')
+            except Exception:
+                pass
+            try:
+                handle.kill()
+            except Exception:
+                pass
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(CodeSessionError(f"context {self.name!r} closed"))
+
+    def _read(self, handle):
+        """读取线程：把输出交给 _on_stdout，直到进程退出；之后所有等待中的单元失败"""
+        try:
+            handle.wait(on_stdout=self._on_stdout, on_stderr=self._stderr.append)
+            error = f"context {self.name!r} exited"
+        except Exception as e:
+            # CommandExitException：进程崩溃或被 kill
+            error = f"context {self.name!r} exited with {getattr(e, 'exit_code', e)}"
+        stderr = "".join(self._stderr).strip()
+        if stderr:
+            error += f": {stderr[-500:]}"
+        with self._lock:
+            self._exit_error = error
+            pending, self._pending = self._pending, {}
+        self._ready.set()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(CodeSessionError(error))
+
+    def _on_stdout(self, chunk):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                continue
+            if message.get("ready"):
+                self.pid = message["pid"]
+                self._ready.set()
+                continue
+            with self._lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+
+
+class _InterpreterContext:
+    """Code Interpreter SDK 的原生代码上下文"""
+
+    def __init__(self, sandbox, name, language):
+        self.sandbox = sandbox
+        self.name = name
+        self.language = language
+        self.context = sandbox.create_code_context(language=language)
+        self._executor = None
+
+    def submit(self, code, timeout):
+        # run_code 是阻塞调用：放到单独的线程里，cancel() 才能在执行期间介入
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.sandbox.run_code(code, context=self.context,
+                                                        timeout=timeout))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"code-session-{self.name}", daemon=True).start()
+        return future
+
+    def interrupt(self):
+        restart = getattr(self.sandbox, "restart_code_context", None)
+        if restart is None:
+            raise CodeSessionError("this SDK version cannot interrupt a code context")
+        restart(self.context)
+
+    def close(self):
+        remove = getattr(self.sandbox, "remove_code_context", None)
+        if remove is not None:
+            try:
+                remove(self.context)
+            except Exception:
+                pass
+
+
+class CodeSession:
+    """
+    有状态的代码执行会话
+
+    backend:        "auto" / "kernel" / "interpreter"；auto 在沙箱支持 create_code_context 时使用 interpreter
+    language:       interpreter 后端的语言（kernel 后端只支持 Python）
+    start_timeout:  kernel 后端启动一个上下文的超时（秒）
+    cancel_grace:   超时后发送中断，再等待多少秒（仍未结束时 kernel 上下文被重启，变量丢失）
+
+    同一个上下文内的单元串行执行；不同上下文可以在多个线程中并发执行。
+    """
+
+    def __init__(self, sandbox, backend="auto", language="python", path=KERNEL_PATH,
+                 start_timeout=10.0, cancel_grace=5.0):
+        if backend == "auto":
+            backend = "interpreter" if hasattr(sandbox, "create_code_context") else "kernel"
+        if backend not in ("kernel", "interpreter"):
+            raise ValueError(f"unknown backend {backend!r}, expected 'auto', 'kernel' or 'interpreter'")
+        self.sandbox = sandbox
+        self.backend = backend
+        self.language = language
+        self.path = path
+        self.start_timeout = start_timeout
+        self.cancel_grace = cancel_grace
+        self.history = []
+        self._contexts = {}
+        self._busy = {}             # 上下文 → 正在执行的 future
+        self._uploaded = False
+        self._lock = threading.Lock()
+        self._context_locks = {}
+
+    def run(self, code, context="default", timeout=60):
+        """在指定上下文中执行代码，返回 Cell；代码抛出的异常放在 Cell.error 中，不会抛出"""
+        with self._context_lock(context):
+            ctx = self.context(context)
+            start = time.perf_counter()
+            if self.backend == "interpreter":
+                future = ctx.submit(code, timeout)
+            else:
+                future = ctx.submit(code)
+            with self._lock:
+                self._busy[context] = future
+            try:
+                response = self._wait(ctx, future, timeout)
+            finally:
+                with self._lock:
+                    self._busy.pop(context, None)
+            cell = self._cell(context, code, response)
+            cell.round_trip = time.perf_counter() - start
+            if cell.elapsed is None:
+                cell.elapsed = cell.round_trip
+        self.history.append(cell)
+        return cell
+
+    def cancel(self, context="default"):
+        """
+        取消上下文中正在执行的单元；没有正在执行的单元时返回 False
+
+        kernel 后端中断当前代码（Cell.cancelled 为 True），变量保留；
+        interpreter 后端重启该上下文，变量丢失。
+        """
+        with self._lock:
+            future = self._busy.get(context)
+            ctx = self._contexts.get(context)
+        if future is None or ctx is None or future.done():
+            return False
+        ctx.interrupt()
+        return True
+
+    def context(self, name="default"):
+        """返回（必要时创建）命名上下文"""
+        with self._lock:
+            ctx = self._contexts.get(name)
+        if ctx is not None:
+            return ctx
+        if self.backend == "interpreter":
+            ctx = _InterpreterContext(self.sandbox, name, self.language)
+        else:
+            self._upload()
+            ctx = _KernelContext(self.sandbox, name, self.path, self.start_timeout)
+        with self._lock:
+            existing = self._contexts.setdefault(name, ctx)
+        if existing is not ctx:
+            ctx.close()
+        return existing
+
+    def contexts(self):
+        with self._lock:
+            return sorted(self._contexts)
+
+    def close_context(self, name):
+        """关闭上下文并丢弃其中的变量"""
+        with self._lock:
+            ctx = self._contexts.pop(name, None)
+        if ctx is not None:
+            ctx.close()
+
+    def close(self):
+        for name in self.contexts():
+            self.close_context(name)
+
+    def timings(self, context=None):
+        """[(上下文, 执行次序, 执行耗时, 往返耗时)]"""
+        return [(c.context, c.execution_count, c.elapsed, c.round_trip)
+                for c in self.history if context is None or c.context == context]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _context_lock(self, name):
+        with self._lock:
+            return self._context_locks.setdefault(name, threading.Lock())
+
+    def _upload(self):
+        with self._lock:
+            if self._uploaded:
+                return
+            self._uploaded = True
+        self.sandbox.files.write(self.path, KERNEL_SCRIPT)
+
+    def _wait(self, ctx, future, timeout):
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            pass
+        except Exception as e:
+            if "timeout" in type(e).__name__.lower():
+                raise CodeSessionTimeout(f"cell timed out after {timeout}s in {ctx.name!r}") from e
+            raise
+
+        # 超时：先中断，宽限期内仍未结束时重启上下文
+        try:
+            ctx.interrupt()
+            future.result(self.cancel_grace)
+            detail = "interrupted, variables kept"
+        except Exception:
+            self.close_context(ctx.name)
+            detail = "context restarted, variables lost"
+        raise CodeSessionTimeout(f"cell timed out after {timeout}s in {ctx.name!r} ({detail})")
+
+    def _cell(self, context, code, response):
+        if self.backend == "interpreter":
+            error = response.error
+            return Cell(
+                context=context, code=code,
+                stdout="".join(response.logs.stdout), stderr="".join(response.logs.stderr),
+                text=response.text,
+                error=CellError(error.name, error.value, error.traceback) if error else None,
+                execution_count=response.execution_count,
+            )
+        error = response["error"]
+        return Cell(
+            context=context, code=code, stdout=response["stdout"], stderr=response["stderr"],
+            text=response["text"], error=CellError(**error) if error else None,
+            execution_count=response["execution_count"], elapsed=response["elapsed"],
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from local_sandbox import LocalSandbox
+    from sandbox_pool import _percentile
+
+    parser = argparse.ArgumentParser(description="有状态代码会话演示（离线）")
+    parser.add_argument("--steps", type=int, default=10, help="agent 分析步骤数")
+    parser.add_argument("--rows", type=int, default=200_000, help="模拟数据集的行数")
+    parser.add_argument("--latency", type=float, default=0.01, help="模拟的请求往返延迟（秒）")
+    args = parser.parse_args()
+
+    # 第一步：加载数据（import + 构造数据集），之后每一步在数据上做一次分析
+    load = (f"import json, random, statistics\n"
+            f"random.seed(1)\n"
+            f"rows = [{{'region': random.choice('NSEW'), 'amount': random.random() * 100}}"
+            f" for _ in range({args.rows})]")
+    step = ("region = 'NSEW'[{i} % 4]\n"
+            "amounts = [r['amount'] for r in rows if r['region'] == region]\n"
+            "round(statistics.mean(amounts), 3)")
+
+    sandbox = LocalSandbox.create(latency=args.latency)
+    try:
+        print("=" * 60)
+        print(f"{args.steps} 个分析步骤，数据集 {args.rows} 行")
+        print("=" * 60)
+
+        fresh = []
+        for i in range(args.steps):
+            start = time.perf_counter()
+            execution = sandbox.run_code(load + "\n" + step.format(i=i))
+            fresh.append((time.perf_counter() - start) * 1000)
+        print(f"   {'每步新解释器 + 重新加载':<22} p50={_percentile(fresh, 50):8.1f} ms"
+              f"   p99={_percentile(fresh, 99):8.1f} ms   结果 {execution.text}")
+
+        with CodeSession(sandbox) as session:
+            first = session.run(load, context="analysis")
+            steps = [session.run(step.format(i=i), context="analysis") for i in range(args.steps)]
+            latencies = [c.round_trip * 1000 for c in steps]
+            print(f"   {'会话（首次加载 ' + f'{first.round_trip * 1000:.0f} ms）':<22}"
+                  f" p50={_percentile(latencies, 50):8.1f} ms   p99={_percentile(latencies, 99):8.1f} ms"
+                  f"   结果 {steps[-1].text}")
+            print(f"   {'':<22} 单元执行耗时 p50={_percentile([c.elapsed * 1000 for c in steps], 50):.2f} ms"
+                  f"（其余为往返开销）")
+
+            print("\n🔒 上下文隔离:")
+            session.run("secret = 42", context="other")
+            print(f"   other.secret = {session.run('secret', context='other').text}，"
+                  f"analysis 中: {session.run('secret', context='analysis').error.name}")
+
+            print("\n⏹️  取消:")
+            session.run("counter = 0", context="other")
+            timer = threading.Timer(0.3, session.cancel, args=("other",))
+            timer.start()
+            cell = session.run("while True:\n    counter += 1", context="other")
+            print(f"   cancelled={cell.cancelled}，耗时 {cell.round_trip * 1000:.0f} ms，"
+                  f"变量仍在: counter > 0 = {session.run('counter > 0', context='other').text}")
+            print(f"   上下文: {session.contexts()}")
+    finally:
+        sandbox.kill()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+协调器热路径上的 JSON 编解码（Codec）
+
+run_agent 原来每一步都要：
+- json.dumps(input_data, indent=2) 写入 input.json（没人看的缩进格式）
+- 再 json.dumps(input_data) 一次，只为了在日志里打印字节数
+- json.loads(result.stdout)，再单独 len(result.stdout)
+
+Codec 把序列化集中到一处，每个载荷只编码一次，得到的 bytes 同时用于写入和统计：
+- JsonCodec：标准库 json，默认紧凑编码（无空格、不转义非 ASCII），输出 UTF-8 bytes
+- OrjsonCodec：可选的 orjson（pip install orjson），C 实现，大载荷快数倍
+- get_codec("auto") 在安装了 orjson 时使用 orjson，否则退回 JsonCodec
+
+直接运行本文件会对 1 KB ~ 100 MB 的载荷对比
+"原来的做法（indent=2 + 再编码一次 + loads）" 与各个 codec 的耗时和编码大小。
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    """标准库 json；indent 为 None 时使用紧凑分隔符"""
+
+    name = "json"
+
+    def __init__(self, indent=None):
+        self.indent = indent
+        self._separators = None if indent else (",", ":")
+
+    def encode(self, obj):
+        """编码为 UTF-8 bytes"""
+        return json.dumps(obj, indent=self.indent, separators=self._separators,
+                          ensure_ascii=False).encode()
+
+    def decode(self, data):
+        """解码 str 或 bytes"""
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson（可选依赖）：直接输出 bytes，紧凑编码"""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed (pip install orjson)")
+
+    def encode(self, obj):
+        return orjson.dumps(obj)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+CODECS = {"json": JsonCodec, "orjson": OrjsonCodec}
+
+DEFAULT_CODEC = JsonCodec()
+
+
+def get_codec(name="auto"):
+    """按名称返回 codec；auto 优先使用已安装的 orjson"""
+    if name == "auto":
+        return OrjsonCodec() if orjson is not None else DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError(f"unknown codec {name!r}, expected one of {sorted(CODECS)} or 'auto'")
+    return CODECS[name]()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="JSON 编解码微基准（1 KB ~ 100 MB）")
+    parser.add_argument("--sizes", default="1K,64K,1M,10M,100M", help="载荷大小，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个大小重复次数（取最小值）")
+    args = parser.parse_args()
+
+    def parse_size(text):
+        units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+        return int(text[:-1]) * units[text[-1]] if text[-1] in units else int(text)
+
+    def make_payload(size):
+        # 与 agent 输入相似的结构：记录列表，含数字、浮点数和中文字符串
+        record = {"id": 0, "name": "销售记录", "values": [1.5, 2.25, 3.125, 100, 150, 200],
+                  "tags": ["sales", "2025-Q1"], "note": "x" * 64}
+        per_record = len(json.dumps(record, ensure_ascii=False).encode())
+        count = max(1, size // per_record)
+        return {"task": "分析销售数据",
+                "records": [dict(record, id=i) for i in range(count)]}
+
+    def legacy(payload):
+        # run_agent 原来的做法
+        data = json.dumps(payload, indent=2)
+        logged = len(json.dumps(payload))
+        stdout = data
+        json.loads(stdout)
+        return len(data.encode()), logged
+
+    def with_codec(codec):
+        def run(payload):
+            data = codec.encode(payload)
+            codec.decode(data)
+            return len(data), len(data)
+        return run
+
+    def best(fn, payload):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            size, _ = fn(payload)
+            times.append(time.perf_counter() - start)
+        return min(times), size
+
+    variants = [("indent=2 ×2 + loads", legacy), ("json 紧凑", with_codec(JsonCodec()))]
+    if orjson is not None:
+        variants.append(("orjson", with_codec(OrjsonCodec())))
+    else:
+        print("ℹ️  未安装 orjson，跳过（pip install orjson）")
+
+    print("=" * 60)
+    print("每步编解码耗时（编码 + 统计字节数 + 解码）")
+    print("=" * 60)
+    for text in args.sizes.split(","):
+        payload = make_payload(parse_size(text))
+        print(f"\n   {text}:")
+        baseline = None
+        for label, fn in variants:
+            elapsed, size = best(fn, payload)
+            baseline = baseline or elapsed
+            print(f"   {label:<20} {elapsed * 1000:10.2f} ms   编码大小 {size / (1 << 20):9.3f} MB"
+                  f"   {baseline / elapsed:5.1f}x")
+        del payload
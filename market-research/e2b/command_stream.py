@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+流式命令输出（Command Stream）
+
+run_agent 和各个场景都是等命令结束后再解析 result.stdout：
+大输出完整缓存在内存里，协调器也无法在命令运行期间处理已经产出的部分结果。
+
+CommandStream 以后台方式启动命令，再迭代 e2b CommandHandle 的输出：
+- chunks()：原始 stdout 片段
+- lines()：按行重组（超长行报错，避免无界缓存）
+- records()：NDJSON，每个非空行解析为一个 JSON 对象
+- 拉取式消费：只有调用方取下一条记录时才继续读取输出流，调用方处理得慢时，
+  沙箱内进程会在写 stdout 时阻塞（背压），协调器侧最多缓存一行
+- stderr 只保留末尾 stderr_tail 字节，用于报错
+
+同时支持 e2b.Sandbox 和 LocalSandbox（两者的 CommandHandle 都可迭代）。
+"""
+
+import json
+
+
+class CommandStreamError(RuntimeError):
+    """流式命令执行失败（非零退出码，或输出行超过上限）"""
+
+
+class CommandStream:
+    """
+    流式执行沙箱命令
+
+    用法：
+        with CommandStream(sandbox, "python3 /tmp/master.py") as stream:
+            for record in stream.records():
+                dispatch(record)
+        print(stream.exit_code)
+
+    迭代结束后自动等待命令退出；check=True 时非零退出码抛出 CommandStreamError。
+    提前离开 with 块会终止仍在运行的命令。
+    """
+
+    def __init__(self, sandbox, cmd, envs=None, cwd=None, timeout=60, check=True,
+                 max_line_bytes=1 << 20, stderr_tail=4096):
+        self.sandbox = sandbox
+        self.cmd = cmd
+        self.envs = envs
+        self.cwd = cwd
+        self.timeout = timeout
+        self.check = check
+        self.max_line_bytes = max_line_bytes
+        self.stderr_tail = stderr_tail
+        self.stderr = ""
+        self.exit_code = None
+        self.bytes_read = 0
+        self._handle = None
+
+    def start(self):
+        """以后台方式启动命令"""
+        if self._handle is None:
+            self._handle = self.sandbox.commands.run(
+                self.cmd, background=True, envs=self.envs, cwd=self.cwd, timeout=self.timeout)
+        return self
+
+    def chunks(self):
+        """逐个产出 stdout 片段；输出结束后等待命令退出"""
+        self.start()
+        for stdout, stderr, _ in self._handle:
+            if stderr:
+                self.stderr = (self.stderr + stderr)[-self.stderr_tail:]
+            if stdout:
+                self.bytes_read += len(stdout)
+                yield stdout
+        self._finish()
+
+    def lines(self):
+        """逐行产出 stdout（不含换行符）"""
+        buffer = ""
+        for chunk in self.chunks():
+            buffer += chunk
+            *lines, buffer = buffer.split("\n")
+            yield from lines
+            if len(buffer) > self.max_line_bytes:
+                self.close()
+                raise CommandStreamError(
+                    f"output line exceeds {self.max_line_bytes} bytes: {self.cmd}")
+        if buffer:
+            yield buffer
+
+    def records(self):
+        """把 stdout 当作 NDJSON，逐个产出解析后的对象（跳过空行）"""
+        for line in self.lines():
+            if line.strip():
+                yield json.loads(line)
+
+    def close(self):
+        """终止仍在运行的命令"""
+        if self._handle is not None and self.exit_code is None:
+            try:
+                self._handle.kill()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def _finish(self):
+        try:
+            result = self._handle.wait()
+        except Exception as e:
+            # e2b 的 wait() 在非零退出码时抛出 CommandExitException（带 exit_code / stderr）
+            if not hasattr(e, "exit_code"):
+                raise
+            result = e
+        self.exit_code = result.exit_code
+        if result.stderr:
+            # 结果中的 stderr 已包含迭代过程中见到的部分
+            self.stderr = result.stderr[-self.stderr_tail:]
+        if self.check and self.exit_code != 0:
+            raise CommandStreamError(
+                f"{self.cmd} exited with {self.exit_code}: {self.stderr.strip()[-500:]}")
+
+
+def stream_records(sandbox, cmd, **options):
+    """便捷函数：流式执行命令并逐个产出 NDJSON 记录"""
+    with CommandStream(sandbox, cmd, **options) as stream:
+        yield from stream.records()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="流式输出演示（离线）")
+    parser.add_argument("--records", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.3, help="每条记录的产出间隔（秒）")
+    args = parser.parse_args()
+
+    producer = f"""
+import json, time
+for i in range({args.records}):
+    time.sleep({args.interval})
+    print(json.dumps({{'seq': i, 'payload': 'x' * 16}}), flush=True)
+"""
+
+    sandbox = LocalSandbox.create()
+    try:
+        sandbox.files.write("/tmp/producer.py", producer)
+
+        print("=" * 60)
+        print(f"{args.records} 条 NDJSON 记录, 每 {args.interval}s 一条")
+        print("=" * 60)
+
+        start = time.perf_counter()
+        sandbox.commands.run("python3 /tmp/producer.py")
+        buffered = time.perf_counter() - start
+        print(f"   缓冲模式: 第一条记录在 {buffered:.2f}s 后可用（命令结束后）")
+
+        start = time.perf_counter()
+        first = None
+        with CommandStream(sandbox, "python3 -u /tmp/producer.py") as stream:
+            for record in stream.records():
+                if first is None:
+                    first = time.perf_counter() - start
+                print(f"   ← 记录 {record['seq']} @ {time.perf_counter() - start:.2f}s")
+        print(f"   流式模式: 第一条记录在 {first:.2f}s 后可用, 退出码 {stream.exit_code}")
+    finally:
+        sandbox.kill()
@@ -0,0 +1,2 @@
+# test_e2b.py 是连接真实 E2B 服务的脚本（没有 API Key 时直接退出），不作为 pytest 用例收集
+collect_ignore = ["test_e2b.py"]
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+DAG 工作流引擎
+
+用声明式的有向无环图描述 agent 步骤及其数据依赖，取代手写的
+Agent A → Agent B → Agent C 串行链和 `if not result_x: return` 检查：
+
+- 每个步骤通过 needs 声明它依赖哪些步骤的输出
+- 调度器同时运行所有就绪的步骤；某个步骤的输入一旦齐备就立即启动
+- 步骤失败时只跳过它的下游，其他独立分支继续执行
+- 运行结束后报告每个步骤的耗时和关键路径（critical path）
+
+步骤的输入由协调器写入 /home/user/dag/<name>.input.json，路径通过环境变量
+AGENT_INPUT 传给脚本；步骤把结果（JSON）打印到 stdout。
+同时支持 e2b.Sandbox 和 e2b.AsyncSandbox（以及对应的本地替身）。
+run(run_step=...) 可以替换单个步骤的执行方式（例如同步协调器的 run_agent，带缓存 / 重试 / 对冲），
+调度、失败跳过下游和关键路径的逻辑不变；run_sync(run_step) 在当前线程按拓扑序逐个执行，
+不需要事件循环，调用方已经运行在事件循环中时也可以使用。
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+
+from bulk_files import async_write_many
+from fan_out import acall, acommand_result
+
+DAG_DIR = "/home/user/dag"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class Step:
+    """
+    工作流中的一个步骤
+
+    needs:      依赖的步骤名；没有依赖的步骤接收工作流的初始输入，
+                只有一个依赖时直接接收该步骤的输出，多个依赖时接收 {步骤名: 输出}
+    path:       脚本在沙箱内的路径，默认 /home/user/dag/<name>.py
+    parse_json: 是否把 stdout 解析为 JSON
+    """
+    name: str
+    script: str
+    needs: tuple = ()
+    path: str = None
+    parse_json: bool = True
+    timeout: float = 60
+
+    @property
+    def script_path(self):
+        return self.path or f"{DAG_DIR}/{self.name}.py"
+
+    @property
+    def input_path(self):
+        return f"{DAG_DIR}/{self.name}.input.json"
+
+
+@dataclass
+class StepRun:
+    """步骤的执行记录（时间为相对工作流开始的秒数）"""
+    name: str
+    status: str = PENDING
+    output: object = None
+    error: str = None
+    start: float = None
+    end: float = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+@dataclass
+class DagRun:
+    """一次工作流执行的结果"""
+    steps: dict
+    wall_time: float
+    critical_path: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return all(run.status == DONE for run in self.steps.values())
+
+    @property
+    def outputs(self):
+        return {name: run.output for name, run in self.steps.items() if run.status == DONE}
+
+    @property
+    def critical_path_time(self):
+        return sum(self.steps[name].duration for name in self.critical_path)
+
+    def report(self):
+        """生成可打印的耗时报告"""
+        lines = [f"{'步骤':<16}{'状态':<10}{'开始':>8}{'耗时':>8}"]
+        for run in sorted(self.steps.values(), key=lambda r: (r.start is None, r.start)):
+            start = f"{run.start:.2f}s" if run.start is not None else "-"
+            lines.append(f"{run.name:<16}{run.status:<10}{start:>8}{run.duration:>7.2f}s")
+        serial = sum(run.duration for run in self.steps.values())
+        lines.append(f"总耗时 {self.wall_time:.2f}s（串行执行需要 {serial:.2f}s）")
+        lines.append(f"关键路径: {' → '.join(self.critical_path)} "
+                     f"({self.critical_path_time:.2f}s)")
+        return "\n".join(lines)
+
+
+class DagWorkflow:
+    """
+    声明式 DAG 工作流
+
+    用法：
+        workflow = DagWorkflow()
+        workflow.add_step("text", TEXT_AGENT)
+        workflow.add_step("numbers", NUMBER_AGENT)
+        workflow.add_step("coordinator", COORDINATOR, needs=["text", "numbers"])
+
+        run = await workflow.run(sandbox, initial_input)
+        print(run.report())
+    """
+
+    def __init__(self, steps=()):
+        self.steps = {}
+        for step in steps:
+            self._add(step)
+
+    def add_step(self, name, script, needs=(), **options):
+        """添加步骤，返回 self 以便链式调用"""
+        self._add(Step(name=name, script=script, needs=tuple(needs), **options))
+        return self
+
+    @classmethod
+    def chain(cls, named_scripts, **options):
+        """把 [(name, script), ...] 组装成一条串行链"""
+        workflow = cls()
+        previous = ()
+        for name, script in named_scripts:
+            workflow.add_step(name, script, needs=previous, **options)
+            previous = (name,)
+        return workflow
+
+    def _add(self, step):
+        if step.name in self.steps:
+            raise ValueError(f"duplicate step: {step.name}")
+        self.steps[step.name] = step
+
+    def topological_order(self):
+        """校验依赖（未知步骤、环）并返回拓扑序"""
+        for step in self.steps.values():
+            for dep in step.needs:
+                if dep not in self.steps:
+                    raise ValueError(f"step {step.name!r} needs unknown step {dep!r}")
+
+        order = []
+        state = {}
+
+        def visit(name, trail):
+            if state.get(name) == DONE:
+                return
+            if state.get(name) == RUNNING:
+                raise ValueError(f"cycle detected: {' → '.join(trail + [name])}")
+            state[name] = RUNNING
+            for dep in self.steps[name].needs:
+                visit(dep, trail + [name])
+            state[name] = DONE
+            order.append(name)
+
+        for name in self.steps:
+            visit(name, [])
+        return order
+
+    async def run(self, sandbox, initial_input=None, max_concurrency=None, run_step=None):
+        """
+        在 sandbox 中执行工作流，返回 DagRun
+
+        run_step(step, payload) 替换默认的步骤执行方式（写入输入 → 执行脚本 → 解析 stdout），
+        可以是协程函数或同步函数（在线程池中执行），返回步骤输出，失败时抛出异常；
+        此时脚本由调用方负责上传，sandbox 可以为 None。
+        """
+        self.topological_order()
+
+        dependents = {name: [] for name in self.steps}
+        waiting = {}
+        for step in self.steps.values():
+            waiting[step.name] = set(step.needs)
+            for dep in step.needs:
+                dependents[dep].append(step.name)
+
+        runs = {name: StepRun(name) for name in self.steps}
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        t0 = time.perf_counter()
+
+        if run_step is None:
+            # 所有脚本合并为一次批量上传
+            await async_write_many(sandbox, {step.script_path: step.script
+                                             for step in self.steps.values()})
+
+        tasks = {}
+
+        def launch(name):
+            runs[name].status = RUNNING
+            task = asyncio.ensure_future(self._run_step(
+                sandbox, self.steps[name], runs, initial_input, semaphore, t0, run_step))
+            tasks[task] = name
+
+        def skip(name):
+            if runs[name].status != PENDING:
+                return
+            runs[name].status = SKIPPED
+            for child in dependents[name]:
+                skip(child)
+
+        for name, deps in waiting.items():
+            if not deps:
+                launch(name)
+
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
+                for child in dependents[name]:
+                    if runs[name].status != DONE:
+                        skip(child)
+                        continue
+                    waiting[child].discard(name)
+                    if not waiting[child] and runs[child].status == PENDING:
+                        launch(child)
+
+        wall_time = time.perf_counter() - t0
+        return DagRun(steps=runs, wall_time=wall_time,
+                      critical_path=self._critical_path(runs))
+
+    def run_sync(self, run_step, initial_input=None):
+        """
+        run() 的同步版本：在当前线程按拓扑序逐个调用 run_step(step, payload)，返回 DagRun
+
+        不创建事件循环，供同步调用方使用（包括本身运行在事件循环线程里的调用方）；
+        步骤串行执行，失败时同样只跳过它的下游，错误记录在 StepRun.error 中。
+        """
+        order = self.topological_order()
+        runs = {name: StepRun(name) for name in self.steps}
+        t0 = time.perf_counter()
+
+        for name in order:
+            step, run = self.steps[name], runs[name]
+            if any(runs[dep].status != DONE for dep in step.needs):
+                run.status = SKIPPED
+                continue
+            run.status = RUNNING
+            run.start = time.perf_counter() - t0
+            try:
+                run.output = run_step(step, self._step_input(step, runs, initial_input))
+                run.status = DONE
+            except Exception as e:
+                run.status = FAILED
+                run.error = f"{type(e).__name__}: {e}"
+            finally:
+                run.end = time.perf_counter() - t0
+
+        wall_time = time.perf_counter() - t0
+        return DagRun(steps=runs, wall_time=wall_time,
+                      critical_path=self._critical_path(runs))
+
+    async def _run_step(self, sandbox, step, runs, initial_input, semaphore, t0, run_step):
+        run = runs[step.name]
+        if semaphore:
+            await semaphore.acquire()
+        run.start = time.perf_counter() - t0
+        try:
+            payload = self._step_input(step, runs, initial_input)
+            if run_step is not None:
+                run.output = await acall(run_step, step, payload)
+            else:
+                run.output = await self._exec_step(sandbox, step, payload)
+            run.status = DONE
+        except Exception as e:
+            run.status = FAILED
+            run.error = f"{type(e).__name__}: {e}"
+        finally:
+            run.end = time.perf_counter() - t0
+            if semaphore:
+                semaphore.release()
+
+    async def _exec_step(self, sandbox, step, payload):
+        await acall(sandbox.files.write, step.input_path, json.dumps(payload))
+        result = await acommand_result(sandbox.commands.run, f"python3 {step.script_path}",
+                                       envs={"AGENT_INPUT": step.input_path},
+                                       timeout=step.timeout)
+        if result.exit_code != 0:
+            raise RuntimeError(result.stderr or f"exit code {result.exit_code}")
+        return json.loads(result.stdout) if step.parse_json else result.stdout
+
+    def _step_input(self, step, runs, initial_input):
+        if not step.needs:
+            return initial_input
+        if len(step.needs) == 1:
+            return runs[step.needs[0]].output
+        return {dep: runs[dep].output for dep in step.needs}
+
+    def _critical_path(self, runs):
+        """从最后完成的步骤沿"最晚完成的依赖"回溯，得到决定总耗时的路径"""
+        finished = [r for r in runs.values() if r.end is not None]
+        if not finished:
+            return []
+        current = max(finished, key=lambda r: r.end).name
+        path = [current]
+        while True:
+            deps = [runs[d] for d in self.steps[current].needs if runs[d].end is not None]
+            if not deps:
+                break
+            current = max(deps, key=lambda r: r.end).name
+            path.append(current)
+        return list(reversed(path))
+
+
+if __name__ == "__main__":
+    import argparse
+    from local_sandbox import AsyncLocalSandbox
+
+    parser = argparse.ArgumentParser(description="DAG 工作流离线演示（AsyncLocalSandbox）")
+    parser.add_argument("--step-delay", type=float, default=0.5,
+                        help="每个步骤额外模拟的执行耗时（秒）")
+    args = parser.parse_args()
+
+    # agents_collaboration.py 场景 3：Agent A、Agent B 只依赖同一份输入，可以并行；
+    # Coordinator 在两者都完成后立即执行
+    text_agent = f"""
+import json, os, time
+data = json.load(open(os.environ['AGENT_INPUT']))
+time.sleep({args.step_delay})
+print(json.dumps({{'agent': 'text_processor', 'word_count': len(data['text'].split())}}))
+"""
+    number_agent = f"""
+import json, os, time
+data = json.load(open(os.environ['AGENT_INPUT']))
+time.sleep({args.step_delay})
+print(json.dumps({{'agent': 'number_processor', 'sum': sum(data['numbers'])}}))
+"""
+    coordinator = """
+import json, os
+inputs = json.load(open(os.environ['AGENT_INPUT']))
+text, numbers = inputs['agent_a'], inputs['agent_b']
+print(json.dumps({
+    'agents_completed': [text['agent'], numbers['agent']],
+    'summary': f"处理了 {text['word_count']} 个单词和 {numbers['sum']} 的数字总和",
+}, ensure_ascii=False))
+"""
+
+    workflow = (DagWorkflow()
+                .add_step("agent_a", text_agent)
+                .add_step("agent_b", number_agent)
+                .add_step("coordinator", coordinator, needs=["agent_a", "agent_b"]))
+
+    async def main():
+        sandbox = await AsyncLocalSandbox.create()
+        try:
+            shared_input = {
+                "text": "E2B provides secure sandboxed environments for AI agents",
+                "numbers": [1, 2, 3, 4, 5],
+            }
+            run = await workflow.run(sandbox, shared_input)
+            print("=" * 60)
+            print("DAG: agent_a ∥ agent_b → coordinator")
+            print("=" * 60)
+            print(run.report())
+            print(f"\n✅ Coordinator 输出: {run.outputs.get('coordinator')}")
+        finally:
+            await sandbox.kill()
+
+    asyncio.run(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+并发扇出执行器（Fan-out）
+
+把一组任务分发到 N 个沙箱上同时执行：
+- 有界并发：同一时刻最多 max_concurrency 个沙箱
+- 单任务超时：超时的任务记为失败，不影响其他任务
+- 结果可以按输入顺序返回（fan_out），也可以按完成顺序逐个产出（fan_out_iter）
+- 无论任务成功、失败还是超时，都保证对它的沙箱调用 kill()
+
+提供线程池版本（fan_out / fan_out_iter）和 asyncio 版本（async_fan_out / async_fan_out_iter）。
+线程池版本的超时作用于沙箱内命令执行；asyncio 版本的超时覆盖 创建 + 上传 + 执行 全过程。
+"""
+
+import asyncio
+import inspect
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+
+@dataclass
+class TaskSpec:
+    """
+    单个扇出任务
+
+    script:  在沙箱内执行的 Python 源码
+    name:    任务名（用于日志和结果展示）
+    timeout: 单任务超时（秒），为 None 时使用执行器的默认值
+    parse_json: 是否把 stdout 解析为 JSON
+    """
+    script: str
+    name: str = None
+    timeout: float = None
+    parse_json: bool = True
+
+
+@dataclass
+class TaskResult:
+    """单个任务的执行结果"""
+    index: int
+    name: str
+    output: object = None
+    stdout: str = ""
+    error: str = None
+    sandbox_id: str = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _default_factory():
+    from e2b import Sandbox
+    return Sandbox.create()
+
+
+def _parse(task, result, stdout):
+    stdout = stdout or ""
+    result.stdout = stdout
+    if not task.parse_json:
+        result.output = stdout
+        return
+    try:
+        result.output = json.loads(stdout)
+    except json.JSONDecodeError:
+        result.error = f"无法解析输出: {stdout[:100]}"
+
+
+# ============================================
+# 线程池版本
+# ============================================
+
+def _run_task(index, task, factory, default_timeout, live, lock):
+    result = TaskResult(index=index, name=task.name or f"task_{index}")
+    timeout = task.timeout or default_timeout
+    start = time.perf_counter()
+    sandbox = None
+    try:
+        sandbox = factory()
+        with lock:
+            live.add(sandbox)
+        result.sandbox_id = sandbox.sandbox_id
+
+        script_path = f"/tmp/task_{index}.py"
+        sandbox.files.write(script_path, task.script)
+        run = command_result(sandbox.commands.run, f"python3 {script_path}", timeout=timeout)
+
+        if run.exit_code != 0:
+            result.error = run.stderr or getattr(run, "error", None) or f"exit code {run.exit_code}"
+            result.stdout = run.stdout
+        else:
+            _parse(task, result, run.stdout)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        if sandbox is not None:
+            _kill(sandbox)
+            with lock:
+                live.discard(sandbox)
+        result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _kill(sandbox):
+    try:
+        sandbox.kill()
+    except Exception:
+        pass
+
+
+def fan_out_iter(tasks, factory=None, max_concurrency=8, timeout=60):
+    """
+    并发执行 tasks，按完成顺序逐个产出 TaskResult
+
+    提前结束迭代时，未开始的任务会被取消，已开始的任务执行完后其沙箱同样会被销毁。
+    """
+    factory = factory or _default_factory
+    live = set()
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency),
+                                  thread_name_prefix="fan-out")
+    futures = [
+        executor.submit(_run_task, i, task, factory, timeout, live, lock)
+        for i, task in enumerate(tasks, 1)
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        # 兜底：任何仍然存活的沙箱都在这里销毁
+        with lock:
+            leftovers = list(live)
+            live.clear()
+        for sandbox in leftovers:
+            _kill(sandbox)
+
+
+def fan_out(tasks, factory=None, max_concurrency=8, timeout=60, ordered=True):
+    """并发执行 tasks，返回 TaskResult 列表（ordered=True 时按输入顺序）"""
+    results = list(fan_out_iter(tasks, factory=factory,
+                                max_concurrency=max_concurrency, timeout=timeout))
+    if ordered:
+        results.sort(key=lambda r: r.index)
+    return results
+
+
+# ============================================
+# asyncio 版本
+# ============================================
+
+async def acall(fn, *args, **kwargs):
+    """
+    同时兼容异步 SDK（AsyncSandbox）和同步 SDK（Sandbox）的调用方式：
+    协程函数直接 await，同步调用放到线程池执行，不阻塞事件循环
+    """
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args, **kwargs)
+    value = await asyncio.to_thread(fn, *args, **kwargs)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+def command_result(fn, *args, **kwargs):
+    """
+    调用 commands.run / handle.wait，非零退出码时也返回 CommandResult
+
+    e2b 在非零退出码时抛出 CommandExitException，它本身带 stdout / stderr / exit_code，这里直接当作结果返回，
+    调用方照常检查 exit_code；超时（TimeoutException）等其他异常原样抛出。
+    """
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        if getattr(e, "exit_code", None) is None:
+            raise
+        return e
+
+
+async def acommand_result(fn, *args, **kwargs):
+    """command_result 的 asyncio 版本（兼容 AsyncSandbox 和 Sandbox）"""
+    try:
+        return await acall(fn, *args, **kwargs)
+    except Exception as e:
+        if getattr(e, "exit_code", None) is None:
+            raise
+        return e
+
+
+async def _default_async_factory():
+    from e2b import AsyncSandbox
+    return await AsyncSandbox.create()
+
+
+def _kill_when_created(future):
+    """被取消任务的沙箱在创建完成后立即销毁"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    kill = future.result().kill
+    if inspect.iscoroutinefunction(kill):
+        asyncio.ensure_future(kill())
+    else:
+        _kill(future.result())
+
+
+async def _run_task_async(index, task, factory, default_timeout, semaphore):
+    result = TaskResult(index=index, name=task.name or f"task_{index}")
+    timeout = task.timeout or default_timeout
+    sandbox = None
+    creating = None
+
+    async def body():
+        nonlocal sandbox, creating
+        # shield：创建过程中被取消（超时）时，沙箱创建完成后仍能被回收
+        creating = asyncio.ensure_future(acall(factory))
+        sandbox = await asyncio.shield(creating)
+        result.sandbox_id = sandbox.sandbox_id
+
+        script_path = f"/tmp/task_{index}.py"
+        await acall(sandbox.files.write, script_path, task.script)
+        run = await acommand_result(sandbox.commands.run, f"python3 {script_path}", timeout=timeout)
+
+        if run.exit_code != 0:
+            result.error = run.stderr or f"exit code {run.exit_code}"
+            result.stdout = run.stdout
+        else:
+            _parse(task, result, run.stdout)
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(body(), timeout)
+        except asyncio.TimeoutError:
+            result.error = f"timed out after {timeout}s"
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        finally:
+            if sandbox is not None:
+                try:
+                    await acall(sandbox.kill)
+                except Exception:
+                    pass
+            elif creating is not None and not creating.done():
+                creating.add_done_callback(_kill_when_created)
+            result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def async_fan_out_iter(tasks, factory=None, max_concurrency=8, timeout=60):
+    """asyncio 版本：按完成顺序逐个产出 TaskResult"""
+    factory = factory or _default_async_factory
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    pending = [
+        asyncio.ensure_future(_run_task_async(i, task, factory, timeout, semaphore))
+        for i, task in enumerate(tasks, 1)
+    ]
+    try:
+        for next_done in asyncio.as_completed(pending):
+            yield await next_done
+    finally:
+        # 提前退出时取消剩余任务；每个任务的 finally 会负责 kill 自己的沙箱
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def async_fan_out(tasks, factory=None, max_concurrency=8, timeout=60, ordered=True):
+    """asyncio 版本：返回 TaskResult 列表（ordered=True 时按输入顺序）"""
+    results = [r async for r in async_fan_out_iter(tasks, factory=factory,
+                                                   max_concurrency=max_concurrency,
+                                                   timeout=timeout)]
+    if ordered:
+        results.sort(key=lambda r: r.index)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="扇出执行器离线演示（LocalSandbox）")
+    parser.add_argument("--tasks", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--create-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    def factory():
+        return LocalSandbox.create(create_delay=args.create_delay)
+
+    operations = ["sum", "product", "average"]
+    tasks = []
+    for i in range(args.tasks):
+        task = {"task_id": i + 1, "operation": operations[i % 3], "data": [2, 3, 4]}
+        tasks.append(TaskSpec(name=f"{task['operation']}_{i + 1}", script=f"""
+import json, math
+task = {json.dumps(task)}
+ops = {{'sum': sum, 'product': math.prod, 'average': lambda d: sum(d) / len(d)}}
+print(json.dumps({{'task_id': task['task_id'], 'result': ops[task['operation']](task['data'])}}))
+"""))
+
+    print("=" * 60)
+    print(f"扇出执行: {args.tasks} 个任务, 并发 {args.concurrency}, "
+          f"create_delay={args.create_delay}s")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    for r in fan_out_iter(tasks, factory=factory, max_concurrency=args.concurrency):
+        status = f"✅ {r.output}" if r.ok else f"❌ {r.error}"
+        print(f"   [线程池] {r.name:<12} {r.elapsed:5.2f}s {status}")
+    print(f"   线程池版本总耗时: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = asyncio.run(async_fan_out(tasks, factory=factory,
+                                        max_concurrency=args.concurrency))
+    print(f"   asyncio 版本总耗时: {time.perf_counter() - start:.2f}s, "
+          f"成功 {sum(r.ok for r in results)}/{len(results)}")
+    print(f"   串行预计耗时: ≥ {args.tasks * args.create_delay:.2f}s")
@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+沙箱生命周期管理（Lifecycle Registry）
+
+每个示例都靠 finally: sandbox.kill() 销毁沙箱：协调器进程一旦崩溃（OOM、kill -9、宿主机重启），
+它创建的沙箱会一直运行到服务端超时（ppio/browser-use/demo.py 里是 timeout=600）才被回收，
+期间白白占用并发配额。
+
+SandboxRegistry 记录协调器创建的每个沙箱：
+- 租用状态（leased / idle）、最近活动时间、累计存活时长和租用时长
+- 后台清理线程：未租用且空闲超过 idle_timeout 的沙箱被回收；
+  已租用但超过 orphan_timeout 没有任何请求的沙箱视为孤儿（调用方卡死或忘了 kill），同样回收
+- 注册表持久化为 JSON 文件：创建和销毁时同步写入，其余变化由清理线程定期写入；
+  多个注册表（同一进程或多个进程）可以共享一个文件：写入时在文件锁下重新读取并合并，只覆盖自己名下的记录
+- 协调器重启后 recover() 找出上一个进程遗留的沙箱，按 ID 重新连接后接管（reclaim=True）或销毁；
+  记录中保存管理进程的 PID 和启动时间，PID 被复用时不会把遗留沙箱误认为仍有人管理
+- keepalive：设置后清理线程定期对存活沙箱调用 set_timeout(keepalive)，
+  沙箱创建时使用较短的服务端超时即可，进程崩溃后最多再存活 keepalive 秒
+
+registry.factory(factory) 包装沙箱工厂，返回的代理在每次 files / commands / run_code 调用时刷新活动时间，
+kill() 时从注册表移除；SandboxPool(registry=...) 同步租用 / 归还状态，并可用 adopt() 接管恢复的沙箱。
+
+直接运行本文件会用 LocalSandbox 离线演示：子进程创建沙箱后崩溃 → 重启的协调器接管遗留沙箱，
+以及清理线程回收空闲和孤儿沙箱。
+"""
+
+import asyncio
+import contextlib
+import importlib
+import inspect
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，共享同一个文件的注册表可能互相覆盖
+    fcntl = None
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "sandbox-registry.json")
+
+
+@dataclass
+class SandboxRecord:
+    """注册表中的一条沙箱记录（时间均为 time.time()，重启后仍然有效）"""
+    sandbox_id: str
+    backend: str                # "模块:类名"，重启后用该类的 connect(sandbox_id) 重新连接
+    owner: str                  # 管理它的 SandboxRegistry 实例
+    pid: int
+    host: str
+    created_at: float
+    last_active: float
+    leased: bool = True
+    lease_started: float = None
+    leased_seconds: float = 0.0
+    ended_at: float = None
+    end_reason: str = None      # killed / idle / orphaned / survivor / lost / closed
+    pid_started: int = None     # 管理进程的启动时间（/proc/<pid>/stat），用于识别 PID 复用
+
+    @property
+    def alive(self):
+        return self.ended_at is None
+
+    def runtime(self, now=None):
+        """累计存活时长（秒）"""
+        return (self.ended_at or now or time.time()) - self.created_at
+
+    def busy_seconds(self, now=None):
+        """累计租用时长（秒）"""
+        busy = self.leased_seconds
+        if self.alive and self.leased and self.lease_started is not None:
+            busy += (now or time.time()) - self.lease_started
+        return busy
+
+
+class SandboxRegistry:
+    """
+    沙箱注册表 + 后台清理线程
+
+    用法：
+        registry = SandboxRegistry(path="orchestrator.json").start()
+        registry.recover()                      # 销毁上一个进程遗留的沙箱
+        create = registry.factory(Sandbox.create)
+        sandbox = create()                      # 之后的调用自动刷新活动时间
+        ...
+        registry.close()
+
+    path:           注册表文件，可由多个注册表共享（写入时加锁合并）；None 时不持久化
+    idle_timeout:   未租用的沙箱空闲超过该时间（秒）被回收，None 表示不回收
+    orphan_timeout: 已租用的沙箱超过该时间（秒）没有请求视为孤儿被回收，None 表示不回收
+    sweep_interval: 清理线程的检查间隔（秒）
+    keepalive:      不为 None 时，清理线程对支持 set_timeout 的存活沙箱续期 keepalive 秒
+    history:        文件中保留的已结束记录数（用于事后统计）
+    """
+
+    def __init__(self, path=DEFAULT_PATH, idle_timeout=300.0, orphan_timeout=1800.0,
+                 sweep_interval=10.0, keepalive=None, history=200):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.orphan_timeout = orphan_timeout
+        self.sweep_interval = sweep_interval
+        self.keepalive = keepalive
+        self.history = history
+        self.owner = uuid.uuid4().hex
+
+        self._records = {}      # sandbox_id -> SandboxRecord（含其他进程留下的记录）
+        self._live = {}         # sandbox_id -> 本实例管理的原始沙箱对象
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_loop,
+                                         name="sandbox-registry", daemon=True)
+
+        self.stats = {
+            "tracked": 0,
+            "killed": 0,            # 调用方主动 kill
+            "reaped_idle": 0,
+            "reaped_orphaned": 0,
+            "reclaimed": 0,         # recover 接管的遗留沙箱
+            "survivors_killed": 0,  # recover 销毁的遗留沙箱
+            "lost": 0,              # 遗留沙箱已不存在（服务端已回收）
+            "kill_failures": 0,
+        }
+        self._load()
+
+    # ---------- 登记与状态 ----------
+
+    def track(self, sandbox, leased=True):
+        """登记一个沙箱，返回刷新活动时间的 TrackedSandbox 代理"""
+        sandbox = _unwrap(sandbox)
+        now = time.time()
+        record = SandboxRecord(sandbox.sandbox_id, _backend(sandbox), self.owner, os.getpid(),
+                               socket.gethostname(), now, now, leased=leased,
+                               lease_started=now if leased else None,
+                               pid_started=_process_start(os.getpid()))
+        with self._lock:
+            self._records[record.sandbox_id] = record
+            self._live[record.sandbox_id] = sandbox
+            self.stats["tracked"] += 1
+        # 创建后立即落盘：进程在下一次清理前崩溃也能找回这个沙箱
+        self._save()
+        return TrackedSandbox(sandbox, self)
+
+    def factory(self, factory, leased=True):
+        """包装沙箱工厂（同步或协程函数）：创建的沙箱自动登记，返回 TrackedSandbox"""
+        if inspect.iscoroutinefunction(factory):
+            async def create_async():
+                return self.track(await factory(), leased=leased)
+            return create_async
+
+        def create_sandbox():
+            return self.track(factory(), leased=leased)
+        return create_sandbox
+
+    def touch(self, sandbox):
+        """刷新最近活动时间"""
+        with self._lock:
+            record = self._records.get(_id(sandbox))
+            if record is not None:
+                record.last_active = time.time()
+
+    def lease(self, sandbox):
+        """标记为已租用"""
+        now = time.time()
+        with self._lock:
+            record = self._records.get(_id(sandbox))
+            if record is None or not record.alive or record.leased:
+                return
+            record.leased = True
+            record.lease_started = now
+            record.last_active = now
+            self._dirty = True
+
+    def release(self, sandbox):
+        """标记为空闲，累计本次租用时长"""
+        now = time.time()
+        with self._lock:
+            record = self._records.get(_id(sandbox))
+            if record is None or not record.alive or not record.leased:
+                return
+            record.leased_seconds += now - record.lease_started
+            record.leased = False
+            record.lease_started = None
+            record.last_active = now
+            self._dirty = True
+
+    def is_alive(self, sandbox):
+        """沙箱是否仍由注册表管理（未被销毁或回收）"""
+        with self._lock:
+            return _id(sandbox) in self._live
+
+    def forget(self, sandbox, reason="killed"):
+        """沙箱已被调用方销毁：结束记录（不再调用 kill）"""
+        with self._lock:
+            record = self._records.get(_id(sandbox))
+            if record is None or not record.alive:
+                return
+            self._end_locked(record, reason, time.time())
+            self.stats["killed"] += 1
+        self._save()
+
+    def kill(self, sandbox, reason="killed"):
+        """销毁沙箱并结束记录"""
+        with self._lock:
+            record = self._records.get(_id(sandbox))
+            target = self._live.get(_id(sandbox))
+            if record is None or not record.alive:
+                return False
+            self._end_locked(record, reason, time.time())
+            self.stats["killed"] += 1
+        self._save()
+        return self._kill(target) if target is not None else False
+
+    def records(self, alive_only=False):
+        with self._lock:
+            records = list(self._records.values())
+        return [r for r in records if r.alive] if alive_only else records
+
+    def report(self, now=None):
+        """汇总本实例管理过的沙箱：数量、累计存活 / 租用时长（秒）和利用率"""
+        now = now or time.time()
+        with self._lock:
+            records = [r for r in self._records.values() if r.owner == self.owner]
+        alive = [r for r in records if r.alive]
+        runtime = sum(r.runtime(now) for r in records)
+        busy = sum(r.busy_seconds(now) for r in records)
+        return {
+            "alive": len(alive),
+            "leased": sum(1 for r in alive if r.leased),
+            "idle": sum(1 for r in alive if not r.leased),
+            "ended": len(records) - len(alive),
+            "sandbox_seconds": runtime,
+            "leased_seconds": busy,
+            "utilization": busy / runtime if runtime else 0.0,
+        }
+
+    # ---------- 清理与恢复 ----------
+
+    def sweep(self, now=None):
+        """回收空闲 / 孤儿沙箱，为存活沙箱续期并写入注册表；返回被回收的沙箱 ID"""
+        now = now or time.time()
+        reaped = []
+        with self._lock:
+            for sandbox_id, sandbox in list(self._live.items()):
+                record = self._records[sandbox_id]
+                quiet = now - record.last_active
+                if not record.leased and self.idle_timeout is not None and quiet > self.idle_timeout:
+                    reason = "idle"
+                elif record.leased and self.orphan_timeout is not None and quiet > self.orphan_timeout:
+                    reason = "orphaned"
+                else:
+                    continue
+                self._end_locked(record, reason, now)
+                self.stats[f"reaped_{reason}"] += 1
+                reaped.append(sandbox)
+            renew = list(self._live.values()) if self.keepalive else []
+
+        for sandbox in reaped:
+            self._kill(sandbox)
+        for sandbox in renew:
+            if hasattr(sandbox, "set_timeout"):
+                try:
+                    _resolve(sandbox.set_timeout(self.keepalive))
+                except Exception:
+                    pass
+        if self._dirty:
+            self._save()
+        return [sandbox.sandbox_id for sandbox in reaped]
+
+    def recover(self, reclaim=False, connect=None, force=False):
+        """
+        处理上一个进程遗留的沙箱（存活记录的管理进程已经不在运行）
+
+        reclaim=True 时重新连接并接管（记为空闲），返回 TrackedSandbox 列表；否则销毁它们并返回空列表。
+        connect(record) 可替换默认的重新连接方式（按 backend 导入类并调用 connect(sandbox_id)）；
+        连接失败的沙箱视为已被服务端回收（lost）。
+        其他主机上的记录和同一进程内其他注册表的记录无法判断是否仍在使用，force=True 时才处理。
+        """
+        # 在文件锁下读取最新记录并认领：共享同一文件的其他注册表不会重复处理这些沙箱
+        with self._file_lock():
+            self._merge()
+            with self._lock:
+                survivors = [r for r in self._records.values()
+                             if r.alive and r.owner != self.owner and not _owner_running(r, force)]
+                for record in survivors:
+                    self._adopt_locked(record)
+            self._write()
+
+        reclaimed = []
+        for record in survivors:
+            try:
+                sandbox = (connect or _connect)(record)
+            except Exception:
+                with self._lock:
+                    self._end_locked(record, "lost", time.time())
+                    self.stats["lost"] += 1
+                continue
+
+            with self._lock:
+                self._live[record.sandbox_id] = sandbox
+                if not reclaim:
+                    self._end_locked(record, "survivor", time.time())
+                    self.stats["survivors_killed"] += 1
+                else:
+                    self.stats["reclaimed"] += 1
+            if reclaim:
+                reclaimed.append(TrackedSandbox(sandbox, self))
+            else:
+                self._kill(sandbox)
+        self._save()
+        return reclaimed
+
+    def start(self):
+        """启动后台清理线程"""
+        if not self._sweeper.is_alive():
+            self._sweeper.start()
+        return self
+
+    def close(self, kill=True):
+        """停止清理线程；kill=True 时销毁仍存活的沙箱，否则留给下一个进程 recover()"""
+        self._stop.set()
+        if self._sweeper.is_alive():
+            self._sweeper.join()
+        if kill:
+            with self._lock:
+                now = time.time()
+                remaining = list(self._live.values())
+                for sandbox in remaining:
+                    self._end_locked(self._records[sandbox.sandbox_id], "closed", now)
+            for sandbox in remaining:
+                self._kill(sandbox)
+        self._save()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+    def _adopt_locked(self, record):
+        """把遗留记录转到本实例名下（接管后记为空闲，之前的租用时长保留）"""
+        now = time.time()
+        if record.leased and record.lease_started is not None:
+            # 上一个进程最后一次写入之后的时间无从得知，按最近活动时间结算
+            record.leased_seconds += max(0.0, record.last_active - record.lease_started)
+        record.owner = self.owner
+        record.pid = os.getpid()
+        record.pid_started = _process_start(record.pid)
+        record.host = socket.gethostname()
+        record.leased = False
+        record.lease_started = None
+        record.last_active = now
+        self._dirty = True
+
+    def _end_locked(self, record, reason, now):
+        if record.leased and record.lease_started is not None:
+            record.leased_seconds += now - record.lease_started
+        record.leased = False
+        record.lease_started = None
+        record.ended_at = now
+        record.end_reason = reason
+        self._live.pop(record.sandbox_id, None)
+        self._dirty = True
+
+    def _kill(self, sandbox):
+        try:
+            return _resolve(sandbox.kill())
+        except Exception:
+            with self._lock:
+                self.stats["kill_failures"] += 1
+            return False
+
+    def _load(self):
+        self._records = {record.sandbox_id: record for record in self._read()}
+
+    def _read(self):
+        if not self.path:
+            return []
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return [SandboxRecord(**entry) for entry in data["records"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """跨进程互斥地 读取 - 合并 - 写入 注册表文件（flock 加在旁边的 .lock 文件上）"""
+        with self._save_lock:
+            if not self.path or fcntl is None:
+                yield
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge(self):
+        """（持有文件锁）读取文件中的最新记录：其他注册表名下的记录以文件为准，本实例名下的以内存为准"""
+        disk = {record.sandbox_id: record for record in self._read()}
+        with self._lock:
+            for sandbox_id, record in list(self._records.items()):
+                if record.owner != self.owner and sandbox_id not in disk:
+                    # 已被其他注册表按 history 淘汰
+                    del self._records[sandbox_id]
+            for sandbox_id, record in disk.items():
+                mine = self._records.get(sandbox_id)
+                if mine is None or mine.owner != self.owner:
+                    self._records[sandbox_id] = record
+
+    def _save(self):
+        """加锁合并后原子地写入注册表文件"""
+        if not self.path:
+            return
+        with self._file_lock():
+            self._merge()
+            self._write()
+
+    def _write(self):
+        """（持有文件锁）写入存活记录 + 最近 history 条已结束记录"""
+        if not self.path:
+            return
+        with self._lock:
+            records = list(self._records.values())
+            self._dirty = False
+        alive = [r for r in records if r.alive]
+        ended = sorted((r for r in records if not r.alive), key=lambda r: r.ended_at)
+        dropped = ended[:-self.history] if self.history else ended
+        ended = ended[len(dropped):]
+        with self._lock:
+            for record in dropped:
+                self._records.pop(record.sandbox_id, None)
+        data = json.dumps({"records": [asdict(r) for r in alive + ended]},
+                          separators=(",", ":"))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class TrackedSandbox:
+    """沙箱代理：files / commands / run_code 调用时刷新活动时间，kill() 时结束注册表记录"""
+
+    def __init__(self, sandbox, registry):
+        self._sandbox = sandbox
+        self._registry = registry
+        self.files = _Touching(sandbox.files, registry, sandbox.sandbox_id)
+        self.commands = _Touching(sandbox.commands, registry, sandbox.sandbox_id)
+
+    def __getattr__(self, name):
+        value = getattr(self._sandbox, name)
+        if name == "run_code":
+            return _touching(value, self._registry, self._sandbox.sandbox_id)
+        return value
+
+    def kill(self):
+        self._registry.forget(self._sandbox)
+        return self._sandbox.kill()
+
+
+class _Touching:
+    def __init__(self, target, registry, sandbox_id):
+        self._target = target
+        self._registry = registry
+        self._sandbox_id = sandbox_id
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+        return _touching(value, self._registry, self._sandbox_id)
+
+
+def _touching(fn, registry, sandbox_id):
+    def call(*args, **kwargs):
+        registry.touch(sandbox_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # 长时间运行的同步命令结束时再刷新一次
+            registry.touch(sandbox_id)
+    return call
+
+
+def _unwrap(sandbox):
+    while isinstance(sandbox, TrackedSandbox):
+        sandbox = sandbox._sandbox
+    return sandbox
+
+
+def _id(sandbox):
+    return sandbox if isinstance(sandbox, str) else sandbox.sandbox_id
+
+
+def _backend(sandbox):
+    cls = type(sandbox)
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _resolve(result):
+    """异步沙箱（AsyncSandbox）的方法返回协程，在清理线程里直接运行到结束"""
+    if inspect.isawaitable(result):
+        async def wait_for():
+            return await result
+        return asyncio.run(wait_for())
+    return result
+
+
+def _connect(record):
+    """默认的重新连接方式：导入记录中的沙箱类并调用 connect(sandbox_id)"""
+    module, _, name = record.backend.partition(":")
+    cls = importlib.import_module(module)
+    for part in name.split("."):
+        cls = getattr(cls, part)
+    return _resolve(cls.connect(record.sandbox_id))
+
+
+def _process_start(pid):
+    """进程的启动时间（Linux /proc/<pid>/stat 第 22 个字段，开机后的时钟滴答数）；无法获取时返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        # 第 2 个字段（进程名）可能包含空格和括号，从最后一个 ')' 之后开始数
+        return int(stat[stat.rindex(")") + 2:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _owner_running(record, force=False):
+    """管理该记录的进程是否仍在运行"""
+    if record.host != socket.gethostname():
+        return not force
+    started = _process_start(record.pid)
+    if record.pid_started is not None and started is not None and started != record.pid_started:
+        # PID 已被复用（例如容器重启后新进程拿到了同一个 PID），原来的管理进程已经不在
+        return False
+    if record.pid == os.getpid():
+        # 同一进程里的另一个注册表实例，无法判断它是否还在使用这些沙箱
+        return not force
+    try:
+        os.kill(record.pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import subprocess
+    import sys
+
+    from local_sandbox import LocalSandbox
+    from sandbox_pool import SandboxPool
+
+    parser = argparse.ArgumentParser(description="沙箱生命周期管理演示（离线）")
+    parser.add_argument("--sandboxes", type=int, default=4, help="崩溃前创建的沙箱数")
+    parser.add_argument("--pool-size", type=int, default=2, help="重启后预热池接管的沙箱数")
+    parser.add_argument("--idle-timeout", type=float, default=0.5, help="空闲回收时间（秒）")
+    parser.add_argument("--orphan-timeout", type=float, default=1.0, help="孤儿回收时间（秒）")
+    parser.add_argument("--crash", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crash:
+        # 子进程：创建沙箱、执行命令，然后不经任何清理直接退出
+        registry = SandboxRegistry(path=args.crash)
+        create = registry.factory(LocalSandbox.create)
+        for i in range(args.sandboxes):
+            create().commands.run(f"echo task-{i} > /home/user/task.txt")
+        os._exit(1)
+
+    def surviving(ids):
+        return [sid for sid in ids
+                if any(name.startswith(f"{sid}-") for name in os.listdir(LocalSandbox.base_dir))]
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sandbox-registry-"), "registry.json")
+
+    print("=" * 60)
+    print("1. 协调器进程崩溃")
+    print("=" * 60)
+    child = subprocess.run([sys.executable, __file__, "--crash", path,
+                            "--sandboxes", str(args.sandboxes)])
+    orphans = [r.sandbox_id for r in SandboxRegistry(path=path).records(alive_only=True)]
+    print(f"   子进程退出码 {child.returncode}，遗留沙箱 {len(surviving(orphans))} 个"
+          f"（没有注册表时它们要等到服务端超时才会被回收）")
+
+    print("\n" + "=" * 60)
+    print("2. 重启后 recover(reclaim=True)，预热池接管遗留沙箱")
+    print("=" * 60)
+    registry = SandboxRegistry(path=path, idle_timeout=args.idle_timeout,
+                               orphan_timeout=args.orphan_timeout, sweep_interval=0.1)
+    reclaimed = registry.recover(reclaim=True)
+    print(f"   接管 {len(reclaimed)} 个遗留沙箱")
+    pool = SandboxPool(factory=LocalSandbox.create, size=args.pool_size, registry=registry)
+    pool.adopt(reclaimed)
+    pool.start(wait=True, timeout=5)
+    sandbox = pool.lease()
+    print(f"   从池中租用: {sandbox.sandbox_id}（{'遗留沙箱' if sandbox.sandbox_id in orphans else '新建'}），"
+          f"池中新建 {pool.stats['created']} 个")
+    pool.release(sandbox)
+    pool.close()
+    print(f"   关闭预热池后遗留沙箱剩余 {len(surviving(orphans))} 个")
+
+    print("\n" + "=" * 60)
+    print("3. 清理线程回收空闲 / 孤儿沙箱")
+    print("=" * 60)
+    create = registry.factory(LocalSandbox.create)
+    leaked = create()                   # 调用方忘了 kill → 孤儿
+    leaked.commands.run("echo working")
+    spare = create()
+    registry.release(spare)             # 归还后一直没人用 → 空闲
+    active = create()                   # 持续有请求 → 保留
+    registry.start()
+    deadline = time.time() + max(args.idle_timeout, args.orphan_timeout) + 0.5
+    while time.time() < deadline:
+        active.commands.run("true")
+        time.sleep(0.05)
+    print(f"   回收空闲 {registry.stats['reaped_idle']} 个，回收孤儿 {registry.stats['reaped_orphaned']} 个，"
+          f"活跃沙箱{'仍在运行' if registry.is_alive(active) else '被误回收'}")
+    active.kill()
+    registry.close()
+
+    report = registry.report()
+    print(f"\n📊 累计存活 {report['sandbox_seconds']:.1f} 沙箱·秒，租用 {report['leased_seconds']:.1f} 秒，"
+          f"利用率 {report['utilization']:.0%}")
+    print(f"   {registry.stats}")
+    ids = [r.sandbox_id for r in registry.records()]
+    print(f"   本地遗留沙箱目录: {len(surviving(ids))} 个")
+    shutil.rmtree(os.path.dirname(path))
@@ -0,0 +1,1224 @@
+#!/usr/bin/env python3
+"""
+本地沙箱替身（LocalSandbox）
+
+用 子进程 + 独立临时目录 模拟 e2b Sandbox 的核心接口，
+便于在没有 E2B 服务的情况下离线测试、压测协调器 / 预热池等组件。
+
+路径映射：
+- 沙箱内的 /home/user 和 /tmp 会被映射到该沙箱私有的根目录下
+- files.write / files.read 直接做路径映射
+- commands.run 会改写命令行中的路径，
+  并通过 sitecustomize 钩子改写 Python 脚本内 open() / os.* / sqlite3.connect() / sys.path 的路径
+
+快照 / 分叉：
+- create_snapshot() 把私有根目录克隆为快照（cp --reflink=auto，CoW 文件系统上只复制元数据），
+  LocalSandbox.create(snapshot_id) 从快照克隆出新沙箱；fork(count) 直接克隆当前沙箱
+- 只保存文件系统状态，不保存进程 / 内存（e2b 的快照会连同内存一起保存）
+
+资源限制（ResourceLimits）：
+- 每条命令在 shell 中先执行 ulimit（地址空间 / CPU 时间 / 打开文件数 / 文件大小）
+- 设置了 LOCAL_SANDBOX_CGROUP（一个已委派给当前用户的 cgroup v2 目录）时，
+  每个沙箱额外创建子 cgroup，写入 memory.max / cpu.max / pids.max
+
+install() 把 e2b.Sandbox / AsyncSandbox 替换为本地沙箱，现有示例不改代码即可离线运行：
+    python3 local_sandbox.py --run multi_sandbox_agents.py
+
+⚠️ 这只是性能测试用的替身，不提供任何安全隔离！
+"""
+
+import asyncio
+import datetime
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from dataclasses import dataclass, field
+
+# 沙箱内会被映射到私有根目录的路径前缀
+SANDBOX_PREFIXES = ("/home/user", "/tmp")
+
+_PATH_PATTERN = re.compile(
+    r"(?<![\w./~-])(" + "|".join(re.escape(p) for p in SANDBOX_PREFIXES) + r")(?=[/\s'\";|&)]|$)"
+)
+
+# 注入到沙箱内 Python 进程的路径映射钩子
+_SITE_HOOK = '''
+import builtins
+import io
+import os
+import sys
+
+_root = os.environ.get("LOCAL_SANDBOX_ROOT")
+_prefixes = %r
+
+
+def _map(path):
+    if isinstance(path, os.PathLike):
+        path = os.fspath(path)
+    if isinstance(path, str) and _root and not path.startswith(_root):
+        for prefix in _prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return _root + path
+    return path
+
+
+def _wrap(fn, nargs=1):
+    def inner(*args, **kwargs):
+        args = [_map(a) if i < nargs else a for i, a in enumerate(args)]
+        return fn(*args, **kwargs)
+    inner.__wrapped__ = fn
+    return inner
+
+
+if _root:
+    builtins.open = io.open = _wrap(io.open)
+    for _name in ("open", "stat", "lstat", "listdir", "scandir", "mkdir",
+                  "remove", "unlink", "rmdir", "chdir"):
+        setattr(os, _name, _wrap(getattr(os, _name)))
+    for _name in ("rename", "replace"):
+        setattr(os, _name, _wrap(getattr(os, _name), nargs=2))
+
+
+class _Sqlite3Hook:
+    """sqlite3 在 C 层打开文件，导入时再包装 sqlite3.connect（避免每个进程都预先导入）"""
+
+    def find_spec(self, name, path=None, target=None):
+        if name != "sqlite3":
+            return None
+        sys.meta_path.remove(self)
+        for finder in sys.meta_path:
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        exec_module = spec.loader.exec_module
+
+        def patched(module):
+            exec_module(module)
+            module.connect = _wrap(module.connect)
+
+        spec.loader.exec_module = patched
+        return spec
+
+
+def _path_hook(entry, _file_finder=sys.path_hooks[-1]):
+    """sys.path 中的沙箱路径（如 sys.path.insert(0, "/home/user/lib")）映射后再查找模块"""
+    mapped = _map(entry)
+    if mapped == entry:
+        raise ImportError(entry)
+    return _file_finder(mapped)
+
+
+if _root:
+    sys.meta_path.insert(0, _Sqlite3Hook())
+    sys.path_hooks.insert(0, _path_hook)
+    sys.path_importer_cache.clear()
+''' % (SANDBOX_PREFIXES,)
+
+
+# run_code 的执行器：代码从 stdin 读入，最后一个表达式的值和异常信息写入 argv[1] 指向的 JSON 文件
+_RUN_CODE = '''
+import ast
+import json
+import sys
+import traceback
+
+result = {"text": None, "error": None}
+namespace = {"__name__": "__main__"}
+try:
+    tree = ast.parse(sys.stdin.read(), "<code>")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<code>", "exec"), namespace)
+    if last is not None:
+        value = eval(compile(last, "<code>", "eval"), namespace)
+        if value is not None:
+            result["text"] = repr(value)
+except BaseException as e:
+    result["error"] = {"name": type(e).__name__, "value": str(e),
+                       "traceback": traceback.format_exc()}
+    traceback.print_exc()
+sys.stdout.flush()
+with open(sys.argv[1], "w") as f:
+    json.dump(result, f)
+'''
+
+_STREAM_CHUNK = 1 << 20
+
+
+def _iter_chunks(local_path):
+    with open(local_path, "rb") as f:
+        while True:
+            chunk = f.read(_STREAM_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+@dataclass
+class CommandResult:
+    """命令执行结果（字段与 e2b 的 CommandResult 保持一致）"""
+    stdout: str
+    stderr: str
+    exit_code: int
+    error: str = None
+
+
+@dataclass
+class EntryInfo:
+    """files.list 返回的目录项（字段为 e2b EntryInfo 的子集）"""
+    name: str
+    type: str           # "file" 或 "dir"
+    path: str
+    size: int
+    mode: int
+    modified_time: datetime.datetime
+
+
+@dataclass
+class Logs:
+    stdout: list = field(default_factory=list)
+    stderr: list = field(default_factory=list)
+
+
+@dataclass
+class ExecutionError:
+    name: str
+    value: str
+    traceback: str
+
+
+@dataclass
+class Result:
+    text: str
+
+
+@dataclass
+class Execution:
+    """run_code 的执行结果（字段与 e2b Code Interpreter 的 Execution 保持一致）"""
+    results: list = field(default_factory=list)
+    logs: Logs = field(default_factory=Logs)
+    error: ExecutionError = None
+    execution_count: int = None
+
+    @property
+    def text(self):
+        return self.results[0].text if self.results else None
+
+
+@dataclass
+class ResourceLimits:
+    """
+    沙箱资源限制（None 表示不限制）
+
+    memory_mb / cpu_seconds / max_open_files / max_file_mb 通过 ulimit 作用于每条命令；
+    memory_mb / cpu_cores / max_processes 在启用 cgroup 时写入 memory.max / cpu.max / pids.max。
+    没有 cgroup 时 memory_mb 限制的是地址空间（RLIMIT_AS），max_processes / cpu_cores 不生效。
+    """
+    memory_mb: int = None
+    cpu_seconds: int = None
+    cpu_cores: float = None
+    max_processes: int = None
+    max_open_files: int = None
+    max_file_mb: int = None
+
+
+def _limit_prefix(limits, cgroup):
+    """生成命令前缀：先把 shell 加入沙箱的 cgroup，再设置 ulimit，子进程都会继承"""
+    parts = []
+    if cgroup:
+        parts.append(f"echo $$ > {cgroup}/cgroup.procs")
+    if limits:
+        if limits.memory_mb:
+            parts.append(f"ulimit -v {limits.memory_mb * 1024}")
+        if limits.cpu_seconds:
+            parts.append(f"ulimit -t {limits.cpu_seconds}")
+        if limits.max_open_files:
+            parts.append(f"ulimit -n {limits.max_open_files}")
+        if limits.max_file_mb:
+            # POSIX sh 中 ulimit -f 的单位是 512 字节
+            parts.append(f"ulimit -f {limits.max_file_mb * 2048}")
+    return " && ".join(parts)
+
+
+def _create_cgroup(sandbox_id, limits):
+    """在 LOCAL_SANDBOX_CGROUP 下为沙箱创建子 cgroup；未配置或无需限制时返回 None"""
+    parent = os.environ.get("LOCAL_SANDBOX_CGROUP")
+    if not parent or not limits or not (limits.memory_mb or limits.cpu_cores
+                                        or limits.max_processes):
+        return None
+    path = os.path.join(parent, sandbox_id)
+    os.makedirs(path)
+    settings = {
+        "memory.max": limits.memory_mb and limits.memory_mb << 20,
+        "cpu.max": limits.cpu_cores and f"{int(limits.cpu_cores * 100000)} 100000",
+        "pids.max": limits.max_processes,
+    }
+    for name, value in settings.items():
+        if value:
+            with open(os.path.join(path, name), "w") as f:
+                f.write(str(value))
+    return path
+
+
+@dataclass
+class SnapshotInfo:
+    """快照信息（字段与 e2b 的 SnapshotInfo 保持一致）"""
+    snapshot_id: str
+    names: list = field(default_factory=list)
+
+
+def _clone_tree(src, dst):
+    """复制目录树：Linux 上优先 cp --reflink=auto（CoW 文件系统上只复制元数据）"""
+    if sys.platform.startswith("linux") and shutil.which("cp"):
+        result = subprocess.run(["cp", "-a", "--reflink=auto", src, dst],
+                                stderr=subprocess.PIPE)
+        if result.returncode == 0:
+            return
+        shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True)
+
+
+class RateLimitError(RuntimeError):
+    """FaultInjector 注入的失败（对应 e2b 的 RateLimitException / 服务端过载）"""
+
+
+class FaultInjector:
+    """
+    模拟容量有限的远端服务（控制面 / 隧道网关），用于离线验证限流、重试等客户端策略
+
+    传给 LocalSandbox.create(faults=...) 后，创建沙箱和每次 files / commands 请求都会经过它：
+    - capacity:  服务端能同时处理的请求数；并发超过 capacity 时，
+                 请求延迟按 并发数 / capacity 成比例增长（排队）
+    - latency:   未过载时每个请求的基础延迟（秒）；沙箱的 create_delay / latency 非零时优先使用它们
+    - jitter:    延迟的随机抖动比例（0.1 表示 ±10%）
+    - slow_rate / slow_factor: 以 slow_rate 的概率让请求慢 slow_factor 倍（长尾延迟）
+    - failure_rate:          任何负载下的基础失败率
+    - overload_failure_rate: 过载时额外的失败率，按超出 capacity 的比例增长，最多到该值
+    失败时抛出 RateLimitError；同一个实例可以被多个沙箱（以及线程 / 协程）共享。
+    """
+
+    def __init__(self, capacity=None, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 overload_failure_rate=0.0, slow_rate=0.0, slow_factor=10.0, seed=None):
+        self.capacity = capacity
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.failure_rate = failure_rate
+        self.overload_failure_rate = overload_failure_rate
+        self.inflight = 0
+        self.stats = {"requests": 0, "failures": 0, "slow": 0, "peak_inflight": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def request(self, base=None):
+        """模拟一次请求：按当前负载等待，可能抛出 RateLimitError"""
+        delay, load, fail = self._enter(base)
+        try:
+            time.sleep(delay)
+        finally:
+            self._exit(load, fail)
+
+    async def arequest(self, base=None):
+        delay, load, fail = self._enter(base)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._exit(load, fail)
+
+    def _enter(self, base):
+        with self._lock:
+            self.inflight += 1
+            self.stats["requests"] += 1
+            self.stats["peak_inflight"] = max(self.stats["peak_inflight"], self.inflight)
+            load = self.inflight / self.capacity if self.capacity else 0.0
+            delay = (base or self.latency) * max(load, 1.0)
+            if self.jitter:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                delay *= self.slow_factor
+                self.stats["slow"] += 1
+            overload = min(max(load - 1.0, 0.0), 1.0)
+            fail = self._random.random() < self.failure_rate + self.overload_failure_rate * overload
+        return delay, load, fail
+
+    def _exit(self, load, fail):
+        with self._lock:
+            self.inflight -= 1
+            if fail:
+                self.stats["failures"] += 1
+        if fail:
+            raise RateLimitError(f"injected failure at load {load:.2f}")
+
+
+class _LocalFiles:
+    """沙箱文件系统（对应 sandbox.files）"""
+
+    def __init__(self, sandbox):
+        self._sandbox = sandbox
+
+    def write(self, path, data):
+        """写入文件，自动创建父目录"""
+        self._sandbox._round_trip()
+        self._write(path, data)
+
+    def write_files(self, files):
+        """一次请求写入多个文件（对应 e2b 的 files.write_files），files 为 [{path, data}]"""
+        self._sandbox._round_trip()
+        for entry in files:
+            self._write(entry["path"], entry["data"])
+
+    def read(self, path, format="text"):
+        """读取文件，format 为 'text'、'bytes' 或 'stream'（逐块产出 bytes）"""
+        self._sandbox._round_trip()
+        return self._read(path, format)
+
+    def list(self, path, depth=1):
+        """列出目录内容，depth 为递归深度，返回 EntryInfo 列表"""
+        self._sandbox._round_trip()
+        return self._list(path, depth)
+
+    def exists(self, path):
+        self._sandbox._round_trip()
+        return os.path.exists(self._sandbox.local_path(path))
+
+    def remove(self, path):
+        """删除文件或目录"""
+        self._sandbox._round_trip()
+        self._remove(path)
+
+    def make_dir(self, path):
+        """创建目录（含父目录）；已存在时返回 False"""
+        self._sandbox._round_trip()
+        return self._make_dir(path)
+
+    def _list(self, path, depth):
+        sandbox = self._sandbox
+        if not path.startswith("/"):
+            path = "/home/user/" + path
+        entries = []
+        with os.scandir(sandbox.local_path(path)) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if path == "/" and entry.name == ".sandbox":
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entry_path = path.rstrip("/") + "/" + entry.name
+                entries.append(EntryInfo(
+                    name=entry.name,
+                    type="dir" if is_dir else "file",
+                    path=entry_path,
+                    size=stat.st_size,
+                    mode=stat.st_mode,
+                    modified_time=datetime.datetime.fromtimestamp(stat.st_mtime),
+                ))
+                if is_dir and depth and depth > 1:
+                    entries.extend(self._list(entry_path, depth - 1))
+        return entries
+
+    def _remove(self, path):
+        local_path = self._sandbox.local_path(path)
+        if os.path.isdir(local_path) and not os.path.islink(local_path):
+            shutil.rmtree(local_path)
+        elif os.path.lexists(local_path):
+            os.remove(local_path)
+
+    def _make_dir(self, path):
+        local_path = self._sandbox.local_path(path)
+        if os.path.isdir(local_path):
+            return False
+        os.makedirs(local_path)
+        return True
+
+    def _write(self, path, data):
+        local_path = self._sandbox.local_path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        if hasattr(data, "read"):
+            # 文件对象按块复制，不整体读入内存（对应 e2b 的流式上传）
+            with open(local_path, "wb") as f:
+                shutil.copyfileobj(data, f, _STREAM_CHUNK)
+            return
+        mode = "wb" if isinstance(data, (bytes, bytearray)) else "w"
+        with open(local_path, mode) as f:
+            f.write(data)
+
+    def _read(self, path, format):
+        local_path = self._sandbox.local_path(path)
+        if format == "stream":
+            return _iter_chunks(local_path)
+        with open(local_path, "rb" if format == "bytes" else "r") as f:
+            return f.read()
+
+
+class CommandExitException(RuntimeError):
+    """命令以非零退出码结束（对应 e2b 的 CommandExitException，带 CommandResult 的字段）"""
+
+    def __init__(self, stdout, stderr, exit_code, error=None):
+        super().__init__(f"Command exited with code {exit_code} and error:\n{stderr}")
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_code = exit_code
+        self.error = error
+
+
+class TimeoutException(RuntimeError):
+    """命令执行超时（对应 e2b 的 TimeoutException）"""
+
+
+def _raise_for_exit(result):
+    """与 e2b 一样：超时抛出 TimeoutException，非零退出码抛出 CommandExitException"""
+    if result.error:
+        raise TimeoutException(result.error)
+    if result.exit_code != 0:
+        raise CommandExitException(result.stdout, result.stderr, result.exit_code)
+    return result
+
+
+class CommandHandle:
+    """
+    后台命令句柄（对应 e2b 的 CommandHandle）
+
+    与 e2b 一样可以直接迭代，逐行产出 (stdout, stderr, pty) 三元组。迭代时按需从管道读取 stdout，
+    消费者跟不上时管道写满、沙箱内进程阻塞在写操作上（背压），迭代过的输出不再保留在句柄中。
+    与 e2b 一样，run(background=True) 时传给 run 的 on_stdout / on_stderr 不会被调用：
+    输出只在迭代句柄或 wait(on_stdout=..., on_stderr=...) 时送达，wait() 在非零退出码时抛出
+    CommandExitException。stdout 在第一次 wait() 或迭代时才开始读取。
+    """
+
+    def __init__(self, proc, on_stdout=None, on_stderr=None):
+        self.pid = proc.pid
+        self._proc = proc
+        self._stdout = []
+        self._stderr = []
+        self._on_stdout = on_stdout
+        self._on_stderr = on_stderr
+        self._stderr_lock = threading.Lock()
+        self._stdout_reader = threading.Thread(target=self._pump_stdout, daemon=True)
+        self._stderr_reader = threading.Thread(target=self._pump_stderr, daemon=True)
+        self._stderr_reader.start()
+        self._consuming = threading.Lock()
+        self._iterated = False
+
+    def _pump_stdout(self):
+        stream = self._proc.stdout
+        for line in iter(stream.readline, ""):
+            self._stdout.append(line)
+            if self._on_stdout:
+                self._on_stdout(line)
+        stream.close()
+
+    def _pump_stderr(self):
+        stream = self._proc.stderr
+        for line in iter(stream.readline, ""):
+            with self._stderr_lock:
+                self._stderr.append(line)
+                callback = self._on_stderr
+            if callback:
+                callback(line)
+        stream.close()
+
+    def __iter__(self):
+        with self._consuming:
+            if self._iterated or self._stdout_reader.ident is not None:
+                raise RuntimeError("command output is already being consumed")
+            self._iterated = True
+        return self._iterate()
+
+    def _iterate(self):
+        stderr_seen = 0
+        for line in iter(self._proc.stdout.readline, ""):
+            while stderr_seen < len(self._stderr):
+                yield None, self._stderr[stderr_seen], None
+                stderr_seen += 1
+            yield line, None, None
+        self._proc.stdout.close()
+        self._stderr_reader.join()
+        for line in self._stderr[stderr_seen:]:
+            yield None, line, None
+
+    def send_stdin(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        self._proc.stdin.write(data)
+        self._proc.stdin.flush()
+
+    def wait(self, on_pty=None, on_stdout=None, on_stderr=None, timeout=None):
+        """
+        等待命令结束并返回 CommandResult，期间把输出逐行交给 on_stdout / on_stderr
+
+        非零退出码时抛出 CommandExitException；timeout（秒）到达时终止进程并抛出 TimeoutException
+        （e2b 没有这个参数）。
+        """
+        with self._consuming:
+            if not self._iterated and self._stdout_reader.ident is None:
+                self._on_stdout = self._on_stdout or on_stdout
+                self._stdout_reader.start()
+        if on_stderr and not self._on_stderr:
+            # 已读到的 stderr 先补发，之后的由读取线程直接回调
+            with self._stderr_lock:
+                earlier = list(self._stderr)
+                self._on_stderr = on_stderr
+            for line in earlier:
+                on_stderr(line)
+        return _raise_for_exit(self._wait(timeout))
+
+    def _wait(self, timeout=None):
+        with self._consuming:
+            if not self._iterated and self._stdout_reader.ident is None:
+                self._stdout_reader.start()
+        error = None
+        try:
+            self._proc.wait(timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            self._kill_group()
+            self._proc.wait()
+            error = f"command timed out after {timeout}s"
+        if self._stdout_reader.ident is not None:
+            self._stdout_reader.join()
+        self._stderr_reader.join()
+        return CommandResult(stdout="".join(self._stdout), stderr="".join(self._stderr),
+                             exit_code=-1 if error else self._proc.returncode, error=error)
+
+    def kill(self):
+        if self._proc.poll() is not None:
+            return False
+        self._kill_group()
+        return True
+
+    def _kill_group(self):
+        _kill_group(self._proc.pid)
+
+
+class _LocalCommands:
+    """沙箱命令执行（对应 sandbox.commands）"""
+
+    def __init__(self, sandbox):
+        self._sandbox = sandbox
+        self._handles = {}
+
+    def run(self, cmd, background=False, envs=None, cwd=None, on_stdout=None,
+            on_stderr=None, stdin=False, timeout=60):
+        """
+        在沙箱目录中执行 shell 命令，返回 CommandResult
+
+        与 e2b 一样，前台命令非零退出时抛出 CommandExitException，超时抛出 TimeoutException。
+        background=True 时立即返回 CommandHandle；与 e2b 一样，此时 on_stdout / on_stderr 被忽略，
+        需要在 handle.wait(on_stdout=..., on_stderr=...) 中传入。前台执行时逐行回调输出。
+        """
+        sandbox = self._sandbox
+        sandbox._check_alive()
+        sandbox._round_trip()
+
+        env = dict(sandbox.envs)
+        if envs:
+            env.update(envs)
+
+        if background or on_stdout or on_stderr or stdin:
+            proc = subprocess.Popen(
+                sandbox.shell_command(cmd),
+                shell=True,
+                cwd=sandbox.local_path(cwd or "/home/user"),
+                env=env,
+                stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                start_new_session=True,
+            )
+            if background:
+                handle = CommandHandle(proc)
+            else:
+                handle = CommandHandle(proc, on_stdout=on_stdout, on_stderr=on_stderr)
+            # 只保留仍在运行的句柄，长时间运行的沙箱不会无限积累
+            self._handles = {pid: h for pid, h in self._handles.items()
+                             if h._proc.poll() is None}
+            self._handles[handle.pid] = handle
+            if background:
+                return handle
+            return _raise_for_exit(handle._wait(timeout))
+
+        proc = subprocess.Popen(
+            sandbox.shell_command(cmd),
+            shell=True,
+            cwd=sandbox.local_path(cwd or "/home/user"),
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc.pid)
+            proc.communicate()
+            raise TimeoutException(f"command timed out after {timeout}s")
+
+        return _raise_for_exit(CommandResult(stdout=stdout, stderr=stderr,
+                                             exit_code=proc.returncode))
+
+    def send_stdin(self, pid, data):
+        """向后台命令的 stdin 写入数据"""
+        self._sandbox._round_trip()
+        self._handles[pid].send_stdin(data)
+
+    def kill(self, pid):
+        """终止后台命令"""
+        handle = self._handles.pop(pid, None)
+        return handle.kill() if handle else False
+
+    def _kill_all(self):
+        for pid in list(self._handles):
+            self.kill(pid)
+
+
+def _kill_group(pid):
+    # shell=True 时真正的命令是 shell 的子进程，按进程组整体终止
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _decode(data):
+    if isinstance(data, bytes):
+        return data.decode(errors="replace")
+    return data or ""
+
+
+class LocalSandbox:
+    """
+    本地沙箱 - 提供与 e2b.Sandbox 相同的 create / files / commands / run_code / kill 接口
+
+    异步版本见 AsyncLocalSandbox（对应 e2b.AsyncSandbox）。
+
+    create_delay 可用于模拟远端沙箱的创建开销（E2B 约 2 秒），
+    latency 模拟每次 files / commands 请求经过云端隧道网关的往返延迟，
+    这样预热池、批量传输等优化的收益可以在本地复现和测量。
+    limits 为 ResourceLimits，限制沙箱内每条命令可用的内存 / CPU / 文件资源。
+    faults 为 FaultInjector，按共享的服务端负载注入延迟和失败（替代 create_delay / latency 的固定延迟）。
+    """
+
+    base_dir = os.environ.get("LOCAL_SANDBOX_BASE", tempfile.gettempdir())
+    _snapshot_names = {}    # 快照名 → snapshot_id
+
+    def __init__(self, root, sandbox_id, envs=None, latency=0.0, limits=None, cgroup=None,
+                 faults=None):
+        self.root = root
+        self.sandbox_id = sandbox_id
+        self.latency = latency
+        self.faults = faults
+        self.limits = limits
+        self.cgroup = cgroup
+        self.files = _LocalFiles(self)
+        self.commands = _LocalCommands(self)
+        self.execution_count = 0
+        self._killed = False
+        self._prefix = _limit_prefix(limits, cgroup)
+
+        hook_dir = os.path.join(root, ".sandbox")
+        self.envs = dict(os.environ)
+        self.envs.update(envs or {})
+        self.envs.update({
+            "LOCAL_SANDBOX_ROOT": root,
+            "HOME": self.local_path("/home/user"),
+            "PYTHONPATH": hook_dir,
+        })
+
+    @classmethod
+    def create(cls, template=None, timeout=None, envs=None, create_delay=0.0, latency=0.0,
+               limits=None, faults=None, **kwargs):
+        """创建沙箱：准备私有根目录并注入路径映射钩子；template 为快照 ID / 名称时从快照克隆"""
+        if faults:
+            faults.request(create_delay)
+        elif create_delay:
+            time.sleep(create_delay)
+        return cls._prepare(envs, latency, source=cls._snapshot_path(template), limits=limits,
+                            faults=faults)
+
+    @classmethod
+    def connect(cls, sandbox_id, envs=None, latency=0.0, faults=None, **kwargs):
+        """按 ID 重新连接仍然存在的沙箱（例如协调器进程重启后）；沙箱不存在时抛出 ValueError"""
+        if faults:
+            faults.request(latency)
+        return cls._attach(sandbox_id, envs, latency, faults)
+
+    @classmethod
+    def _attach(cls, sandbox_id, envs=None, latency=0.0, faults=None):
+        roots = glob.glob(os.path.join(glob.escape(cls.base_dir), f"{glob.escape(sandbox_id)}-*"))
+        roots = [root for root in roots if os.path.isdir(os.path.join(root, ".sandbox"))]
+        if not sandbox_id.startswith("local-") or not roots:
+            raise ValueError(f"sandbox {sandbox_id} not found")
+        return cls(roots[0], sandbox_id, envs=envs, latency=latency, faults=faults)
+
+    @classmethod
+    def _prepare(cls, envs=None, latency=0.0, source=None, limits=None, faults=None):
+        sandbox_id = f"local-{uuid.uuid4().hex[:20]}"
+        if source:
+            root = os.path.join(cls.base_dir, f"{sandbox_id}-clone")
+            _clone_tree(source, root)
+        else:
+            root = tempfile.mkdtemp(prefix=f"{sandbox_id}-", dir=cls.base_dir)
+            for prefix in SANDBOX_PREFIXES:
+                os.makedirs(root + prefix, exist_ok=True)
+
+            hook_dir = os.path.join(root, ".sandbox")
+            os.makedirs(hook_dir)
+            with open(os.path.join(hook_dir, "sitecustomize.py"), "w") as f:
+                f.write(_SITE_HOOK)
+            with open(os.path.join(hook_dir, "_run_code.py"), "w") as f:
+                f.write(_RUN_CODE)
+
+        try:
+            cgroup = _create_cgroup(sandbox_id, limits)
+        except OSError:
+            shutil.rmtree(root, ignore_errors=True)
+            raise
+        return cls(root, sandbox_id, envs=envs, latency=latency, limits=limits, cgroup=cgroup,
+                   faults=faults)
+
+    @classmethod
+    def _snapshot_path(cls, template):
+        """把快照 ID / 名称解析为快照目录；不是快照时返回 None"""
+        if not template:
+            return None
+        snapshot_id = cls._snapshot_names.get(template, template)
+        if not snapshot_id.startswith("local-snap-"):
+            return None
+        path = os.path.join(cls.base_dir, snapshot_id)
+        if not os.path.isdir(path):
+            raise ValueError(f"snapshot {template} not found")
+        return path
+
+    def create_snapshot(self, name=None):
+        """把当前文件系统状态保存为快照，返回 SnapshotInfo（之后可用 create(snapshot_id) 克隆）"""
+        self._check_alive()
+        self._round_trip()
+        return self._snapshot(name)
+
+    def fork(self, timeout=None, count=None):
+        """克隆当前沙箱，返回 count 个新沙箱的列表（与 e2b 一致，失败的位置是异常对象）"""
+        self._check_alive()
+        self._round_trip()
+        return self._fork(count)
+
+    def _snapshot(self, name):
+        snapshot_id = f"local-snap-{uuid.uuid4().hex[:20]}"
+        _clone_tree(self.root, os.path.join(self.base_dir, snapshot_id))
+        names = []
+        if name:
+            type(self)._snapshot_names[name] = snapshot_id
+            names.append(name)
+        return SnapshotInfo(snapshot_id=snapshot_id, names=names)
+
+    def _fork(self, count):
+        sandboxes = []
+        for _ in range(count or 1):
+            try:
+                sandboxes.append(type(self)._prepare(self.envs, self.latency, source=self.root,
+                                                     limits=self.limits, faults=self.faults))
+            except Exception as e:
+                sandboxes.append(e)
+        return sandboxes
+
+    @classmethod
+    def delete_snapshot(cls, snapshot_id):
+        """删除快照；快照不存在时返回 False"""
+        path = os.path.join(cls.base_dir, cls._snapshot_names.get(snapshot_id, snapshot_id))
+        for name, target in list(cls._snapshot_names.items()):
+            if snapshot_id in (name, target):
+                del cls._snapshot_names[name]
+        if not os.path.basename(path).startswith("local-snap-") or not os.path.isdir(path):
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def local_path(self, path):
+        """把沙箱内路径映射为宿主机路径"""
+        if not path.startswith("/"):
+            path = "/home/user/" + path
+        return self.root + path
+
+    def rewrite(self, cmd):
+        """改写命令行中的沙箱路径"""
+        return _PATH_PATTERN.sub(lambda m: self.root + m.group(1), cmd)
+
+    def shell_command(self, cmd):
+        """改写路径并加上资源限制前缀，得到交给 /bin/sh 执行的命令"""
+        cmd = self.rewrite(cmd)
+        if not self._prefix:
+            return cmd
+        return f"{self._prefix} && {{\n{cmd}\n}}"
+
+    def run_code(self, code, language=None, envs=None, timeout=60, **kwargs):
+        """
+        执行一段 Python 代码（对应 e2b Code Interpreter 的 run_code）
+
+        最后一个表达式的值放在 results 中，异常放在 error 中，不会抛出。
+        每次调用都在新的解释器进程中执行，变量不会保留到下一次调用。
+        """
+        self._check_alive()
+        self._round_trip()
+        proc, out_path = self._start_code(language, envs)
+        try:
+            stdout, stderr = proc.communicate(code, timeout=timeout or None)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc.pid)
+            stdout, stderr = proc.communicate()
+            return self._execution(stdout, stderr, out_path, timeout)
+        return self._execution(stdout, stderr, out_path)
+
+    def _start_code(self, language, envs):
+        cmd, env, out_path = self._code_command(language, envs)
+        proc = subprocess.Popen(
+            cmd,
+            shell=True,
+            cwd=self.local_path("/home/user"),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        return proc, out_path
+
+    def _code_command(self, language, envs):
+        if language not in (None, "python", "py"):
+            raise ValueError(f"unsupported language: {language}")
+        env = dict(self.envs)
+        if envs:
+            env.update(envs)
+        # 执行器在 PYTHONPATH（.sandbox 目录）中，结果文件放在沙箱的 /tmp 下
+        out_path = f"/tmp/.run_code-{uuid.uuid4().hex}.json"
+        cmd = self.shell_command(f"python3 -m _run_code {out_path}")
+        return cmd, env, self.local_path(out_path)
+
+    def _execution(self, stdout, stderr, out_path, timed_out=None):
+        self.execution_count += 1
+        execution = Execution(logs=Logs(stdout=[stdout] if stdout else [],
+                                        stderr=[stderr] if stderr else []),
+                              execution_count=self.execution_count)
+        try:
+            with open(out_path) as f:
+                result = json.load(f)
+            os.remove(out_path)
+        except (OSError, ValueError):
+            result = None
+
+        if result is None:
+            # 进程被杀（超时 / 超出资源限制）时没有结果文件
+            if timed_out:
+                execution.error = ExecutionError(
+                    "TimeoutError", f"execution timed out after {timed_out}s", "")
+            else:
+                lines = stderr.strip().splitlines()
+                execution.error = ExecutionError(
+                    "ProcessError", lines[-1] if lines else "process exited without result",
+                    stderr)
+            return execution
+        if result["text"] is not None:
+            execution.results.append(Result(text=result["text"]))
+        if result["error"]:
+            execution.error = ExecutionError(**result["error"])
+        return execution
+
+    def _round_trip(self):
+        if self.faults:
+            self.faults.request(self.latency)
+        elif self.latency:
+            time.sleep(self.latency)
+        # 请求 "到达" 时沙箱可能已被其他线程销毁，不能再写入已删除的根目录
+        self._check_alive()
+
+    async def _async_round_trip(self):
+        if self.faults:
+            await self.faults.arequest(self.latency)
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+        self._check_alive()
+
+    def is_running(self):
+        return not self._killed
+
+    def _check_alive(self):
+        if self._killed:
+            raise RuntimeError(f"sandbox {self.sandbox_id} has been killed")
+
+    def kill(self):
+        """销毁沙箱，删除私有根目录"""
+        if self._killed:
+            return False
+        self._killed = True
+        if isinstance(self.commands, _LocalCommands):
+            self.commands._kill_all()
+        shutil.rmtree(self.root, ignore_errors=True)
+        if self.cgroup:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                pass
+        return True
+
+
+class _AsyncLocalFiles(_LocalFiles):
+    """异步文件接口（对应 AsyncSandbox.files）"""
+
+    async def write(self, path, data):
+        await self._sandbox._async_round_trip()
+        self._write(path, data)
+
+    async def write_files(self, files):
+        await self._sandbox._async_round_trip()
+        for entry in files:
+            self._write(entry["path"], entry["data"])
+
+    async def read(self, path, format="text"):
+        await self._sandbox._async_round_trip()
+        return self._read(path, format)
+
+    async def list(self, path, depth=1):
+        await self._sandbox._async_round_trip()
+        return self._list(path, depth)
+
+    async def exists(self, path):
+        await self._sandbox._async_round_trip()
+        return os.path.exists(self._sandbox.local_path(path))
+
+    async def remove(self, path):
+        await self._sandbox._async_round_trip()
+        self._remove(path)
+
+    async def make_dir(self, path):
+        await self._sandbox._async_round_trip()
+        return self._make_dir(path)
+
+
+class _AsyncLocalCommands:
+    """异步命令执行：基于 asyncio 子进程，不占用事件循环"""
+
+    def __init__(self, sandbox):
+        self._sandbox = sandbox
+
+    async def run(self, cmd, envs=None, cwd=None, timeout=60):
+        sandbox = self._sandbox
+        sandbox._check_alive()
+        await sandbox._async_round_trip()
+
+        env = dict(sandbox.envs)
+        if envs:
+            env.update(envs)
+
+        proc = await asyncio.create_subprocess_shell(
+            sandbox.shell_command(cmd),
+            cwd=sandbox.local_path(cwd or "/home/user"),
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            _kill_group(proc.pid)
+            await proc.wait()
+            raise TimeoutException(f"command timed out after {timeout}s")
+
+        return _raise_for_exit(CommandResult(stdout=_decode(stdout), stderr=_decode(stderr),
+                                             exit_code=proc.returncode))
+
+
+class AsyncLocalSandbox(LocalSandbox):
+    """本地沙箱的异步版本 - 对应 e2b.AsyncSandbox"""
+
+    def __init__(self, root, sandbox_id, envs=None, latency=0.0, limits=None, cgroup=None,
+                 faults=None):
+        super().__init__(root, sandbox_id, envs=envs, latency=latency, limits=limits,
+                         cgroup=cgroup, faults=faults)
+        self.files = _AsyncLocalFiles(self)
+        self.commands = _AsyncLocalCommands(self)
+
+    @classmethod
+    async def create(cls, template=None, timeout=None, envs=None, create_delay=0.0,
+                     latency=0.0, limits=None, faults=None, **kwargs):
+        if faults:
+            await faults.arequest(create_delay)
+        elif create_delay:
+            await asyncio.sleep(create_delay)
+        return cls._prepare(envs, latency, source=cls._snapshot_path(template), limits=limits,
+                            faults=faults)
+
+    @classmethod
+    async def connect(cls, sandbox_id, envs=None, latency=0.0, faults=None, **kwargs):
+        if faults:
+            await faults.arequest(latency)
+        return cls._attach(sandbox_id, envs, latency, faults)
+
+    async def run_code(self, code, language=None, envs=None, timeout=60, **kwargs):
+        self._check_alive()
+        await self._async_round_trip()
+        cmd, env, out_path = self._code_command(language, envs)
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            cwd=self.local_path("/home/user"),
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(code.encode()), timeout)
+        except asyncio.TimeoutError:
+            _kill_group(proc.pid)
+            await proc.wait()
+            return self._execution("", "", out_path, timeout)
+        return self._execution(_decode(stdout), _decode(stderr), out_path)
+
+    async def create_snapshot(self, name=None):
+        self._check_alive()
+        await self._async_round_trip()
+        return self._snapshot(name)
+
+    async def fork(self, timeout=None, count=None):
+        self._check_alive()
+        await self._async_round_trip()
+        return self._fork(count)
+
+    @classmethod
+    async def delete_snapshot(cls, snapshot_id):
+        return LocalSandbox.delete_snapshot.__func__(cls, snapshot_id)
+
+    async def kill(self):
+        return LocalSandbox.kill(self)
+
+
+def install():
+    """把 e2b.Sandbox / AsyncSandbox 替换为本地沙箱（未安装 e2b 时注册一个同名模块）"""
+    e2b = sys.modules.get("e2b")
+    if e2b is None:
+        try:
+            import e2b
+        except ImportError:
+            e2b = sys.modules["e2b"] = types.ModuleType("e2b")
+    e2b.Sandbox = LocalSandbox
+    e2b.AsyncSandbox = AsyncLocalSandbox
+    if not hasattr(e2b, "CommandExitException"):
+        e2b.CommandExitException = CommandExitException
+    if not hasattr(e2b, "TimeoutException"):
+        e2b.TimeoutException = TimeoutException
+    return e2b
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+    import runpy
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="本地沙箱（离线）")
+    parser.add_argument("--run", metavar="SCRIPT", help="用本地沙箱运行一个 e2b 示例脚本")
+    parser.add_argument("--sandboxes", type=int, default=0,
+                        help="压测：同时存活的沙箱数（0 = 只运行演示）")
+    parser.add_argument("--concurrency", type=int, default=32, help="压测：并发创建 / 执行的线程数")
+    parser.add_argument("--memory-mb", type=int, default=256, help="每个沙箱的内存上限")
+    args = parser.parse_args()
+
+    if args.run:
+        install()
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.run)))
+        sys.argv = [args.run]
+        runpy.run_path(args.run, run_name="__main__")
+        sys.exit(0)
+
+    if not args.sandboxes:
+        sandbox = LocalSandbox.create(limits=ResourceLimits(memory_mb=args.memory_mb))
+        print(f"✅ 本地沙箱 ID: {sandbox.sandbox_id}")
+        try:
+            sandbox.files.write("/tmp/hello.py", "print(open('/tmp/msg.txt').read())")
+            sandbox.files.write("/tmp/msg.txt", "Hello from LocalSandbox!")
+            result = sandbox.commands.run("python3 /tmp/hello.py")
+            print(f"退出码: {result.exit_code}")
+            print(f"输出: {result.stdout.strip()}")
+            print(f"文件: {[entry.path for entry in sandbox.files.list('/tmp')]}")
+
+            execution = sandbox.run_code("import math\nprint('run_code')\nmath.sqrt(2)")
+            print(f"run_code: logs={execution.logs.stdout} text={execution.text}")
+            execution = sandbox.run_code(f"x = bytearray({args.memory_mb * 2} << 20)")
+            print(f"超出内存上限: {execution.error.name}")
+        finally:
+            sandbox.kill()
+            print("🧹 沙箱已清理")
+        sys.exit(0)
+
+    from sandbox_pool import _percentile
+
+    limits = ResourceLimits(memory_mb=args.memory_mb, max_open_files=256)
+    print("=" * 60)
+    print(f"本地沙箱压测: {args.sandboxes} 个同时存活的沙箱, 并发 {args.concurrency}")
+    print("=" * 60)
+
+    def timed(fn, *fn_args):
+        start = time.perf_counter()
+        value = fn(*fn_args)
+        return value, (time.perf_counter() - start) * 1000
+
+    def create(_):
+        return timed(LocalSandbox.create, None, None, None, 0.0, 0.0, limits)
+
+    def execute(sandbox):
+        result, elapsed = timed(sandbox.commands.run, "echo ok > /tmp/out.txt && cat /tmp/out.txt")
+        assert result.stdout == "ok\n", result.stderr
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        created = list(executor.map(create, range(args.sandboxes)))
+        sandboxes = [sandbox for sandbox, _ in created]
+        create_ms = [elapsed for _, elapsed in created]
+        create_total = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_ms = list(executor.map(execute, sandboxes))
+        run_total = time.perf_counter() - start
+
+        code_ms = []
+        for sandbox in sandboxes[:100]:
+            execution, elapsed = timed(sandbox.run_code, "sum(range(1000))")
+            assert execution.text == "499500", execution.error
+            code_ms.append(elapsed)
+
+        disk = sum(os.path.getsize(os.path.join(d, f))
+                   for d, _, names in os.walk(sandboxes[0].root) for f in names)
+        start = time.perf_counter()
+        list(executor.map(LocalSandbox.kill, sandboxes))
+        kill_total = time.perf_counter() - start
+
+    def report(label, values, total=None):
+        line = (f"   {label:<12} p50={_percentile(values, 50):7.1f} ms"
+                f"   p99={_percentile(values, 99):7.1f} ms")
+        if total is not None:
+            line += f"   总计 {total:.2f}s ({len(values) / total:.0f}/s)"
+        print(line)
+
+    report("create", create_ms, create_total)
+    report("commands.run", run_ms, run_total)
+    report("run_code", code_ms)
+    print(f"   kill         总计 {kill_total:.2f}s")
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\n📊 协调器内存峰值 {peak_mb:.0f} MB, 每个沙箱占用磁盘 {disk / 1024:.1f} KB")
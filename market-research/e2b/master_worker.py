@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+流水线式 Master-Worker 调度
+
+multi_sandbox_agents.py 场景 3 原来的做法：等 Master 打印完全部任务，
+再串行执行 worker_tasks[:3]，并且每个任务都新建、销毁一个沙箱。
+
+MasterWorker 的做法：
+- 有界工作队列：submit() 在队列满时阻塞，Master 的产出速度被 Worker 的消费速度约束（背压）
+- 常驻 Worker：每个 Worker 线程持有一个长期存活的沙箱（默认通过常驻 Agent Host 执行任务），
+  主动从队列拉取任务，不再每个任务创建一次沙箱
+- 动态伸缩：有积压且没有空闲 Worker 时扩容（不超过 max_workers），
+  Worker 空闲超过 idle_timeout 时缩容（不少于 min_workers）
+- 失败重试：失败的任务优先交给还没执行过它的 Worker 重试，最多 max_attempts 次；
+  超时或沙箱异常的 Worker 会重建自己的沙箱
+- 吞吐指标：tasks/s、队列深度、Worker 利用率等（metrics()）
+
+Worker 脚本与 orchestrator_pattern.py 中 agent 的约定相同：从 input_data 变量
+（或 AGENT_INPUT 指向的文件）读取任务，把结果以 JSON 打印到 stdout。
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from agent_host import AgentHost, AgentHostError, AgentHostTimeout
+from fan_out import command_result
+
+WORKER_PATH = "/home/user/worker.py"
+INPUT_DIR = "/home/user/work"
+
+
+@dataclass
+class WorkItem:
+    """队列中的一个任务"""
+    task_id: object
+    payload: object
+    future: Future = field(default_factory=Future, repr=False)
+    attempts: int = 0
+    tried: set = field(default_factory=set)
+    submitted: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class WorkResult:
+    """任务的最终结果（成功，或重试次数用尽后的失败）"""
+    task_id: object
+    output: object = None
+    error: str = None
+    worker_id: int = None
+    attempts: int = 0
+    latency: float = 0.0    # 从提交到完成的总耗时（含排队和重试）
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@dataclass
+class _Worker:
+    worker_id: int
+    sandbox: object = None
+    host: object = None
+    thread: object = None
+    busy: float = 0.0
+    tasks: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+
+def _default_factory():
+    from e2b import Sandbox
+    return Sandbox.create()
+
+
+class MasterWorker:
+    """
+    Master-Worker 任务调度器
+
+    用法：
+        with MasterWorker(WORKER_SCRIPT, max_workers=4) as workers:
+            futures = [workers.submit(task) for task in tasks]
+            results = [f.result() for f in futures]
+            print(workers.metrics())
+
+    worker_script:  Worker 在沙箱内执行的脚本
+    factory:        创建沙箱的函数，默认 e2b Sandbox.create（也可以传 SandboxPool.lease）
+    queue_size:     工作队列容量，队列满时 submit 阻塞
+    max_attempts:   单个任务最多执行次数（含首次）
+    use_agent_host: 通过常驻 Agent Host 执行任务；False 时每个任务写输入文件并启动新进程
+    """
+
+    def __init__(self, worker_script, factory=None, min_workers=1, max_workers=4,
+                 queue_size=64, max_attempts=3, task_timeout=60, idle_timeout=30.0,
+                 use_agent_host=True):
+        self.worker_script = worker_script
+        self.factory = factory or _default_factory
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers, 1)
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.task_timeout = task_timeout
+        self.idle_timeout = idle_timeout
+        self.use_agent_host = use_agent_host
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._retry = deque()
+        self._workers = {}
+        self._threads = []      # 仍可能在运行的 Worker 线程（含已退出活动集合、正在销毁沙箱的）
+        self._idle = 0          # 空闲或正在启动的 Worker 数
+        self._inflight = 0
+        self._closed = False
+        self._started_at = None
+        self._ids = itertools.count(1)
+        self._task_ids = itertools.count(1)
+        self._retired_busy = 0.0
+        self._retired_alive = 0.0
+        self.stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "retried": 0,
+            "workers_started": 0, "workers_stopped": 0, "sandbox_failures": 0,
+            "max_queue_depth": 0, "peak_workers": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动 min_workers 个 Worker"""
+        with self._cond:
+            if self._started_at is None and not self._closed:
+                self._started_at = time.perf_counter()
+                for _ in range(self.min_workers):
+                    self._spawn()
+        return self
+
+    def submit(self, payload, task_id=None):
+        """提交任务，返回 Future（结果为 WorkResult）；队列满时阻塞"""
+        self.start()
+        item = WorkItem(task_id=task_id if task_id is not None else next(self._task_ids),
+                        payload=payload)
+        with self._cond:
+            while not self._closed and len(self._queue) >= self.queue_size:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("MasterWorker is closed")
+            self._queue.append(item)
+            self.stats["submitted"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue_depth)
+            self._scale_up()
+            self._cond.notify_all()
+        return item.future
+
+    def map(self, payloads):
+        """提交一批任务并按提交顺序返回 WorkResult 列表"""
+        futures = [self.submit(payload) for payload in payloads]
+        return [future.result() for future in futures]
+
+    @property
+    def queue_depth(self):
+        return len(self._queue) + len(self._retry)
+
+    def metrics(self):
+        """吞吐指标快照"""
+        now = time.perf_counter()
+        with self._cond:
+            elapsed = now - (self._started_at or now)
+            live = list(self._workers.values())
+            busy = self._retired_busy + sum(w.busy for w in live)
+            alive = self._retired_alive + sum(now - w.started for w in live)
+            return {
+                **self.stats,
+                "elapsed": elapsed,
+                "tasks_per_sec": self.stats["completed"] / elapsed if elapsed else 0.0,
+                "queue_depth": self.queue_depth,
+                "inflight": self._inflight,
+                "workers": len(live),
+                "utilization": busy / alive if alive else 0.0,
+            }
+
+    def close(self, cancel_pending=False):
+        """
+        停止接收新任务，等待队列中的任务执行完后销毁所有 Worker 沙箱
+
+        cancel_pending=True 时尚未开始的任务直接以失败结束。
+        """
+        cancelled = []
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                cancelled = list(self._queue) + list(self._retry)
+                self._queue.clear()
+                self._retry.clear()
+            self._cond.notify_all()
+        for item in cancelled:
+            self._resolve(item, error="cancelled")
+        # 关闭前已在执行的重试可能刚扩容出新 Worker：反复等待，直到没有 Worker 线程仍在运行
+        while True:
+            with self._cond:
+                threads = [t for t in self._threads if t.is_alive()]
+            if not threads:
+                break
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # 伸缩
+    # ------------------------------------------------------------------
+
+    def _spawn(self):
+        """（持有锁）新增一个 Worker"""
+        worker = _Worker(worker_id=next(self._ids))
+        worker.thread = threading.Thread(target=self._worker_loop, args=(worker,),
+                                         name=f"worker-{worker.worker_id}", daemon=True)
+        self._workers[worker.worker_id] = worker
+        self._threads = [t for t in self._threads if t.is_alive()] + [worker.thread]
+        self._idle += 1
+        self.stats["workers_started"] += 1
+        self.stats["peak_workers"] = max(self.stats["peak_workers"], len(self._workers))
+        worker.thread.start()
+
+    def _scale_up(self):
+        """（持有锁）积压任务多于空闲 Worker 时扩容；close() 之后不再扩容，剩余任务由现有 Worker 执行完"""
+        if self._closed:
+            return
+        backlog = self.queue_depth - self._idle
+        room = self.max_workers - len(self._workers)
+        for _ in range(max(0, min(backlog, room))):
+            self._spawn()
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _worker_loop(self, worker):
+        while True:
+            try:
+                self._open(worker)
+            except Exception as e:
+                self._abandon(worker, f"{type(e).__name__}: {e}")
+                return
+            rebuild = self._serve(worker)
+            self._release_sandbox(worker)
+            if not rebuild:
+                return
+            # 卡住或损坏的沙箱直接重建，而不是继续接任务
+            with self._cond:
+                self.stats["sandbox_failures"] += 1
+
+    def _serve(self, worker):
+        """循环拉取并执行任务；返回 True 表示沙箱需要重建"""
+        while True:
+            item = self._take(worker)
+            if item is None:
+                return False
+            if self._execute(worker, item):
+                return True
+
+    def _open(self, worker):
+        worker.sandbox = self.factory()
+        worker.sandbox.files.write(WORKER_PATH, self.worker_script)
+        if self.use_agent_host:
+            worker.host = AgentHost(worker.sandbox).start()
+
+    def _release_sandbox(self, worker):
+        if worker.host is not None:
+            worker.host.close()
+            worker.host = None
+        if worker.sandbox is not None:
+            try:
+                worker.sandbox.kill()
+            except Exception:
+                pass
+            worker.sandbox = None
+
+    def _take(self, worker):
+        """取出一个该 Worker 可以执行的任务；缩容或关闭时返回 None"""
+        with self._cond:
+            deadline = time.perf_counter() + self.idle_timeout
+            while True:
+                item = self._pop_eligible(worker)
+                if item is not None:
+                    self._idle -= 1
+                    self._inflight += 1
+                    self._cond.notify_all()     # 唤醒因队列满而阻塞的 submit
+                    return item
+                if self._closed and self._inflight == 0 and not self.queue_depth:
+                    self._retire(worker)
+                    return None
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    if len(self._workers) > self.min_workers:
+                        self._retire(worker)
+                        return None
+                    deadline = time.perf_counter() + self.idle_timeout
+                    remaining = self.idle_timeout
+                self._cond.wait(remaining)
+
+    def _pop_eligible(self, worker):
+        # 重试任务优先，并尽量交给还没执行过它的 Worker
+        live = set(self._workers)
+        for item in self._retry:
+            if worker.worker_id not in item.tried or live <= item.tried:
+                self._retry.remove(item)
+                return item
+        if self._queue:
+            return self._queue.popleft()
+        return None
+
+    def _retire(self, worker):
+        """（持有锁）Worker 退出：从活动集合中移除"""
+        self._idle -= 1
+        self._workers.pop(worker.worker_id, None)
+        self._retired_busy += worker.busy
+        self._retired_alive += time.perf_counter() - worker.started
+        self.stats["workers_stopped"] += 1
+        self._cond.notify_all()
+
+    def _abandon(self, worker, error):
+        """Worker 的沙箱创建失败：退出；没有任何 Worker 时让积压任务失败，避免永久等待"""
+        self._release_sandbox(worker)
+        orphans = []
+        with self._cond:
+            self.stats["sandbox_failures"] += 1
+            self._retire(worker)
+            if not self._workers:
+                orphans = list(self._queue) + list(self._retry)
+                self._queue.clear()
+                self._retry.clear()
+                self._cond.notify_all()
+        for item in orphans:
+            self._resolve(item, error=f"no worker available: {error}")
+
+    def _execute(self, worker, item):
+        """执行一个任务，失败时放回重试队列；返回 True 表示 Worker 的沙箱已不可用"""
+        item.attempts += 1
+        start = time.perf_counter()
+        output = error = None
+        broken = False
+        try:
+            output = self._call(worker, item)
+        except AgentHostTimeout as e:
+            error, broken = str(e), True
+        except AgentHostError as e:
+            error = str(e)
+            # 常驻进程退出（例如脚本调用了 os._exit）：换一个新沙箱，不再把任务发给它
+            broken = worker.host is not None and not worker.host.alive
+        except Exception as e:
+            # 非零退出码已由 _call 转成 AgentHostError；命令超时或沙箱异常时换一个新沙箱
+            error, broken = f"{type(e).__name__}: {e}", True
+        worker.busy += time.perf_counter() - start
+        worker.tasks += 1
+
+        finished = True
+        with self._cond:
+            self._inflight -= 1
+            self._idle += 1
+            if error is not None and item.attempts < self.max_attempts:
+                item.tried.add(worker.worker_id)
+                self._retry.append(item)
+                self.stats["retried"] += 1
+                self._scale_up()
+                finished = False
+            self._cond.notify_all()
+        if finished:
+            self._resolve(item, output=output, error=error, worker_id=worker.worker_id)
+        return broken
+
+    def _call(self, worker, item):
+        if worker.host is not None:
+            return worker.host.call(WORKER_PATH, item.payload, timeout=self.task_timeout)
+
+        input_path = f"{INPUT_DIR}/{item.task_id}.json"
+        worker.sandbox.files.write(input_path, json.dumps(item.payload))
+        result = command_result(worker.sandbox.commands.run, f"python3 {WORKER_PATH}",
+                                envs={"AGENT_INPUT": input_path}, timeout=self.task_timeout)
+        if result.exit_code != 0:
+            raise AgentHostError(result.stderr.strip().splitlines()[-1] if result.stderr
+                                 else f"exit code {result.exit_code}")
+        return json.loads(result.stdout)
+
+    def _resolve(self, item, output=None, error=None, worker_id=None):
+        with self._cond:
+            self.stats["failed" if error else "completed"] += 1
+        item.future.set_result(WorkResult(
+            task_id=item.task_id, output=output, error=error, worker_id=worker_id,
+            attempts=item.attempts, latency=time.perf_counter() - item.submitted))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from command_stream import CommandStream
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="Master-Worker 调度离线演示（LocalSandbox）")
+    parser.add_argument("--tasks", type=int, default=40)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--create-delay", type=float, default=0.5)
+    parser.add_argument("--task-time", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.15)
+    args = parser.parse_args()
+
+    master_script = f"""
+import json, time
+for i in range({args.tasks}):
+    time.sleep(0.01)
+    print(json.dumps({{'task_id': i + 1, 'data_range': [i * 10, (i + 1) * 10]}}))
+"""
+    worker_script = f"""
+import json, os, random, time
+if 'input_data' not in globals():
+    with open(os.environ['AGENT_INPUT']) as f:
+        input_data = json.load(f)
+time.sleep({args.task_time})
+if random.random() < {args.failure_rate}:
+    raise RuntimeError('simulated worker failure')
+start, end = input_data['data_range']
+print(json.dumps({{'task_id': input_data['task_id'], 'processed_count': end - start}}))
+"""
+
+    def factory():
+        return LocalSandbox.create(create_delay=args.create_delay)
+
+    master = LocalSandbox.create()
+    try:
+        master.files.write("/tmp/master.py", master_script)
+        print("=" * 60)
+        print(f"Master-Worker: {args.tasks} 个任务, 最多 {args.max_workers} 个 Worker, "
+              f"失败率 {args.failure_rate:.0%}")
+        print("=" * 60)
+
+        futures = []
+        with MasterWorker(worker_script, factory=factory, max_workers=args.max_workers,
+                          queue_size=8, idle_timeout=2.0) as workers:
+            # 边读取 Master 输出边派发任务
+            with CommandStream(master, "python3 -u /tmp/master.py") as stream:
+                for task in stream.records():
+                    futures.append(workers.submit(task, task_id=task["task_id"]))
+            results = [future.result() for future in futures]
+            metrics = workers.metrics()
+    finally:
+        master.kill()
+
+    ok = [r for r in results if r.ok]
+    retried = [r for r in results if r.attempts > 1]
+    print(f"✅ 成功 {len(ok)}/{len(results)}, 经过重试的任务 {len(retried)} 个")
+    print(f"   处理记录总数: {sum(r.output['processed_count'] for r in ok)}")
+    print(f"📊 吞吐: {metrics['tasks_per_sec']:.1f} tasks/s, "
+          f"最大队列深度 {metrics['max_queue_depth']}, "
+          f"峰值 Worker {metrics['peak_workers']}, 利用率 {metrics['utilization']:.0%}")
+    print(f"   {metrics}")
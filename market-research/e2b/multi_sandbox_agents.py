@@ -12,6 +12,13 @@
 from pathlib import Path
 from dotenv import load_dotenv
 from e2b import Sandbox
+from admission import AdmissionController, AIMDLimit, limited_factory
+from artifacts import ArtifactStore
+from bulk_files import write_many
+from command_stream import CommandStream
+from fan_out import TaskSpec, fan_out_iter
+from master_worker import MasterWorker
+from snapshot_factory import SnapshotFactory
 import json
 import time
 
@@ -29,13 +36,10 @@ print("=" * 60)
 print("\n场景 1: 跨沙箱数据流水线")
 print("=" * 60)
 
-# Stage 1: 数据生成器 Agent
-print("\n📊 Stage 1: 数据生成器")
-sandbox1 = Sandbox.create()
-print(f"   沙箱 1 ID: {sandbox1.sandbox_id[:8]}...")
-
+# 三个阶段的脚本只在一个沙箱里上传一次，打成快照后每个阶段从快照克隆
 generate_script = """
 import json
+import os
 import random
 
 # 生成模拟数据
@@ -45,65 +49,42 @@ data = {
     'sensor_id': 'SENSOR_001'
 }
 
-# 输出 JSON 供外部程序使用
-print(json.dumps(data))
+# 输出写成产物文件，由协调器原样搬运到下一阶段
+os.makedirs('/home/user/artifacts', exist_ok=True)
+with open('/home/user/artifacts/stage1.json', 'w') as f:
+    json.dump(data, f)
 """
 
-sandbox1.files.write("/tmp/generate.py", generate_script)
-result1 = sandbox1.commands.run("python3 /tmp/generate.py")
-stage1_data = json.loads(result1.stdout)
-
-print(f"✅ 生成数据: {stage1_data}")
-
-# 清理沙箱1
-sandbox1.kill()
-print("   沙箱 1 已清理")
-
-# Stage 2: 数据处理器 Agent
-print("\n🔄 Stage 2: 数据处理器")
-sandbox2 = Sandbox.create()
-print(f"   沙箱 2 ID: {sandbox2.sandbox_id[:8]}...")
-
-# 将 stage1 的数据传入 stage2
-process_script = f"""
+process_script = """
 import json
+import os
 
-# 从外部接收数据
-input_data = {json.dumps(stage1_data)}
+# 从外部接收数据（AGENT_INPUT 指向协调器放入的产物）
+with open(os.environ['AGENT_INPUT']) as f:
+    input_data = json.load(f)
 
 # 处理数据：计算统计信息
 readings = input_data['sensor_readings']
-processed = {{
+processed = {
     'sensor_id': input_data['sensor_id'],
     'avg_temp': sum(readings) / len(readings),
     'max_temp': max(readings),
     'min_temp': min(readings),
     'sample_count': len(readings)
-}}
+}
 
-print(json.dumps(processed))
+os.makedirs('/home/user/artifacts', exist_ok=True)
+with open('/home/user/artifacts/stage2.json', 'w') as f:
+    json.dump(processed, f)
 """
 
-sandbox2.files.write("/tmp/process.py", process_script)
-result2 = sandbox2.commands.run("python3 /tmp/process.py")
-stage2_data = json.loads(result2.stdout)
-
-print(f"✅ 处理结果: {stage2_data}")
-
-# 清理沙箱2
-sandbox2.kill()
-print("   沙箱 2 已清理")
-
-# Stage 3: 报告生成器 Agent
-print("\n📝 Stage 3: 报告生成器")
-sandbox3 = Sandbox.create()
-print(f"   沙箱 3 ID: {sandbox3.sandbox_id[:8]}...")
-
 report_script = f"""
 import json
+import os
 
 # 从外部接收处理后的数据
-stats = {json.dumps(stage2_data)}
+with open(os.environ['AGENT_INPUT']) as f:
+    stats = json.load(f)
 
 # 生成报告
 report = f'''
@@ -119,13 +100,65 @@ report = f'''
 print(report)
 """
 
-sandbox3.files.write("/tmp/report.py", report_script)
-result3 = sandbox3.commands.run("python3 /tmp/report.py")
+
+def prepare_stage_sandbox(sandbox):
+    write_many(sandbox, {
+        "/tmp/generate.py": generate_script,
+        "/tmp/process.py": process_script,
+        "/tmp/report.py": report_script,
+    })
+
+
+stage_factory = SnapshotFactory(prepare_stage_sandbox, Sandbox.create)
+stage_factory.build()
+print(f"📸 阶段快照已就绪（{stage_factory.stats['build_time']:.2f}s，脚本只上传一次）")
+
+# Stage 1: 数据生成器 Agent
+print("\n📊 Stage 1: 数据生成器")
+sandbox1 = stage_factory()
+print(f"   沙箱 1 ID: {sandbox1.sandbox_id[:8]}...")
+
+# 协调器只搬运字节流，不解析也不把数据拼进下一阶段的脚本
+artifact_store = ArtifactStore()
+
+sandbox1.commands.run("python3 /tmp/generate.py")
+stage1_ref = artifact_store.put_from(sandbox1, "/home/user/artifacts/stage1.json")
+
+print(f"✅ 生成数据: {stage1_ref}")
+
+# 清理沙箱1（产物已保存在协调器的对象存储中）
+sandbox1.kill()
+print("   沙箱 1 已清理")
+
+# Stage 2: 数据处理器 Agent
+print("\n🔄 Stage 2: 数据处理器")
+sandbox2 = stage_factory()
+print(f"   沙箱 2 ID: {sandbox2.sandbox_id[:8]}...")
+
+stage1_path = artifact_store.get_into(sandbox2, stage1_ref, "/home/user/artifacts/stage1.json")
+sandbox2.commands.run("python3 /tmp/process.py", envs={"AGENT_INPUT": stage1_path})
+stage2_ref = artifact_store.put_from(sandbox2, "/home/user/artifacts/stage2.json")
+
+print(f"✅ 处理结果: {stage2_ref}")
+
+# 清理沙箱2
+sandbox2.kill()
+print("   沙箱 2 已清理")
+
+# Stage 3: 报告生成器 Agent
+print("\n📝 Stage 3: 报告生成器")
+sandbox3 = stage_factory()
+print(f"   沙箱 3 ID: {sandbox3.sandbox_id[:8]}...")
+
+stage2_path = artifact_store.get_into(sandbox3, stage2_ref, "/home/user/artifacts/stage2.json")
+result3 = sandbox3.commands.run("python3 /tmp/report.py", envs={"AGENT_INPUT": stage2_path})
 
 print(f"✅ 最终报告:\n{result3.stdout}")
 
 # 清理沙箱3
 sandbox3.kill()
+artifact_store.close()
+stage_factory.close()
 print("   沙箱 3 已清理")
 
 # ============================================
@@ -142,21 +175,16 @@ tasks = [
     {"task_id": 3, "operation": "average", "data": [10, 20, 30, 40]}
 ]
 
-# 为每个任务创建独立沙箱
-sandboxes = []
-results = []
-
-print(f"\n🚀 启动 {len(tasks)} 个并行 Agents...")
-
-for i, task in enumerate(tasks, 1):
-    print(f"\n🤖 Agent {i}: {task['operation']}")
+# 沙箱创建经过自适应准入控制：任务扩大到成百上千个时，
+# 同时发起的 Sandbox.create 数随控制面的延迟和错误自动收敛，而不是一次性打满配额
+create_admission = AdmissionController(AIMDLimit(initial=8), timeout=120, name="create")
+sandbox_factory = limited_factory(Sandbox.create, create=create_admission)
 
-    # 创建沙箱
-    sb = Sandbox.create()
-    sandboxes.append(sb)
-    print(f"   沙箱 ID: {sb.sandbox_id[:8]}...")
+print(f"\n🚀 启动 {len(tasks)} 个并行 Agents（最多同时 {len(tasks)} 个沙箱）...")
 
-    # 创建任务脚本
+# 为每个任务生成脚本，交给扇出执行器并发执行
+task_specs = []
+for task in tasks:
     task_script = f"""
 import json
 
@@ -183,25 +211,28 @@ output = {{
 
 print(json.dumps(output))
 """
+    task_specs.append(TaskSpec(script=task_script, name=task['operation']))
 
-    # 执行任务
-    sb.files.write(f"/tmp/task_{i}.py", task_script)
-    result = sb.commands.run(f"python3 /tmp/task_{i}.py")
+# 按完成顺序输出；每个沙箱在任务结束（无论成败）后立即被 kill
+results = []
+parallel_start = time.time()
+for r in fan_out_iter(task_specs, factory=sandbox_factory, max_concurrency=len(tasks), timeout=60):
+    if r.ok:
+        results.append(r.output)
+        print(f"   🤖 Agent {r.index} ({r.name}) 沙箱 {r.sandbox_id[:8]}... ✅ 结果: {r.output['result']}")
+    else:
+        print(f"   🤖 Agent {r.index} ({r.name}) ❌ 失败: {r.error}")
 
-    task_result = json.loads(result.stdout)
-    results.append(task_result)
-    print(f"   ✅ 结果: {task_result['result']}")
+print(f"\n⏱️  并行耗时: {time.time() - parallel_start:.2f}s（串行需要累加每个沙箱的创建和执行时间）")
 
 # 汇总结果
 print("\n📊 汇总所有 Agent 结果:")
-for r in results:
+for r in sorted(results, key=lambda r: r['task_id']):
     print(f"   Task {r['task_id']} ({r['operation']}): {r['result']}")
-
-# 清理所有沙箱
-print("\n🧹 清理所有沙箱...")
-for i, sb in enumerate(sandboxes, 1):
-    sb.kill()
-    print(f"   ✅ 沙箱 {i} 已清理")
+print("🧹 所有沙箱已由扇出执行器清理")
+admission = create_admission.metrics()
+print(f"🚦 创建准入: 并发上限 {admission['limit']}, 最多排队 {admission['max_queued']}, "
+      f"失败 {admission['dropped']}, 创建 p99 {admission['rtt_p99_ms']:.0f} ms")
 
 # ============================================
 # 场景 3: Master-Worker 模式
@@ -234,54 +265,61 @@ for task in tasks:
 """
 
 master_sandbox.files.write("/tmp/master.py", master_script)
-result = master_sandbox.commands.run("python3 /tmp/master.py")
-
-# 解析任务
-worker_tasks = [json.loads(line) for line in result.stdout.strip().split('\n')]
-print(f"✅ Master 生成了 {len(worker_tasks)} 个任务")
-
-master_sandbox.kill()
-
-# Worker Agents
-print("\n👷 Worker Agents: 执行任务")
-worker_results = []
 
-for task in worker_tasks[:3]:  # 只执行前3个，节省资源
-    print(f"\n   Worker {task['worker_id']}: {task['task']}")
-
-    # 创建 worker 沙箱
-    worker_sb = Sandbox.create()
-
-    worker_script = f"""
+# Worker 脚本：常驻 Worker 沙箱通过 input_data 接收任务
+#    不使用 Agent Host 时（use_agent_host=False）从 AGENT_INPUT 指向的文件读取
+worker_script = """
 import json
+import os
 
-task = {json.dumps(task)}
+if 'input_data' not in globals():
+    with open(os.environ.get('AGENT_INPUT', '/home/user/input.json'), 'r') as f:
+        input_data = json.load(f)
+
+task = input_data
 start, end = task['data_range']
 
 # 模拟处理
-result = {{
+result = {
     'worker_id': task['worker_id'],
     'task': task['task'],
     'processed_count': end - start,
     'status': 'completed'
-}}
+}
 
 print(json.dumps(result))
 """
 
-    worker_sb.files.write("/tmp/worker.py", worker_script)
-    result = worker_sb.commands.run("python3 /tmp/worker.py")
-
-    worker_result = json.loads(result.stdout)
-    worker_results.append(worker_result)
-    print(f"      ✅ 处理了 {worker_result['processed_count']} 条记录")
-
-    worker_sb.kill()
+# 流式读取 Master 的输出：每收到一行任务就放入有界队列，
+# 由固定的常驻 Worker 沙箱拉取执行（失败的任务自动换一个 Worker 重试）
+print("\n👷 Worker Agents: 执行任务（边接收边派发）")
+worker_futures = []
+with MasterWorker(worker_script, factory=sandbox_factory, max_workers=3,
+                  queue_size=10) as workers:
+    with CommandStream(master_sandbox, "python3 -u /tmp/master.py") as stream:
+        for task in stream.records():
+            print(f"   📨 收到 {task['task']}，放入工作队列")
+            worker_futures.append(workers.submit(task))
+    print(f"✅ Master 生成了 {len(worker_futures)} 个任务")
+    master_sandbox.kill()
+
+    worker_results = []
+    for future in worker_futures:
+        r = future.result()
+        if r.ok:
+            worker_results.append(r.output)
+            print(f"   Worker 沙箱 #{r.worker_id}: {r.output['task']} "
+                  f"✅ 处理了 {r.output['processed_count']} 条记录")
+        else:
+            print(f"   ❌ 任务 {r.task_id} 失败（尝试 {r.attempts} 次）: {r.error}")
+    metrics = workers.metrics()
 
 # 汇总 Worker 结果
 print("\n📊 所有 Workers 完成:")
 total_processed = sum(r['processed_count'] for r in worker_results)
 print(f"   总共处理: {total_processed} 条记录")
+print(f"   吞吐 {metrics['tasks_per_sec']:.1f} tasks/s, 峰值 Worker {metrics['peak_workers']} 个, "
+      f"利用率 {metrics['utilization']:.0%}")
 
 # ============================================
 # 场景 4: 使用外部存储协调（模拟）
@@ -346,7 +384,7 @@ print("=" * 60)
 
 print("\n💡 Multi-Sandbox Agents 协作模式:")
 print("   1. 流水线模式 - 数据在沙箱间传递，每阶段独立运行")
-print("   2. 并行处理 - 多个沙箱同时处理不同任务")
+print("   2. 并行处理 - 多个沙箱同时处理不同任务（fan_out.py 扇出执行器）")
 print("   3. Master-Worker - 主控调度，工作器执行")
 print("   4. 外部协调 - 通过外部状态管理器协调多沙箱")
 
@@ -358,5 +396,5 @@ print("   - 并行性（真正的并行执行）")
 
 print("\n⚠️  注意:")
 print("   - 每个沙箱都需要资源和费用")
-print("   - 创建沙箱有时间开销（约2秒）")
+print("   - 创建沙箱有时间开销（约2秒，可用 benchmark_suite.py --backend e2b 实测）")
 print("   - 需要外部协调机制传递数据")
@@ -9,14 +9,132 @@ Agent 协调器模式演示
 from pathlib import Path
 from dotenv import load_dotenv
 from e2b import Sandbox
+from agent_host import AgentHost, AgentHostError
+from bulk_files import write_many
+from codec import DEFAULT_CODEC
+from command_stream import CommandStream
+from dag_workflow import DagWorkflow, Step
+from fan_out import command_result
+from resilience import NO_RETRY, LatencyTracker, hedged_call, retry_call
+from step_cache import DEFAULT_POLICY
+from tracing import NULL_TRACER
+from concurrent.futures import ThreadPoolExecutor, wait
+import itertools
 import json
+import time
 
 # 加载 API Key
 load_dotenv(Path(__file__).parent / '.env')
 
-print("=" * 60)
-print("Agent 协调器模式演示")
-print("=" * 60)
+# Agent A: 数据分析
+AGENT_A_SCRIPT = """
+import json
+import os
+import sys
+
+# 📍 Agent A 从文件读取输入（协调器写入的）
+#    在常驻 Agent Host 中运行时，输入已经以 input_data 变量注入
+if 'input_data' not in globals():
+    with open(os.environ.get('AGENT_INPUT', '/home/user/input.json'), 'r') as f:
+        input_data = json.load(f)
+
+# 执行分析
+data = input_data['data']
+analysis = {
+    'agent': 'Agent A',
+    'task': input_data['task'],
+    'total': sum(data),
+    'average': sum(data) / len(data),
+    'count': len(data)
+}
+
+# 📍 Agent A 将结果输出到 stdout（协调器会读取）
+print(json.dumps(analysis))
+
+# ⚠️ 注意：Agent A 不知道 Agent B 的存在
+# ⚠️ 注意：Agent A 不直接与 Agent B 通信
+"""
+
+# Agent B: 数据转换
+AGENT_B_SCRIPT = """
+import json
+import os
+
+# 📍 Agent B 从文件读取输入（协调器写入的，来自 Agent A）
+#    在常驻 Agent Host 中运行时，输入已经以 input_data 变量注入
+if 'input_data' not in globals():
+    with open(os.environ.get('AGENT_INPUT', '/home/user/input.json'), 'r') as f:
+        input_data = json.load(f)
+
+# 执行转换
+transformed = {
+    'agent': 'Agent B',
+    'previous_agent': input_data['agent'],
+    'total_sales': input_data['total'],
+    'avg_sales': input_data['average'],
+    'status': 'transformed'
+}
+
+# 📍 Agent B 将结果输出到 stdout（协调器会读取）
+print(json.dumps(transformed))
+
+# ⚠️ 注意：Agent B 不知道 Agent A 或 Agent C
+# ⚠️ 注意：数据是协调器传递的，不是 Agent A 直接传的
+"""
+
+# Agent C: 报告生成
+AGENT_C_SCRIPT = """
+import json
+import os
+
+# 📍 Agent C 从文件读取输入（协调器写入的，来自 Agent B）
+#    在常驻 Agent Host 中运行时，输入已经以 input_data 变量注入
+if 'input_data' not in globals():
+    with open(os.environ.get('AGENT_INPUT', '/home/user/input.json'), 'r') as f:
+        input_data = json.load(f)
+
+# 生成报告
+report = {
+    'agent': 'Agent C',
+    'report_type': 'Sales Summary',
+    'total_sales': f"${input_data['total_sales']}",
+    'average_sales': f"${input_data['avg_sales']:.2f}",
+    'status': input_data['status'],
+    'generated_by': f"{input_data['previous_agent']} → Agent C"
+}
+
+# 📍 Agent C 将结果输出到 stdout（协调器会读取）
+print(json.dumps(report))
+
+# ⚠️ 注意：Agent C 是工作流的最后一个环节
+# ⚠️ 注意：所有数据都是通过协调器流动的
+"""
+
+AGENT_SCRIPTS = {
+    "/home/user/agent_a.py": AGENT_A_SCRIPT,
+    "/home/user/agent_b.py": AGENT_B_SCRIPT,
+    "/home/user/agent_c.py": AGENT_C_SCRIPT,
+}
+
+# 示例工作流的初始输入
+INITIAL_INPUT = {
+    "task": "分析销售数据",
+    "data": [100, 150, 200, 180, 220]
+}
+
+# Agent A → Agent B → Agent C 以 DAG 的形式声明（同步和异步协调器共用）
+AGENT_WORKFLOW = DagWorkflow([
+    Step(name="agent_a", script=AGENT_SCRIPTS["/home/user/agent_a.py"],
+         path="/home/user/agent_a.py"),
+    Step(name="agent_b", script=AGENT_SCRIPTS["/home/user/agent_b.py"],
+         path="/home/user/agent_b.py", needs=("agent_a",)),
+    Step(name="agent_c", script=AGENT_SCRIPTS["/home/user/agent_c.py"],
+         path="/home/user/agent_c.py", needs=("agent_b",)),
+])
+
+# 步骤名 → run_agent 使用的 agent 名称（retry_policies / cache_policies 按它配置）
+AGENT_NAMES = {"agent_a": "Agent A", "agent_b": "Agent B", "agent_c": "Agent C"}
+
 
 class AgentOrchestrator:
     """
@@ -24,23 +142,89 @@ class AgentOrchestrator:
     1. 创建和管理 sandboxes
     2. 在 agents 之间传递数据
     3. 控制执行流程
+
+    传入 pool（SandboxPool）时从预热池租用沙箱，cleanup 时归还而不是销毁
+    use_agent_host=True 时在沙箱内启动常驻 Agent Host，run_agent 通过持久通道执行，
+    省去每一步的解释器冷启动和 input.json 文件读写
+    传入 script_cache（ScriptCache）时按内容哈希跳过沙箱中已有的 agent 脚本；
+    与预热池一起使用时把同一个 cache 传给 SandboxPool(script_cache=...)，池销毁沙箱时丢弃其记录
+    传入 tracer（tracing.Tracer）时为创建沙箱、每个 agent 的各阶段和清理记录 span，
+    可导出为 Chrome trace 查看延迟分布在哪里
+    传入 step_cache（step_cache.StepCache）时按 (脚本, 输入, template) 缓存 agent 输出，
+    cache_policies 按 agent 名称指定 CachePolicy（如 NO_CACHE）；
+    启用缓存后沙箱在第一次未命中时才创建，全部命中时不创建沙箱
+    codec（codec.JsonCodec / OrjsonCodec）决定输入输出的序列化方式，默认紧凑 JSON；
+    每个输入只编码一次，同一份 bytes 既写入沙箱也用于统计
+    retry_policy（resilience.RetryPolicy）为所有 agent 的默认重试策略，默认不重试；
+    retry_policies 按 agent 名称覆盖（执行失败、输出无法解析或抛出可重试异常时退避后重试）
+    传入 hedge（resilience.HedgePolicy）时额外准备一个备用沙箱：步骤超过其 p95 延迟仍未完成，
+    就在备用沙箱上启动副本，取先完成的结果；备用沙箱胜出时主备互换
     """
 
-    def __init__(self):
+    def __init__(self, pool=None, use_agent_host=False, script_cache=None, tracer=None,
+                 step_cache=None, cache_policies=None, template=None, codec=None,
+                 retry_policy=None, retry_policies=None, hedge=None):
+        if hedge and use_agent_host:
+            raise ValueError("hedge is not supported with use_agent_host")
         self.sandbox = None
+        self.retry_policy = retry_policy or NO_RETRY
+        self.retry_policies = retry_policies or {}
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.hedge_stats = {"launched": 0, "won": 0}
+        self._hedge_sandbox = None
+        self._hedge_ready = None    # 未完成时备用沙箱不可用（落后的副本仍在运行，或正在替换）
+        self._executor = None
+        self.codec = codec or DEFAULT_CODEC
+        self.step_cache = step_cache
+        self.cache_policies = cache_policies or {}
+        self.template = template
+        self._sandbox_deferred = False
+        self.tracer = tracer or NULL_TRACER
+        self.pool = pool
+        self.use_agent_host = use_agent_host
+        self.agent_host = None
+        self.script_cache = script_cache
+        self.script_paths = {}
         self.execution_log = []
+        self.last_run = None
 
     def log(self, message):
         """记录执行流程"""
         self.execution_log.append(message)
+        self.tracer.event(message)
         print(f"   📝 {message}")
 
     def create_sandbox(self):
-        """创建共享沙箱"""
-        self.sandbox = Sandbox.create()
-        self.log(f"创建沙箱: {self.sandbox.sandbox_id[:12]}...")
-
-    def run_agent(self, agent_name, script_path, input_data=None):
+        """创建共享沙箱（启用步骤缓存时推迟到第一次缓存未命中）"""
+        if self.step_cache and self.sandbox is None:
+            self._sandbox_deferred = True
+            self.log("启用步骤缓存: 第一次未命中时再创建沙箱")
+            return
+        self._open_sandbox()
+
+    def _open_sandbox(self):
+        with self.tracer.span("create_sandbox", pooled=bool(self.pool)) as span:
+            if self.pool:
+                self.sandbox = self.pool.lease()
+                self.log(f"从预热池租用沙箱: {self.sandbox.sandbox_id[:12]}...")
+            else:
+                self.sandbox = Sandbox.create()
+                self.log(f"创建沙箱: {self.sandbox.sandbox_id[:12]}...")
+            span.set(sandbox_id=self.sandbox.sandbox_id)
+
+        if self.hedge:
+            with self.tracer.span("create_sandbox", pooled=bool(self.pool), hedge=True):
+                self._hedge_sandbox = self.pool.lease() if self.pool else Sandbox.create()
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+            self.log(f"准备备用沙箱（对冲）: {self._hedge_sandbox.sandbox_id[:12]}...")
+
+        if self.use_agent_host:
+            with self.tracer.span("start_agent_host", sandbox_id=self.sandbox.sandbox_id):
+                self.agent_host = AgentHost(self.sandbox).start()
+            self.log("启动常驻 Agent Host")
+
+    def run_agent(self, agent_name, script_path, input_data=None, cache_policy=None):
         """
         运行单个 agent
 
@@ -52,36 +236,155 @@ class AgentOrchestrator:
         5. 协调器将输出传递给下一个 agent
 
         ⚠️ 注意：agents 之间没有直接通信！
+
+        启用步骤缓存时，相同的 (脚本, 输入) 命中缓存后直接返回，不进入沙箱。
+        cache_policy 覆盖 cache_policies 中为该 agent 指定的策略。
         """
         self.log(f"运行 {agent_name}")
+        policy = cache_policy or self.cache_policies.get(agent_name, DEFAULT_POLICY)
+        script = AGENT_SCRIPTS.get(script_path)
+        if not self.step_cache or not policy.enabled or script is None:
+            return self._run_step(agent_name, script_path, input_data)
+
+        output, hit = self.step_cache.get_or_run(
+            script, input_data, lambda: self._run_step(agent_name, script_path, input_data),
+            policy=policy, template=self.template)
+        self.tracer.event("step_cache", agent=agent_name, hit=hit)
+        if hit:
+            self.log("  ⚡ 步骤缓存命中，跳过沙箱执行")
+        return output
+
+    def _run_step(self, agent_name, script_path, input_data):
+        """按重试策略执行一个步骤；启用对冲时每次尝试都可能在备用沙箱上启动副本"""
+        self._ensure_sandbox()
+        policy = self.retry_policies.get(agent_name, self.retry_policy)
+
+        def attempt():
+            start = time.perf_counter()
+            output = self._run_hedged(agent_name, script_path, input_data)
+            if output is not None:
+                self.latency.record(agent_name, time.perf_counter() - start)
+            return output
 
-        # 📍 步骤 1: 协调器注入输入数据
-        if input_data:
-            self.sandbox.files.write(
-                "/home/user/input.json",
-                json.dumps(input_data, indent=2)
-            )
-            self.log(f"  → 协调器注入输入: {len(json.dumps(input_data))} bytes")
-
-        # 📍 步骤 2: 执行 agent
-        result = self.sandbox.commands.run(f"python3 {script_path}")
-
-        if result.exit_code != 0:
-            self.log(f"  ✗ Agent 执行失败: {result.stderr}")
-            return None
-
-        # 📍 步骤 3: 协调器提取输出
-        try:
-            output = json.loads(result.stdout)
+        def on_retry(attempt, error, delay):
+            self.tracer.event("retry", agent=agent_name, attempt=attempt, error=repr(error))
+            reason = f": {type(error).__name__}: {error}" if error else ""
+            self.log(f"  ↻ 第 {attempt} 次执行失败{reason}，{delay:.2f}s 后重试")
+
+        return retry_call(attempt, policy, on_retry=on_retry)
+
+    def _run_hedged(self, agent_name, script_path, input_data):
+        delay = self.hedge and self.latency.hedge_delay(agent_name, self.hedge)
+        busy = self._hedge_ready is not None and not self._hedge_ready.done()
+        backup = self._hedge_sandbox
+        if not delay or busy or backup is None:
+            return self._run_agent(agent_name, script_path, input_data)
+
+        def on_backup():
+            self.hedge_stats["launched"] += 1
+            self.tracer.event("hedge", agent=agent_name, delay_ms=delay * 1000)
+            self.log(f"  ⑂ 超过 {delay * 1000:.0f} ms 未完成，在备用沙箱上启动副本")
+            return self._run_agent(agent_name, script_path, input_data, sandbox=backup)
+
+        output, hedged, straggler = hedged_call(
+            lambda: self._run_agent(agent_name, script_path, input_data), on_backup,
+            delay, self._executor)
+        if hedged:
+            # 备用沙箱更快：互换主备，落后的副本留在原来的主沙箱上
+            self.hedge_stats["won"] += 1
+            self.sandbox, self._hedge_sandbox = backup, self.sandbox
+            self.log(f"  ⑂ 副本先完成，切换到沙箱 {backup.sandbox_id[:12]}...")
+        if straggler is not None:
+            # 有预热池时在后台换一个新的备用沙箱，否则等落后的副本结束后再用
+            self._hedge_ready = (self._executor.submit(self._replace_backup, self._hedge_sandbox)
+                                 if self.pool else straggler)
+        return output
+
+    def _replace_backup(self, sandbox):
+        self._hedge_sandbox = None
+        self.pool.release(sandbox, discard=True)
+        replacement = self.pool.lease()
+        self._upload_agents(replacement)
+        self._hedge_sandbox = replacement
+
+    def _run_agent(self, agent_name, script_path, input_data, sandbox=None):
+        sandbox = sandbox or self.sandbox
+        script_path = self.script_paths.get(script_path, script_path)
+        sandbox_id = sandbox.sandbox_id
+
+        with self.tracer.span("run_agent", agent=agent_name, sandbox_id=sandbox_id):
+            if self.agent_host:
+                return self._run_agent_on_host(script_path, input_data)
+
+            # 📍 步骤 1: 协调器注入输入数据
+            if input_data:
+                with self.tracer.span("inject_input", sandbox_id=sandbox_id) as span:
+                    payload = self.codec.encode(input_data)
+                    sandbox.files.write("/home/user/input.json", payload)
+                    span.set(bytes=len(payload))
+                self.log(f"  → 协调器注入输入: {len(payload)} bytes")
+
+            # 📍 步骤 2: 执行 agent
+            with self.tracer.span("exec", sandbox_id=sandbox_id, script=script_path) as span:
+                result = command_result(sandbox.commands.run, f"python3 {script_path}")
+                span.set(exit_code=result.exit_code, stdout_bytes=len(result.stdout),
+                         stderr_bytes=len(result.stderr))
+
+            if result.exit_code != 0:
+                self.log(f"  ✗ Agent 执行失败: {result.stderr}")
+                return None
+
+            # 📍 步骤 3: 协调器提取输出
+            with self.tracer.span("parse_output", sandbox_id=sandbox_id,
+                                  bytes=len(result.stdout)) as span:
+                try:
+                    output = self.codec.decode(result.stdout)
+                except ValueError:
+                    span.set(error="invalid json")
+                    self.log(f"  ✗ 无法解析输出: {result.stdout[:100]}")
+                    return None
             self.log(f"  ← 协调器提取输出: {len(result.stdout)} bytes")
             return output
-        except json.JSONDecodeError:
-            self.log(f"  ✗ 无法解析输出: {result.stdout[:100]}")
-            return None
 
-    def execute_workflow(self):
+    def stream_agent(self, agent_name, script_path, input_data=None):
+        """
+        流式运行 agent：agent 每输出一行 JSON（NDJSON），协调器就立即拿到一条记录
+
+        适合输出很大或需要边产出边处理的 agent；不经过 Agent Host。
         """
-        执行完整的 agent 工作流
+        self.log(f"流式运行 {agent_name}")
+        self._ensure_sandbox()
+        script_path = self.script_paths.get(script_path, script_path)
+        sandbox_id = self.sandbox.sandbox_id
+
+        with self.tracer.span("stream_agent", agent=agent_name, sandbox_id=sandbox_id) as span:
+            if input_data:
+                payload = self.codec.encode(input_data)
+                with self.tracer.span("inject_input", sandbox_id=sandbox_id, bytes=len(payload)):
+                    self.sandbox.files.write("/home/user/input.json", payload)
+                self.log(f"  → 协调器注入输入: {len(payload)} bytes")
+
+            with CommandStream(self.sandbox, f"python3 -u {script_path}") as stream:
+                yield from stream.records()
+            span.set(stdout_bytes=stream.bytes_read, exit_code=stream.exit_code)
+        self.log(f"  ← 协调器流式读取: {stream.bytes_read} bytes")
+
+    def _run_agent_on_host(self, script_path, input_data):
+        """通过常驻 Agent Host 执行：输入随请求发送，结果随响应返回，不落盘"""
+        with self.tracer.span("host_call", sandbox_id=self.sandbox.sandbox_id,
+                              script=script_path) as span:
+            try:
+                output = self.agent_host.call(script_path, input_data)
+            except AgentHostError as e:
+                span.set(error=str(e))
+                self.log(f"  ✗ Agent 执行失败: {e}")
+                return None
+        self.log(f"  ⇄ Agent Host 执行: {self.agent_host.last_elapsed * 1000:.1f} ms")
+        return output
+
+    def execute_workflow(self, initial_input=None):
+        """
+        执行完整的 agent 工作流（AGENT_WORKFLOW，与 AsyncAgentOrchestrator 共用同一个 DAG 定义）
 
         工作流：
         Input → Agent A → Orchestrator → Agent B → Orchestrator → Agent C → Output
@@ -93,152 +396,91 @@ class AgentOrchestrator:
         - Agent B 的输出由协调器读取
         - 协调器将 Agent B 的输出传递给 Agent C
         - Agent C 的输出由协调器返回
+
+        每个步骤通过 run_agent 执行（步骤缓存、重试、对冲、Agent Host 照常生效）；
+        步骤失败时跳过其下游并返回 None（失败原因会打印出来，也记录在 self.last_run 的 StepRun.error 中）。
         """
+        with self.tracer.span("workflow"):
+            return self._execute_workflow(initial_input or INITIAL_INPUT)
 
+    def _execute_workflow(self, initial_input):
+        order = AGENT_WORKFLOW.topological_order()
         print("\n" + "=" * 60)
-        print("执行工作流: Agent A → Agent B → Agent C")
+        print(f"执行工作流: {' → '.join(AGENT_NAMES[name] for name in order)}")
         print("=" * 60)
 
-        # 创建 agents 脚本
-        self._create_agents()
-
-        # 初始输入
-        initial_input = {
-            "task": "分析销售数据",
-            "data": [100, 150, 200, 180, 220]
-        }
+        # 创建 agents 脚本（推迟创建沙箱时随沙箱一起上传）
+        if not self._sandbox_deferred:
+            self._create_agents()
 
         print(f"\n🚀 初始输入: {initial_input}")
+        stages = itertools.count(1)
+
+        def run_step(step, payload):
+            agent_name = AGENT_NAMES[step.name]
+            print("\n" + "-" * 60)
+            print(f"阶段 {next(stages)}: {agent_name}")
+            print("-" * 60)
+            for dep in step.needs:
+                print(f"   📥 协调器将 {AGENT_NAMES[dep]} 的输出传递给 {agent_name}")
+            output = self.run_agent(agent_name, step.script_path, payload)
+            if not output:
+                raise RuntimeError(f"{agent_name} 失败")
+            print(f"\n📊 {agent_name} 输出: {output}")
+            return output
 
-        # Agent A: 数据分析
-        print("\n" + "-" * 60)
-        print("阶段 1: Agent A (数据分析)")
-        print("-" * 60)
-        result_a = self.run_agent("Agent A", "/home/user/agent_a.py", initial_input)
-
-        if not result_a:
-            print("❌ Agent A 失败")
-            return
-
-        print(f"\n📊 Agent A 输出: {result_a}")
-        print("   ⚠️  注意：这个输出是协调器读取的，不是 Agent B 直接接收的")
-
-        # Agent B: 数据转换
-        print("\n" + "-" * 60)
-        print("阶段 2: Agent B (数据转换)")
-        print("-" * 60)
-        print(f"   📥 协调器将 Agent A 的输出传递给 Agent B")
-        result_b = self.run_agent("Agent B", "/home/user/agent_b.py", result_a)
-
-        if not result_b:
-            print("❌ Agent B 失败")
-            return
-
-        print(f"\n🔄 Agent B 输出: {result_b}")
-
-        # Agent C: 报告生成
-        print("\n" + "-" * 60)
-        print("阶段 3: Agent C (报告生成)")
-        print("-" * 60)
-        print(f"   📥 协调器将 Agent B 的输出传递给 Agent C")
-        result_c = self.run_agent("Agent C", "/home/user/agent_c.py", result_b)
-
-        if not result_c:
-            print("❌ Agent C 失败")
-            return
+        # run_agent 共用一个沙箱和 /home/user/input.json，步骤在当前线程逐个执行；
+        # 不经过 asyncio.run，调用方已经运行在事件循环中时也可以使用
+        run = AGENT_WORKFLOW.run_sync(run_step, initial_input)
+        self.last_run = run
+
+        if not run.ok:
+            for step in run.steps.values():
+                if step.status == "failed":
+                    print(f"❌ {AGENT_NAMES[step.name]} 失败: {step.error}")
+                elif step.status == "skipped":
+                    print(f"⏭️  {AGENT_NAMES[step.name]} 已跳过（上游失败）")
+            return None
 
-        print(f"\n📝 Agent C 输出: {result_c}")
+        result = run.outputs[order[-1]]
 
         # 最终结果
         print("\n" + "=" * 60)
         print("✅ 工作流完成")
         print("=" * 60)
-        print(f"\n最终结果:\n{json.dumps(result_c, indent=2)}")
-
-        return result_c
+        print(f"\n最终结果:\n{json.dumps(result, indent=2)}")
 
-    def _create_agents(self):
-        """创建 agent 脚本"""
+        return result
 
-        # Agent A: 数据分析
-        agent_a_script = """
-import json
-import sys
-
-# 📍 Agent A 从文件读取输入（协调器写入的）
-with open('/home/user/input.json', 'r') as f:
-    input_data = json.load(f)
+    def _ensure_sandbox(self):
+        """推迟创建的沙箱在第一次真正需要执行时创建，并上传 agent 脚本"""
+        if self.sandbox is None and self._sandbox_deferred:
+            self._sandbox_deferred = False
+            self._open_sandbox()
+            self._create_agents()
 
-# 执行分析
-data = input_data['data']
-analysis = {
-    'agent': 'Agent A',
-    'task': input_data['task'],
-    'total': sum(data),
-    'average': sum(data) / len(data),
-    'count': len(data)
-}
-
-# 📍 Agent A 将结果输出到 stdout（协调器会读取）
-print(json.dumps(analysis))
-
-# ⚠️ 注意：Agent A 不知道 Agent B 的存在
-# ⚠️ 注意：Agent A 不直接与 Agent B 通信
-"""
-
-        # Agent B: 数据转换
-        agent_b_script = """
-import json
-
-# 📍 Agent B 从文件读取输入（协调器写入的，来自 Agent A）
-with open('/home/user/input.json', 'r') as f:
-    input_data = json.load(f)
-
-# 执行转换
-transformed = {
-    'agent': 'Agent B',
-    'previous_agent': input_data['agent'],
-    'total_sales': input_data['total'],
-    'avg_sales': input_data['average'],
-    'status': 'transformed'
-}
-
-# 📍 Agent B 将结果输出到 stdout（协调器会读取）
-print(json.dumps(transformed))
-
-# ⚠️ 注意：Agent B 不知道 Agent A 或 Agent C
-# ⚠️ 注意：数据是协调器传递的，不是 Agent A 直接传的
-"""
-
-        # Agent C: 报告生成
-        agent_c_script = """
-import json
-
-# 📍 Agent C 从文件读取输入（协调器写入的，来自 Agent B）
-with open('/home/user/input.json', 'r') as f:
-    input_data = json.load(f)
-
-# 生成报告
-report = {
-    'agent': 'Agent C',
-    'report_type': 'Sales Summary',
-    'total_sales': f"${input_data['total_sales']}",
-    'average_sales': f"${input_data['avg_sales']:.2f}",
-    'status': input_data['status'],
-    'generated_by': f"{input_data['previous_agent']} → Agent C"
-}
-
-# 📍 Agent C 将结果输出到 stdout（协调器会读取）
-print(json.dumps(report))
-
-# ⚠️ 注意：Agent C 是工作流的最后一个环节
-# ⚠️ 注意：所有数据都是通过协调器流动的
-"""
+    def _create_agents(self):
+        """创建 agent 脚本（启用对冲时备用沙箱同样需要）"""
+        for sandbox in (self.sandbox, self._hedge_sandbox):
+            if sandbox is not None:
+                self._upload_agents(sandbox)
+
+    def _upload_agents(self, sandbox):
+        if self.script_cache:
+            # 脚本按内容哈希存放，主备沙箱得到的路径映射相同
+            before = dict(self.script_cache.stats)
+            self.script_paths = self.script_cache.sync(sandbox, AGENT_SCRIPTS)
+            uploaded = self.script_cache.stats["misses"] - before["misses"]
+            sent = self.script_cache.stats["bytes_sent"] - before["bytes_sent"]
+            self.tracer.event("script_cache.sync", uploaded=uploaded, bytes=sent)
+            self.log(f"同步 {len(AGENT_SCRIPTS)} 个 agent 脚本: 上传 {uploaded} 个 ({sent} bytes)")
+            return
 
-        self.sandbox.files.write("/home/user/agent_a.py", agent_a_script)
-        self.sandbox.files.write("/home/user/agent_b.py", agent_b_script)
-        self.sandbox.files.write("/home/user/agent_c.py", agent_c_script)
-        self.log("创建 3 个 agent 脚本")
+        with self.tracer.span("upload_scripts", sandbox_id=sandbox.sandbox_id,
+                              files=len(AGENT_SCRIPTS),
+                              bytes=sum(len(s) for s in AGENT_SCRIPTS.values())):
+            write_many(sandbox, AGENT_SCRIPTS)
+        self.log(f"创建 {len(AGENT_SCRIPTS)} 个 agent 脚本")
 
     def visualize_data_flow(self):
         """可视化数据流"""
@@ -294,13 +536,46 @@ print(json.dumps(report))
 
     def cleanup(self):
         """清理资源"""
-        if self.sandbox:
-            self.sandbox.kill()
-            self.log("清理沙箱")
+        sandbox_id = self.sandbox.sandbox_id if self.sandbox else None
+        with self.tracer.span("cleanup", sandbox_id=sandbox_id, pooled=bool(self.pool)):
+            if self.agent_host:
+                self.agent_host.close()
+                self.agent_host = None
+            if self.sandbox and self.pool:
+                self.pool.release(self.sandbox)
+                self.sandbox = None
+                self.log("归还沙箱到预热池")
+            elif self.sandbox:
+                self._kill(self.sandbox)
+                self.log("清理沙箱")
+            if self._executor:
+                self._close_hedge()
+
+    def _kill(self, sandbox):
+        """销毁自己创建的沙箱（池中的沙箱由 SandboxPool 负责通知 script_cache）"""
+        if self.script_cache:
+            self.script_cache.forget(sandbox)
+        sandbox.kill()
+
+    def _close_hedge(self):
+        if self.pool and self._hedge_ready is not None:
+            wait([self._hedge_ready])   # 等待后台替换完成，再归还新的备用沙箱
+        sandbox, self._hedge_sandbox = self._hedge_sandbox, None
+        if sandbox is not None and self.pool:
+            self.pool.release(sandbox)
+        elif sandbox is not None:
+            self._kill(sandbox)
+        self._executor.shutdown(wait=False)
+        self.log(f"清理备用沙箱（对冲 {self.hedge_stats['launched']} 次，"
+                 f"副本胜出 {self.hedge_stats['won']} 次）")
 
 
 # 主程序
 if __name__ == "__main__":
+    print("=" * 60)
+    print("Agent 协调器模式演示")
+    print("=" * 60)
+
     orchestrator = AgentOrchestrator()
 
     try:
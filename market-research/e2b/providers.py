@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+多供应商沙箱客户端与延迟感知路由（Provider Router）
+
+仓库里用同样的方式驱动三个 SDK：e2b.Sandbox、ppio_sandbox.code_interpreter.Sandbox、e2b_desktop.Sandbox，
+都是 Sandbox.create() → files / commands → kill()，但每个示例都写死了其中一个：
+某个供应商变慢或创建失败时，获取沙箱就跟着变慢或直接失败。
+
+sandbox_tech_overview.md §6.2 的 RuntimeSelector 按静态规则选择运行时；这里换成按实时数据选择供应商：
+- Provider：一个供应商 = 名称 + create 函数 + 能力标签 + 单位成本；
+  e2b_provider() / ppio_provider() / desktop_provider() 延迟导入对应 SDK
+- SandboxRouter 为每个请求打分选择供应商：
+  分数 = 最近创建延迟的 p50 + p99_weight × p99，按错误率放大（÷ (1 - 错误率)），再加 cost_weight × 成本；
+  还没有样本的供应商使用 prior_latency 作为估计，保证会被试用
+- 创建失败时立即换下一个供应商（故障转移）；连续失败 failure_threshold 次的供应商熔断 cooldown 秒，
+  之后进入半开状态：只放行一个试探请求，试探成功才恢复，失败则立即再熔断 cooldown 秒
+- hedge=True 时，首选供应商超过其 p95 延迟仍未返回，就同时向次选供应商发起创建，
+  取先成功的一个，另一个创建完成后立即销毁
+- explore：以该概率随机选择非最优的供应商，避免某个供应商恢复后一直没有新样本
+- 返回的 RoutedSandbox 代理原沙箱的全部接口，额外带 provider 属性
+
+用法：
+    router = SandboxRouter([e2b_provider(), ppio_provider(cost=0.7)])
+    sandbox = router.create()
+    print(sandbox.provider, sandbox.commands.run("echo hi").stdout)
+    sandbox.kill()
+
+直接运行本文件会用 LocalSandbox + FaultInjector 离线模拟两个供应商，其中一个在运行中途变慢并频繁失败，
+对比固定使用一个供应商与路由器的获取延迟和失败数。
+"""
+
+import collections
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from resilience import LatencyTracker, hedged_call
+from tracing import NULL_TRACER
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoProviderAvailable(RuntimeError):
+    """没有满足要求的可用供应商（熔断中的不算），或所有候选供应商都创建失败"""
+
+
+@dataclass
+class Provider:
+    """
+    一个沙箱供应商
+
+    create:        创建沙箱的函数，接受 create(**kwargs)
+    capabilities:  能力标签，请求可以要求其中的若干项（如 "code"、"run_code"、"desktop"）
+    cost:          单位成本（相对值），路由时与延迟一起考虑
+    """
+    name: str
+    create: object
+    capabilities: frozenset = frozenset({"code"})
+    cost: float = 1.0
+
+
+def e2b_provider(cost=1.0, **defaults):
+    """e2b.Sandbox"""
+    def create(**kwargs):
+        from e2b import Sandbox
+        return Sandbox.create(**{**defaults, **kwargs})
+    return Provider("e2b", create, frozenset({"code"}), cost)
+
+
+def ppio_provider(cost=1.0, **defaults):
+    """ppio_sandbox.code_interpreter.Sandbox（兼容 E2B 接口，额外支持 run_code）"""
+    def create(**kwargs):
+        from ppio_sandbox.code_interpreter import Sandbox
+        return Sandbox.create(**{**defaults, **kwargs})
+    return Provider("ppio", create, frozenset({"code", "run_code"}), cost)
+
+
+def desktop_provider(cost=1.0, **defaults):
+    """e2b_desktop.Sandbox（桌面环境）"""
+    def create(**kwargs):
+        from e2b_desktop import Sandbox
+        return Sandbox.create(**{**defaults, **kwargs})
+    return Provider("desktop", create, frozenset({"code", "desktop"}), cost)
+
+
+class RoutedSandbox:
+    """沙箱代理：接口与原沙箱相同，provider 为创建它的供应商名称"""
+
+    def __init__(self, sandbox, provider):
+        self._sandbox = sandbox
+        self.provider = provider
+
+    def __getattr__(self, name):
+        return getattr(self._sandbox, name)
+
+
+class _Health:
+    """单个供应商最近的创建结果（错误率）与熔断状态"""
+
+    def __init__(self, window):
+        self.outcomes = collections.deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = None      # 熔断到期时间；None 表示未熔断
+        self.probing = False        # 半开状态下的试探请求是否正在进行
+        self.created = 0
+        self.failures = 0
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def state(self, now):
+        if self.open_until is None:
+            return CLOSED
+        return OPEN if now < self.open_until else HALF_OPEN
+
+    def available(self, now):
+        """未熔断，或处于半开状态且试探名额还没被占用"""
+        state = self.state(now)
+        return state == CLOSED or (state == HALF_OPEN and not self.probing)
+
+
+class SandboxRouter:
+    """
+    按实时延迟、错误率和成本选择供应商的沙箱客户端
+
+    p99_weight:        p99 在分数中的权重（越大越回避长尾）
+    cost_weight:       每单位成本折算成多少秒延迟
+    prior_latency:     没有样本时的延迟估计（秒）
+    window:            每个供应商保留的最近样本数
+    failure_threshold: 连续失败多少次后熔断
+    cooldown:          熔断时长（秒），之后放行一个试探请求，试探成功才恢复、失败则再次熔断
+    hedge:             首选供应商超过其 p95 仍未返回时，向次选供应商并发创建
+    explore:           随机选择非最优供应商的概率
+    tracer:            tracing.Tracer，故障转移与熔断时记录事件
+    """
+
+    def __init__(self, providers, p99_weight=0.5, cost_weight=0.0, prior_latency=1.0, window=100,
+                 failure_threshold=3, cooldown=30.0, hedge=False, explore=0.05, seed=None, tracer=None):
+        if not providers:
+            raise ValueError("at least one provider is required")
+        names = [p.name for p in providers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate provider names: {names}")
+        self.providers = {p.name: p for p in providers}
+        self.p99_weight = p99_weight
+        self.cost_weight = cost_weight
+        self.prior_latency = prior_latency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self.explore = explore
+        self.tracer = tracer or NULL_TRACER
+        self.latency = LatencyTracker(window)
+        self._health = {name: _Health(window) for name in self.providers}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {"created": 0, "failovers": 0, "hedged": 0, "hedge_won": 0,
+                      "explored": 0, "exhausted": 0}
+
+    def create(self, require=(), **kwargs):
+        """
+        创建沙箱：按分数依次尝试满足 require 能力的供应商，返回 RoutedSandbox
+
+        kwargs 原样传给供应商的 create；所有候选都失败时抛出 NoProviderAvailable。
+        """
+        candidates = self.rank(require)
+        if not candidates:
+            raise NoProviderAvailable(f"no available provider offers {sorted(require)}")
+
+        last_error = None
+        while candidates:
+            provider = candidates.pop(0)
+            backup = candidates[0] if self.hedge and candidates else None
+            try:
+                if backup is not None and self.latency.percentile(provider.name, 95) is not None:
+                    sandbox, provider = self._create_hedged(provider, backup, kwargs)
+                    if provider is backup:
+                        candidates.pop(0)
+                else:
+                    sandbox = self._create_on(provider, kwargs)
+            except Exception as e:
+                last_error = e
+                if candidates:
+                    with self._lock:
+                        self.stats["failovers"] += 1
+                    self.tracer.event("provider_failover", provider=provider.name,
+                                      to=candidates[0].name, error=type(e).__name__)
+                continue
+            with self._lock:
+                self.stats["created"] += 1
+            return RoutedSandbox(sandbox, provider.name)
+
+        with self._lock:
+            self.stats["exhausted"] += 1
+        raise NoProviderAvailable(f"all providers failed: {last_error}") from last_error
+
+    def rank(self, require=()):
+        """满足能力要求且未熔断的供应商，按分数从好到差排序（可能随机探索）"""
+        require = frozenset(require)
+        now = time.monotonic()
+        with self._lock:
+            available = [p for p in self.providers.values()
+                         if require <= p.capabilities and self._health[p.name].available(now)]
+        ranked = sorted(available, key=self.score)
+        if len(ranked) > 1 and self._random.random() < self.explore:
+            ranked.insert(0, ranked.pop(self._random.randrange(1, len(ranked))))
+            with self._lock:
+                self.stats["explored"] += 1
+        return ranked
+
+    def score(self, provider):
+        """预期获取耗时（秒，越小越好）"""
+        p50 = self.latency.percentile(provider.name, 50)
+        p99 = self.latency.percentile(provider.name, 99)
+        if p50 is None:
+            p50 = p99 = self.prior_latency
+        with self._lock:
+            error_rate = self._health[provider.name].error_rate
+        expected = (p50 + self.p99_weight * p99) / max(1.0 - error_rate, 0.05)
+        return expected + self.cost_weight * provider.cost
+
+    def metrics(self):
+        """每个供应商的 p50 / p99（毫秒）、错误率、创建数、熔断状态（closed / open / half_open）和分数"""
+        now = time.monotonic()
+        result = {}
+        for name, provider in self.providers.items():
+            p50 = self.latency.percentile(name, 50)
+            p99 = self.latency.percentile(name, 99)
+            with self._lock:
+                health = self._health[name]
+                result[name] = {
+                    "created": health.created,
+                    "failures": health.failures,
+                    "error_rate": health.error_rate,
+                    "p50_ms": p50 * 1000 if p50 is not None else None,
+                    "p99_ms": p99 * 1000 if p99 is not None else None,
+                    "breaker": health.state(now),
+                }
+            result[name]["score"] = self.score(provider)
+        return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _create_on(self, provider, kwargs):
+        probe = self._admit(provider)
+        start = time.perf_counter()
+        try:
+            sandbox = provider.create(**kwargs)
+        except Exception:
+            self._record(provider, None, probe)
+            raise
+        self._record(provider, time.perf_counter() - start, probe)
+        return sandbox
+
+    def _admit(self, provider):
+        """
+        尝试前检查熔断状态：未熔断时直接放行；半开时占用唯一的试探名额并返回 True（本次是试探请求）；
+        熔断中或试探已被其他请求占用时抛出 NoProviderAvailable（create 会换下一个供应商）
+        """
+        with self._lock:
+            health = self._health[provider.name]
+            state = health.state(time.monotonic())
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not health.probing:
+                health.probing = True
+                return True
+        raise NoProviderAvailable(f"provider {provider.name} circuit is {state}")
+
+    def _record(self, provider, seconds, probe=False):
+        """
+        记录一次创建结果（seconds 为 None 表示失败）
+
+        连续失败达到阈值时熔断；试探请求失败时立即再次熔断，成功时恢复。
+        熔断前就已发出的请求只计入统计，不改变熔断状态。
+        """
+        event = None
+        with self._lock:
+            health = self._health[provider.name]
+            health.outcomes.append(seconds is not None)
+            if seconds is None:
+                health.failures += 1
+                health.consecutive_failures += 1
+                if probe or (health.open_until is None
+                             and health.consecutive_failures >= self.failure_threshold):
+                    health.open_until = time.monotonic() + self.cooldown
+                    event = "provider_open"
+            else:
+                health.created += 1
+                health.consecutive_failures = 0
+                if probe:
+                    health.open_until = None
+                    event = "provider_closed"
+            if probe:
+                health.probing = False
+        if seconds is not None:
+            self.latency.record(provider.name, seconds)
+        if event == "provider_open":
+            self.tracer.event(event, provider=provider.name, cooldown=self.cooldown)
+        elif event:
+            self.tracer.event(event, provider=provider.name)
+
+    def _create_hedged(self, provider, backup, kwargs):
+        """首选供应商超过其 p95 仍未返回时向 backup 并发创建；返回 (沙箱, 供应商)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="router-hedge")
+        delay = self.latency.percentile(provider.name, 95)
+        sandbox, backup_won, straggler = hedged_call(
+            lambda: self._create_on(provider, kwargs),
+            lambda: self._create_on(backup, kwargs),
+            delay, self._executor)
+        if straggler is not None:
+            with self._lock:
+                self.stats["hedged"] += 1
+                self.stats["hedge_won"] += backup_won
+            # 落后的一方创建完成后立即销毁，不占用配额
+            straggler.add_done_callback(_kill_result)
+        return sandbox, backup if backup_won else provider
+
+
+def _kill_result(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        future.result().kill()
+    except Exception:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from local_sandbox import FaultInjector, LocalSandbox
+    from sandbox_pool import _percentile
+
+    parser = argparse.ArgumentParser(description="多供应商路由演示（离线）")
+    parser.add_argument("--requests", type=int, default=150, help="依次获取沙箱的次数")
+    parser.add_argument("--degrade-at", type=float, default=0.3,
+                        help="首选供应商在第几成请求后开始退化")
+    parser.add_argument("--fast", type=float, default=0.05, help="首选供应商正常时的创建耗时（秒）")
+    parser.add_argument("--slow", type=float, default=0.08, help="备选供应商的创建耗时（秒）")
+    parser.add_argument("--degraded-factor", type=float, default=10.0, help="退化后的延迟倍数")
+    parser.add_argument("--degraded-failure-rate", type=float, default=0.3, help="退化后的失败率")
+    args = parser.parse_args()
+
+    def make_providers():
+        primary = FaultInjector(latency=args.fast, jitter=0.2, slow_rate=0.02, seed=1)
+        secondary = FaultInjector(latency=args.slow, jitter=0.2, slow_rate=0.02, seed=2)
+        providers = [
+            Provider("primary", lambda **kw: LocalSandbox.create(faults=primary, **kw), cost=0.7),
+            Provider("secondary", lambda **kw: LocalSandbox.create(faults=secondary, **kw)),
+        ]
+        return primary, providers
+
+    def degrade(faults):
+        faults.latency *= args.degraded_factor
+        faults.failure_rate = args.degraded_failure_rate
+
+    def run(label, acquire, primary):
+        latencies, failures, used = [], 0, collections.Counter()
+        for i in range(args.requests):
+            if i == int(args.requests * args.degrade_at):
+                degrade(primary)
+            start = time.perf_counter()
+            try:
+                sandbox = acquire()
+            except Exception:
+                failures += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            used[getattr(sandbox, "provider", "primary")] += 1
+            sandbox.kill()
+        print(f"   {label:<16} p50={_percentile(latencies, 50):7.1f} ms"
+              f"   p99={_percentile(latencies, 99):7.1f} ms   失败 {failures:>3}   {dict(used)}")
+
+    print("=" * 60)
+    print(f"{args.requests} 次获取沙箱，首选供应商在 {args.degrade_at:.0%} 后延迟 ×{args.degraded_factor:.0f}、"
+          f"失败率 {args.degraded_failure_rate:.0%}")
+    print("=" * 60)
+
+    primary, providers = make_providers()
+    run("固定首选供应商", lambda: providers[0].create(), primary)
+
+    primary, providers = make_providers()
+    router = SandboxRouter(providers, prior_latency=0.01, cooldown=2.0, seed=7)
+    run("路由", router.create, primary)
+    print(f"   {'':<16} {router.stats}")
+
+    primary, providers = make_providers()
+    with SandboxRouter(providers, prior_latency=0.01, cooldown=2.0, hedge=True, seed=7) as router:
+        run("路由 + 对冲", router.create, primary)
+        print(f"   {'':<16} {router.stats}")
+        time.sleep(args.fast * args.degraded_factor * 3)   # 等待落后的创建完成并被销毁
+    for name, m in router.metrics().items():
+        print(f"   {name:<10} p50={m['p50_ms']:6.1f} ms  p99={m['p99_ms']:6.1f} ms"
+              f"  错误率 {m['error_rate']:.0%}  熔断 {m['breaker']}")
+    leftover = [n for n in os.listdir(LocalSandbox.base_dir) if n.startswith("local-")]
+    print(f"\n🧹 遗留沙箱目录: {len(leftover)}")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+步骤重试与对冲执行（Retry / Hedging）
+
+run_agent 在退出码非 0 或输出无法解析时返回 None，execute_workflow 随即放弃整个工作流；
+偶尔一个沙箱变慢，整个工作流的尾延迟就跟着变长。
+
+- RetryPolicy：按步骤配置的重试策略，指数退避 + 随机抖动；
+  返回 None 或抛出 retry_on 中的异常都视为失败，最多执行 max_attempts 次
+- HedgePolicy + LatencyTracker：记录每个步骤的成功延迟，
+  步骤执行超过其 p95（可配置）仍未完成时，在第二个预热沙箱上启动一个副本，取先成功的结果
+- hedged_call：对冲执行的通用实现，落后的一方继续在后台运行，由调用方决定何时复用它的沙箱
+
+AgentOrchestrator(retry_policy=..., retry_policies={...}, hedge=HedgePolicy()) 启用这两项；
+对冲需要第二个沙箱（有预热池时从池中租用），与 use_agent_host 不兼容。
+
+直接运行本文件会用 FaultInjector（偶发慢请求和失败的本地服务）离线对比
+无重试 / 重试 / 重试 + 对冲 三种配置下工作流的成功率和 p50 / p99 延迟。
+"""
+
+import collections
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, TimeoutError, wait
+from dataclasses import dataclass
+
+from sandbox_pool import _percentile
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    单个步骤的重试策略
+
+    max_attempts: 最多执行次数（含首次）
+    backoff:      第一次重试前的等待时间（秒），之后每次乘以 multiplier，最多 max_backoff
+    jitter:       随机减少等待时间的比例（0.5 表示等待 50%~100%），避免大量步骤同时重试
+    retry_on:     视为可重试的异常类型；不在其中的异常直接抛出
+    """
+    max_attempts: int = 3
+    backoff: float = 0.5
+    multiplier: float = 2.0
+    max_backoff: float = 10.0
+    jitter: float = 0.5
+    retry_on: tuple = (Exception,)
+
+    def delay(self, attempt):
+        """第 attempt 次失败后的等待时间"""
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+DEFAULT_RETRY = RetryPolicy()
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+def retry_call(fn, policy=DEFAULT_RETRY, on_retry=None, sleep=time.sleep):
+    """
+    按 policy 调用 fn()：返回 None 或抛出 retry_on 中的异常时等待后重试
+
+    on_retry(attempt, error, delay) 在每次重试前调用（返回 None 导致的重试 error 为 None）。
+    全部失败时返回最后一次的 None，或抛出最后一次的异常。
+    """
+    for attempt in range(1, policy.max_attempts + 1):
+        try:
+            result = fn()
+        except policy.retry_on as e:
+            if attempt == policy.max_attempts:
+                raise
+            error = e
+        else:
+            if result is not None or attempt == policy.max_attempts:
+                return result
+            error = None
+        delay = policy.delay(attempt)
+        if on_retry:
+            on_retry(attempt, error, delay)
+        sleep(delay)
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """
+    对冲策略
+
+    percentile:  步骤执行超过该分位数延迟仍未完成时启动副本
+    min_samples: 累积到这么多成功样本之前不对冲（分位数还不可靠）
+    min_delay:   对冲延迟的下限（秒），避免在很快的步骤上浪费沙箱
+    delay:       固定的对冲延迟（秒），设置后不使用分位数
+    """
+    percentile: float = 95
+    min_samples: int = 10
+    min_delay: float = 0.05
+    delay: float = None
+
+
+class LatencyTracker:
+    """按步骤名记录最近 window 个成功延迟（秒），计算对冲延迟"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, p):
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        return _percentile(samples, p) if samples else None
+
+    def hedge_delay(self, key, policy):
+        """返回对冲延迟（秒）；样本不足时返回 None（不对冲）"""
+        if policy.delay is not None:
+            return policy.delay
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < policy.min_samples:
+            return None
+        return max(policy.min_delay, _percentile(samples, policy.percentile))
+
+
+def _succeeded(future):
+    return future.exception() is None and future.result() is not None
+
+
+def hedged_call(primary, backup, delay, executor):
+    """
+    在 executor 中执行 primary()；delay 秒后仍未完成时再执行 backup()，取先成功的一个
+
+    返回 (结果, 是否由 backup 得到, 落后的 future 或 None)。
+    primary 在 delay 内完成（无论成败）时不启动 backup；两个都失败时返回 primary 的结果或抛出其异常。
+    两个调用都在调用方的 contextvars 上下文中执行（追踪 span 的父子关系保持不变）。
+    """
+    first = executor.submit(contextvars.copy_context().run, primary)
+    try:
+        return first.result(timeout=delay), False, None
+    except TimeoutError:
+        pass
+
+    second = executor.submit(contextvars.copy_context().run, backup)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in (f for f in (first, second) if f in done):
+            if _succeeded(future):
+                straggler = next(iter(pending), None)
+                return future.result(), future is second, straggler
+    return first.result(), False, None
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    from local_sandbox import FaultInjector, LocalSandbox, install
+
+    parser = argparse.ArgumentParser(description="重试与对冲执行演示（离线）")
+    parser.add_argument("--workflows", type=int, default=200, help="连续执行的工作流数")
+    parser.add_argument("--latency", type=float, default=0.01, help="正常请求的往返延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.01, help="慢请求比例")
+    parser.add_argument("--slow-factor", type=float, default=30.0, help="慢请求的延迟倍数")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="请求失败率")
+    args = parser.parse_args()
+
+    install()
+    from orchestrator_pattern import AgentOrchestrator
+    from sandbox_pool import SandboxPool
+    from script_cache import ScriptCache
+
+    def run(label, **options):
+        faults = FaultInjector(latency=args.latency, slow_rate=args.slow_rate,
+                               slow_factor=args.slow_factor, failure_rate=args.failure_rate,
+                               seed=7)
+
+        def factory():
+            return LocalSandbox.create(faults=faults)
+
+        latencies = []
+        cache = ScriptCache()
+        with SandboxPool(factory=factory, size=2, script_cache=cache) as pool:
+            pool.start(wait=True)
+            # 脚本只在每个沙箱上传一次，工作流延迟只包含 agent 步骤本身
+            orchestrator = AgentOrchestrator(pool=pool, script_cache=cache, **options)
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    orchestrator.create_sandbox()
+                    for _ in range(args.workflows):
+                        start = time.perf_counter()
+                        try:
+                            result = orchestrator.execute_workflow()
+                        except Exception:
+                            result = None
+                        if result is not None:
+                            latencies.append((time.perf_counter() - start) * 1000)
+                finally:
+                    orchestrator.cleanup()
+
+        print(f"   {label:<12} 成功 {len(latencies):>3}/{args.workflows}"
+              f"   p50={_percentile(latencies, 50):6.1f} ms   p95={_percentile(latencies, 95):6.1f} ms"
+              f"   p99={_percentile(latencies, 99):6.1f} ms"
+              f"   对冲 {orchestrator.hedge_stats['launched']} 次 / 胜出 {orchestrator.hedge_stats['won']} 次")
+
+    print("=" * 60)
+    print(f"连续执行 {args.workflows} 个工作流: {args.slow_rate:.0%} 请求慢 {args.slow_factor:.0f} 倍, "
+          f"{args.failure_rate:.0%} 请求失败")
+    print("=" * 60)
+    run("无重试")
+    run("重试", retry_policy=RetryPolicy(backoff=0.05))
+    run("重试 + 对冲", retry_policy=RetryPolicy(backoff=0.05), hedge=HedgePolicy())
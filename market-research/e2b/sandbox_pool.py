@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+沙箱预热池（Warm Pool）
+
+对应 agentic-infra-solution.md §5.2 的预热池设计：
+- 常驻 N 个空闲沙箱，用户请求时立即分配（毫秒级返回）
+- 后台线程异步补充新沙箱：size 是空闲目标，空闲沙箱少于 size 时才补充（已租出的不计入）
+- 空闲超过 max_idle 秒的沙箱会被回收（TTL 淘汰）
+- 沙箱归还后先执行 reset 清理工作目录，再放回池中供下次租用；
+  归还时不按 size 淘汰（否则每次租用都触发一次补充、归还时再销毁一个，反复创建），
+  并发高峰后多出的空闲沙箱由 TTL 淘汰
+- registry（lifecycle.SandboxRegistry）：池中的沙箱登记到注册表，租用 / 归还时同步状态；
+  adopt() 接管协调器重启后 recover(reclaim=True) 找回的沙箱
+- script_cache（script_cache.ScriptCache）：沙箱被销毁时丢弃它的缓存记录；
+  使用自定义 reset 时归还后同样丢弃（默认的 reset_sandbox 保留隐藏的缓存目录）
+
+直接运行本文件会用 LocalSandbox 离线对比冷启动与预热池的租用延迟（p50/p99）。
+"""
+
+import collections
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fan_out import command_result
+
+
+def _default_factory():
+    """默认使用 E2B 创建沙箱"""
+    from e2b import Sandbox
+    return Sandbox.create()
+
+
+def reset_sandbox(sandbox):
+    """默认的归还清理：删除上一个租户留下的工作文件"""
+    result = command_result(sandbox.commands.run, "rm -rf /tmp/* /home/user/*")
+    if result.exit_code != 0:
+        raise RuntimeError(f"reset failed: {result.stderr}")
+
+
+class SandboxPool:
+    """
+    沙箱预热池
+
+    用法：
+        pool = SandboxPool(size=3)
+        pool.start()
+
+        sandbox = pool.lease()
+        try:
+            sandbox.commands.run(...)
+        finally:
+            pool.release(sandbox)
+
+        pool.close()
+
+    size:     空闲目标：后台补充让空闲沙箱不少于 size 个；租出的沙箱归还后总是放回池中
+    max_idle: 空闲沙箱的 TTL（秒），并发高峰后多出的空闲沙箱在此之后被淘汰
+    """
+
+    def __init__(self, factory=None, size=3, max_idle=300.0, reset=reset_sandbox,
+                 refill_workers=2, sweep_interval=1.0, registry=None, script_cache=None):
+        self.factory = factory or _default_factory
+        self.registry = registry
+        self.script_cache = script_cache
+        if registry:
+            self.factory = registry.factory(self.factory, leased=False)
+        self.size = size
+        self.max_idle = max_idle
+        self.reset = reset
+        self.sweep_interval = sweep_interval
+
+        self._idle = collections.deque()    # (sandbox, idle_since)，右端最新
+        self._creating = 0
+        self._dirty = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=refill_workers,
+                                            thread_name_prefix="sandbox-pool")
+        self._refiller = threading.Thread(target=self._refill_loop,
+                                          name="sandbox-pool-refill", daemon=True)
+
+        self.stats = {
+            "hits": 0,              # 从池中直接拿到沙箱
+            "misses": 0,            # 池为空，同步创建
+            "created": 0,
+            "evicted": 0,           # 空闲超时被回收
+            "reset_failures": 0,
+            "create_failures": 0,
+        }
+
+    def start(self, wait=False, timeout=None):
+        """启动后台补充线程；wait=True 时等待池被填满"""
+        if not self._refiller.is_alive():
+            self._refiller.start()
+        if wait:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._idle) >= self.size or self._closed,
+                                    timeout=timeout)
+        return self
+
+    def lease(self):
+        """租用一个沙箱：优先取空闲沙箱，池为空时同步创建"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("pool is closed")
+            expired = self._evict_expired_locked()
+            sandbox = None
+            while self._idle and sandbox is None:
+                sandbox, _ = self._idle.pop()
+                if self.registry and not self.registry.is_alive(sandbox):
+                    # 已被注册表的清理线程回收
+                    sandbox = None
+            if sandbox is not None:
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            self._wake_locked()
+
+        self._kill_all(expired)
+
+        if sandbox is None:
+            # 冷路径：不等待后台补充，直接创建
+            sandbox = self.factory()
+            with self._cond:
+                self.stats["created"] += 1
+        if self.registry:
+            self.registry.lease(sandbox)
+        return sandbox
+
+    def release(self, sandbox, discard=False):
+        """归还沙箱；reset 在后台执行，不占用调用方时间"""
+        if self.registry:
+            self.registry.release(sandbox)
+        if discard or self._closed:
+            self._kill(sandbox)
+            return
+        self._executor.submit(self._recycle, sandbox)
+
+    @contextlib.contextmanager
+    def leased(self):
+        """以上下文管理器的方式租用沙箱"""
+        sandbox = self.lease()
+        try:
+            yield sandbox
+        finally:
+            self.release(sandbox)
+
+    def adopt(self, sandboxes):
+        """接管已有的沙箱（如 registry.recover(reclaim=True) 的结果）：reset 后放入池中，超出 size 的被销毁"""
+        for sandbox in sandboxes:
+            self._executor.submit(self._recycle, sandbox, True)
+
+    def idle_count(self):
+        with self._cond:
+            return len(self._idle)
+
+    def close(self):
+        """关闭池：停止补充并销毁所有空闲沙箱（已租出的由调用方归还时销毁）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._refiller.is_alive():
+            self._refiller.join()
+        self._executor.shutdown(wait=True)
+
+        with self._cond:
+            idle = [sb for sb, _ in self._idle]
+            self._idle.clear()
+        self._kill_all(idle)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _wake_locked(self):
+        self._dirty = True
+        self._cond.notify_all()
+
+    def _evict_expired_locked(self):
+        """从最旧的一端淘汰空闲超时的沙箱"""
+        expired = []
+        deadline = time.monotonic() - self.max_idle
+        while self._idle and self._idle[0][1] < deadline:
+            sandbox, _ = self._idle.popleft()
+            expired.append(sandbox)
+        self.stats["evicted"] += len(expired)
+        return expired
+
+    def _refill_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._closed,
+                                    timeout=self.sweep_interval)
+                self._dirty = False
+                if self._closed:
+                    return
+                expired = self._evict_expired_locked()
+                deficit = self.size - len(self._idle) - self._creating
+                if deficit > 0:
+                    self._creating += deficit
+
+            self._kill_all(expired)
+            for _ in range(max(deficit, 0)):
+                self._executor.submit(self._create_one)
+
+    def _create_one(self):
+        try:
+            sandbox = self.factory()
+        except Exception:
+            with self._cond:
+                self._creating -= 1
+                self.stats["create_failures"] += 1
+            return
+
+        with self._cond:
+            self._creating -= 1
+            self.stats["created"] += 1
+            if not self._closed:
+                self._idle.append((sandbox, time.monotonic()))
+                self._cond.notify_all()
+                return
+        self._kill(sandbox)
+
+    def _recycle(self, sandbox, cap=False):
+        if self.reset:
+            try:
+                self.reset(sandbox)
+            except Exception:
+                with self._cond:
+                    self.stats["reset_failures"] += 1
+                self._kill(sandbox)
+                return
+            if self.script_cache and self.reset is not reset_sandbox:
+                # 自定义 reset 可能清掉了 .script-cache，缓存记录不再可信
+                self.script_cache.forget(sandbox)
+
+        with self._cond:
+            if self._closed:
+                surplus = sandbox
+            else:
+                # cap（adopt）：池已满时淘汰最旧的空闲沙箱，保留刚接管的；
+                # 普通归还总是放回池中，多出的空闲沙箱由 TTL 淘汰
+                surplus = self._idle.popleft()[0] if cap and len(self._idle) >= self.size else None
+                self._idle.append((sandbox, time.monotonic()))
+                self._cond.notify_all()
+        if surplus is not None:
+            self._kill(surplus)
+
+    def _kill_all(self, sandboxes):
+        for sandbox in sandboxes:
+            self._kill(sandbox)
+
+    def _kill(self, sandbox):
+        if self.script_cache:
+            self.script_cache.forget(sandbox)
+        try:
+            sandbox.kill()
+        except Exception:
+            pass
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+if __name__ == "__main__":
+    import argparse
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="预热池租用延迟基准测试（离线）")
+    parser.add_argument("--size", type=int, default=3, help="预热池大小")
+    parser.add_argument("--requests", type=int, default=50, help="租用次数")
+    parser.add_argument("--create-delay", type=float, default=0.5,
+                        help="模拟的沙箱创建耗时（秒）")
+    parser.add_argument("--work", type=float, default=0.05,
+                        help="每次租用之间的间隔（秒），模拟业务执行")
+    args = parser.parse_args()
+
+    def factory():
+        return LocalSandbox.create(create_delay=args.create_delay)
+
+    def run(label, acquire, give_back):
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            sandbox = acquire()
+            latencies.append((time.perf_counter() - start) * 1000)
+            sandbox.commands.run("echo ok > /tmp/out.txt")
+            give_back(sandbox)
+            time.sleep(args.work)
+        print(f"   {label:<10} p50={_percentile(latencies, 50):8.2f} ms"
+              f"   p99={_percentile(latencies, 99):8.2f} ms")
+
+    print("=" * 60)
+    print(f"预热池基准测试: size={args.size}, requests={args.requests}, "
+          f"create_delay={args.create_delay}s")
+    print("=" * 60)
+
+    run("冷启动", factory, lambda sb: sb.kill())
+
+    with SandboxPool(factory=factory, size=args.size) as pool:
+        pool.start(wait=True)
+        run("预热池", pool.lease, pool.release)
+        print(f"\n📊 池统计: {pool.stats}")
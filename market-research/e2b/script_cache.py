@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的脚本上传缓存（Script Cache）
+
+_create_agents 每次都把 agent_a.py / agent_b.py / agent_c.py 重新写入沙箱；
+配合预热池复用沙箱后，这些字节在稳态下完全是重复传输。
+
+ScriptCache 的做法：
+- 对脚本内容计算 sha256，脚本存放在 /home/user/.script-cache/<sha256>.py
+  （隐藏目录，预热池的 reset 清理 /home/user/* 时不会删除）
+- 记录每个沙箱（以及模板）已经持有的哈希，已有的脚本直接跳过
+- 剩余需要上传的脚本合并为一次批量写入（bulk_files.write_many）
+- 提供 hits / misses / bytes_sent / bytes_skipped 计数
+
+sync() 返回 逻辑路径 → 沙箱内实际路径 的映射，执行时使用映射后的路径。
+沙箱销毁后调用 forget()，否则记录会一直累积；SandboxPool(script_cache=...) 和
+AgentOrchestrator 在销毁沙箱时会自动调用。
+"""
+
+import hashlib
+import threading
+
+from bulk_files import write_many
+from fan_out import command_result
+
+CACHE_DIR = "/home/user/.script-cache"
+
+
+def content_hash(script):
+    data = script.encode() if isinstance(script, str) else script
+    return hashlib.sha256(data).hexdigest()
+
+
+class ScriptCache:
+    """
+    脚本上传缓存
+
+    template_hashes: 模板中已预置在 CACHE_DIR 下的脚本哈希（对所有沙箱都视为命中）
+    verify:          同步前先列出沙箱内的缓存目录，防止缓存记录与沙箱实际内容不一致
+    """
+
+    def __init__(self, template_hashes=(), verify=False):
+        self.template_hashes = set(template_hashes)
+        self.verify = verify
+        self._held = {}     # sandbox_id -> 已上传的哈希集合
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_sent": 0, "bytes_skipped": 0}
+
+    def sync(self, sandbox, scripts):
+        """
+        确保 scripts（{逻辑路径: 源码}）都在沙箱中，返回 {逻辑路径: 沙箱内实际路径}
+        """
+        held = self._held_hashes(sandbox)
+        paths = {}
+        missing = {}
+        hits = skipped = 0
+
+        for logical_path, script in scripts.items():
+            digest = content_hash(script)
+            paths[logical_path] = f"{CACHE_DIR}/{digest}.py"
+            if digest in held or digest in self.template_hashes or digest in missing:
+                hits += 1
+                skipped += len(script)
+            else:
+                missing[digest] = script
+
+        write_many(sandbox, {f"{CACHE_DIR}/{d}.py": s for d, s in missing.items()})
+
+        with self._lock:
+            self._held.setdefault(sandbox.sandbox_id, set()).update(missing)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(missing)
+            self.stats["bytes_sent"] += sum(len(s) for s in missing.values())
+            self.stats["bytes_skipped"] += skipped
+        return paths
+
+    def forget(self, sandbox):
+        """沙箱被销毁或重建后，丢弃它的缓存记录"""
+        with self._lock:
+            self._held.pop(sandbox.sandbox_id, None)
+
+    def _held_hashes(self, sandbox):
+        if self.verify:
+            result = command_result(sandbox.commands.run, f"mkdir -p {CACHE_DIR} && ls {CACHE_DIR}")
+            present = {name[:-3] for name in result.stdout.split() if name.endswith(".py")}
+            with self._lock:
+                self._held[sandbox.sandbox_id] = present
+            return present
+        with self._lock:
+            return set(self._held.get(sandbox.sandbox_id, ()))
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    from local_sandbox import LocalSandbox
+    from orchestrator_pattern import AgentOrchestrator
+    from sandbox_pool import SandboxPool
+
+    parser = argparse.ArgumentParser(description="脚本上传缓存演示（离线）")
+    parser.add_argument("--workflows", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    cache = ScriptCache()
+    print("=" * 60)
+    print(f"连续执行 {args.workflows} 个工作流（预热池 size={args.pool_size}）")
+    print("=" * 60)
+
+    with SandboxPool(factory=LocalSandbox.create, size=args.pool_size, script_cache=cache) as pool:
+        pool.start(wait=True)
+        for i in range(1, args.workflows + 1):
+            before = cache.stats["bytes_sent"]
+            orchestrator = AgentOrchestrator(pool=pool, script_cache=cache)
+            with contextlib.redirect_stdout(io.StringIO()):
+                orchestrator.create_sandbox()
+                try:
+                    result = orchestrator.execute_workflow()
+                finally:
+                    orchestrator.cleanup()
+            print(f"   工作流 {i:>2}: 上传 {cache.stats['bytes_sent'] - before:>5} bytes"
+                  f"   {'✅' if result else '❌'}")
+
+    print(f"\n📊 缓存统计: {cache.stats}，关闭预热池后仍有记录的沙箱 {len(cache._held)} 个")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+沙箱内共享状态（SQLite WAL 任务队列）
+
+agents_collaboration.py 场景 4 里，每个 worker 都要完整读取 /tmp/state/shared_state.json，
+task_queue.pop(0)，再整体写回文件：
+- 每次领取任务都是 O(n) 的解析 + 序列化
+- 读-改-写之间没有任何互斥，多个进程并发时会重复领取、丢失更新，甚至读到写了一半的文件
+
+TaskQueue 基于 SQLite（WAL 模式），供同一沙箱内的多个 agent 进程共享：
+- claim(owner)：原子领取一个待处理任务（单条 UPDATE … RETURNING，按 id 先进先出）
+- complete(task_id, result) / fail(task_id, error, retry=True)：原子完成 / 失败（可重新入队）
+- requeue_stale(older_than)：领取后长时间未完成（worker 崩溃）的任务重新入队
+- set_state / get_state / state()：agent 状态等小型键值数据
+- WAL 模式下读不阻塞写；写操作由 SQLite 串行化，busy_timeout 内自动等待
+
+本文件只依赖标准库，可以原样上传到沙箱中导入：
+
+    install(sandbox)                       # 协调器侧：上传到 /home/user/.lib/shared_state.py
+
+    import sys                             # 沙箱内的 agent 脚本
+    sys.path.insert(0, "/home/user/.lib")
+    from shared_state import TaskQueue
+    queue = TaskQueue("/tmp/state/tasks.db")
+    while (task := queue.claim("agent_1")) is not None:
+        queue.complete(task.id, {"ok": True})
+
+直接运行本文件会对比 JSON 文件方式与 TaskQueue 在多进程并发下的领取吞吐。
+"""
+
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+LIB_DIR = "/home/user/.lib"
+DEFAULT_DB = "/tmp/state/tasks.db"
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+Task = namedtuple("Task", "id payload attempts")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    claimed_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, id);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# UPDATE … RETURNING 需要 SQLite 3.35+，更早的版本退回 BEGIN IMMEDIATE 事务
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class TaskQueue:
+    """
+    多进程安全的任务队列
+
+    path:    数据库文件路径（所有进程使用同一个路径）
+    timeout: 等待其他进程释放写锁的最长时间（秒）
+    """
+
+    def __init__(self, path=DEFAULT_DB, timeout=30.0):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None：自动提交，事务由代码显式控制
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def put(self, payload):
+        """添加一个任务，返回任务 id"""
+        cursor = self._conn.execute("INSERT INTO tasks (payload) VALUES (?)",
+                                    (json.dumps(payload),))
+        return cursor.lastrowid
+
+    def put_many(self, payloads):
+        """在一个事务中批量添加任务"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("INSERT INTO tasks (payload) VALUES (?)",
+                                   ((json.dumps(p),) for p in payloads))
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def claim(self, owner):
+        """原子领取最早的待处理任务，没有任务时返回 None"""
+        now = time.time()
+        if _HAS_RETURNING:
+            row = self._conn.execute(
+                "UPDATE tasks SET status = ?, owner = ?, claimed_at = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM tasks WHERE status = ? ORDER BY id LIMIT 1) "
+                "RETURNING id, payload, attempts",
+                (CLAIMED, owner, now, PENDING)).fetchone()
+        else:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts + 1 FROM tasks WHERE status = ? "
+                    "ORDER BY id LIMIT 1", (PENDING,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, owner = ?, claimed_at = ?, "
+                        "attempts = attempts + 1 WHERE id = ?", (CLAIMED, owner, now, row[0]))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        if row is None:
+            return None
+        return Task(row[0], json.loads(row[1]), row[2])
+
+    def complete(self, task_id, result=None):
+        """标记任务完成并保存结果"""
+        self._finish(task_id, DONE, result)
+
+    def fail(self, task_id, error=None, retry=True):
+        """标记任务失败；retry=True 时重新入队，等待其他 agent 领取"""
+        if retry:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, owner = NULL, claimed_at = NULL WHERE id = ?",
+                (PENDING, task_id))
+        else:
+            self._finish(task_id, FAILED, {"error": error})
+
+    def requeue_stale(self, older_than):
+        """领取超过 older_than 秒仍未完成的任务重新入队，返回重新入队的数量"""
+        cursor = self._conn.execute(
+            "UPDATE tasks SET status = ?, owner = NULL, claimed_at = NULL "
+            "WHERE status = ? AND claimed_at < ?",
+            (PENDING, CLAIMED, time.time() - older_than))
+        return cursor.rowcount
+
+    def counts(self):
+        """各状态的任务数"""
+        rows = self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return {status: count for status, count in rows}
+
+    def results(self):
+        """已完成任务的 [(id, owner, result)]，按 id 排序"""
+        rows = self._conn.execute(
+            "SELECT id, owner, result FROM tasks WHERE status = ? ORDER BY id", (DONE,))
+        return [(task_id, owner, json.loads(result) if result else None)
+                for task_id, owner, result in rows]
+
+    def set_state(self, key, value):
+        """写入共享键值"""
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                           (key, json.dumps(value)))
+
+    def get_state(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def state(self):
+        """全部共享键值"""
+        return {key: json.loads(value)
+                for key, value in self._conn.execute("SELECT key, value FROM state")}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _finish(self, task_id, status, result):
+        self._conn.execute(
+            "UPDATE tasks SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result), time.time(), task_id))
+
+
+def install(sandbox, lib_dir=LIB_DIR):
+    """把本模块上传到沙箱，agent 脚本把 lib_dir 加入 sys.path 后即可导入"""
+    with open(os.path.abspath(__file__)) as f:
+        sandbox.files.write(f"{lib_dir}/shared_state.py", f.read())
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    from bulk_files import write_many
+    from fan_out import command_result
+    from local_sandbox import LocalSandbox
+
+    parser = argparse.ArgumentParser(description="共享状态领取吞吐基准测试（离线）")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--naive-deadline", type=float, default=10.0,
+                        help="无锁 JSON worker 的最长运行时间（秒）")
+    args = parser.parse_args()
+
+    # 场景 4 原来的做法：整体读取 → pop(0) → 整体写回，没有互斥
+    # （并发时文件可能停留在被截断的状态，worker 永远读不到完整 JSON，因此设置截止时间）
+    json_naive_worker = f"""
+import json, sys, time
+path = '/tmp/state/shared_state.json'
+deadline = time.time() + {args.naive_deadline}
+claimed = []
+while time.time() < deadline:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except ValueError:
+        continue    # 读到了其他进程写了一半的文件
+    if not state['task_queue']:
+        break
+    task = state['task_queue'].pop(0)
+    state['completed_tasks'].append(sys.argv[1] + ' completed ' + task)
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    claimed.append(task)
+print(json.dumps(claimed))
+"""
+    # 加文件锁之后结果正确，但每次领取仍然是 O(n)
+    json_locked_worker = """
+import fcntl, json, sys
+path = '/tmp/state/shared_state.json'
+claimed = []
+with open('/tmp/state/shared_state.lock', 'w') as lock:
+    while True:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if not state['task_queue']:
+                break
+            task = state['task_queue'].pop(0)
+            state['completed_tasks'].append(sys.argv[1] + ' completed ' + task)
+            with open(path, 'w') as f:
+                json.dump(state, f)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        claimed.append(task)
+print(json.dumps(claimed))
+"""
+    sqlite_worker = f"""
+import json, sys
+sys.path.insert(0, {LIB_DIR!r})
+from shared_state import TaskQueue
+queue = TaskQueue({DEFAULT_DB!r})
+claimed = []
+while True:
+    task = queue.claim(sys.argv[1])
+    if task is None:
+        break
+    queue.complete(task.id, sys.argv[1] + ' completed ' + task.payload)
+    claimed.append(task.payload)
+print(json.dumps(claimed))
+"""
+    sqlite_init = f"""
+import sys
+sys.path.insert(0, {LIB_DIR!r})
+from shared_state import TaskQueue
+TaskQueue({DEFAULT_DB!r}).put_many(f'task{{i}}' for i in range({args.tasks}))
+"""
+    tasks = [f"task{i}" for i in range(args.tasks)]
+
+    def run_workers(sandbox, script_path):
+        start = time.perf_counter()
+        handles = [sandbox.commands.run(f"python3 {script_path} agent_{i}", background=True)
+                   for i in range(args.workers)]
+        results = [command_result(handle.wait) for handle in handles]
+        elapsed = time.perf_counter() - start
+        claims = Counter()
+        for result in results:
+            if result.exit_code == 0:
+                claims.update(json.loads(result.stdout))
+        return elapsed, claims
+
+    def report(label, elapsed, claims):
+        total = sum(claims.values())
+        duplicated = sum(n - 1 for n in claims.values() if n > 1)
+        lost = len(set(tasks) - set(claims))
+        print(f"   {label:<18} {elapsed:7.2f}s  {total / elapsed:9.1f} claims/s"
+              f"   重复领取 {duplicated:>5}   遗漏 {lost:>5}")
+
+    print("=" * 60)
+    print(f"{args.tasks} 个任务, {args.workers} 个并发 worker 进程")
+    print("=" * 60)
+
+    sandbox = LocalSandbox.create()
+    try:
+        install(sandbox)
+        write_many(sandbox, {
+            "/tmp/bench/json_naive.py": json_naive_worker,
+            "/tmp/bench/json_locked.py": json_locked_worker,
+            "/tmp/bench/sqlite_worker.py": sqlite_worker,
+            "/tmp/bench/sqlite_init.py": sqlite_init,
+        })
+        initial_state = json.dumps({"task_queue": tasks, "completed_tasks": []})
+
+        for label, script in (("JSON 文件（无锁）", "/tmp/bench/json_naive.py"),
+                              ("JSON 文件 + flock", "/tmp/bench/json_locked.py")):
+            sandbox.files.write("/tmp/state/shared_state.json", initial_state)
+            report(label, *run_workers(sandbox, script))
+
+        sandbox.commands.run("python3 /tmp/bench/sqlite_init.py")
+        report("SQLite TaskQueue", *run_workers(sandbox, "/tmp/bench/sqlite_worker.py"))
+    finally:
+        sandbox.kill()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+沙箱快照工厂（Snapshot / Fork）
+
+每个阶段、每个 Worker 都从 Sandbox.create() 开始：创建沙箱、上传脚本、安装依赖、预热解释器，
+同样的准备工作重复 N 次。
+
+SnapshotFactory 只准备一次，之后从准备好的状态克隆：
+- mode="snapshot"：准备好的沙箱执行 create_snapshot() 后销毁，
+  之后每次调用都是 Sandbox.create(snapshot_id)，快照可以长期保留、跨进程复用
+- mode="fork"：保留准备好的父沙箱，每次调用 parent.fork()；
+  spawn_many(n) 一次请求克隆 n 个
+- 工厂本身是无参可调用对象，可以直接传给 SandboxPool / fan_out / MasterWorker 的 factory 参数
+
+e2b 的快照连同内存一起保存（已启动的进程、已 import 的模块都在）；
+LocalSandbox 只克隆文件系统（cp --reflink=auto），进程状态不会带过去。
+
+直接运行本文件会离线对比 "创建 + 准备" 与 从快照 / 分叉创建 的延迟（p50/p99）。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = ("snapshot", "fork")
+
+
+def _default_factory():
+    """默认使用 E2B 创建沙箱"""
+    from e2b import Sandbox
+    return Sandbox.create()
+
+
+def _kill(sandbox):
+    try:
+        sandbox.kill()
+    except Exception:
+        pass
+
+
+class SnapshotFactory:
+    """
+    从准备好的快照克隆沙箱
+
+    用法：
+        def prepare(sandbox):
+            write_many(sandbox, AGENT_SCRIPTS)
+            sandbox.commands.run("pip install pandas")
+
+        with SnapshotFactory(prepare) as factory:
+            sandbox = factory()                 # 脚本和依赖已就绪
+            pool = SandboxPool(factory=factory)
+
+    prepare:        准备函数，接收新建的沙箱，只执行一次
+    factory:        创建基础沙箱的函数，默认 e2b Sandbox.create
+    mode:           "snapshot" 或 "fork"
+    name:           快照名称（仅 snapshot 模式）
+    create_options: 从快照创建时传给 Sandbox.create 的额外参数（如 timeout / envs）
+    """
+
+    def __init__(self, prepare=None, factory=None, mode="snapshot", name=None,
+                 create_options=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+        self.prepare = prepare
+        self.factory = factory or _default_factory
+        self.mode = mode
+        self.name = name
+        self.create_options = create_options or {}
+
+        self.snapshot_id = None
+        self._parent = None
+        self._sandbox_cls = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "build_time": None,     # 准备 + 打快照的耗时（秒）
+            "spawned": 0,
+            "spawn_failures": 0,
+        }
+
+    def build(self):
+        """创建基础沙箱、执行 prepare 并打快照（只执行一次，线程安全）"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("factory is closed")
+            if self._sandbox_cls is not None:
+                return self
+
+            start = time.perf_counter()
+            sandbox = self.factory()
+            try:
+                if self.prepare:
+                    self.prepare(sandbox)
+                if self.mode == "snapshot":
+                    self.snapshot_id = sandbox.create_snapshot(self.name).snapshot_id
+            except BaseException:
+                _kill(sandbox)
+                raise
+
+            if self.mode == "snapshot":
+                # 快照已保存，准备用的沙箱不再需要
+                _kill(sandbox)
+            else:
+                self._parent = sandbox
+            self._sandbox_cls = type(sandbox)
+            self.stats["build_time"] = time.perf_counter() - start
+        return self
+
+    def __call__(self):
+        """克隆一个沙箱"""
+        return self.spawn_many(1)[0]
+
+    def spawn_many(self, count):
+        """克隆 count 个沙箱；任何一个失败时销毁已创建的并抛出异常"""
+        self.build()
+        if self.mode == "fork":
+            sandboxes = self._parent.fork(count=count)
+        else:
+            sandboxes = self._create_many(count)
+
+        errors = [s for s in sandboxes if isinstance(s, Exception)]
+        with self._lock:
+            self.stats["spawned"] += len(sandboxes) - len(errors)
+            self.stats["spawn_failures"] += len(errors)
+        if errors:
+            for sandbox in sandboxes:
+                if not isinstance(sandbox, Exception):
+                    _kill(sandbox)
+            raise errors[0]
+        return sandboxes
+
+    def close(self):
+        """删除快照 / 销毁父沙箱（已克隆出的沙箱由调用方负责销毁）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self.snapshot_id:
+                try:
+                    self._sandbox_cls.delete_snapshot(self.snapshot_id)
+                except Exception as e:
+                    print(f"⚠️  删除快照 {self.snapshot_id} 失败: {e}")
+            if self._parent is not None:
+                _kill(self._parent)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _create(self):
+        try:
+            return self._sandbox_cls.create(self.snapshot_id, **self.create_options)
+        except Exception as e:
+            return e
+
+    def _create_many(self, count):
+        if count == 1:
+            return [self._create()]
+        with ThreadPoolExecutor(max_workers=min(count, 16)) as executor:
+            return list(executor.map(lambda _: self._create(), range(count)))
+
+
+if __name__ == "__main__":
+    import argparse
+    from local_sandbox import LocalSandbox
+    from bulk_files import write_many
+    from sandbox_pool import _percentile
+
+    parser = argparse.ArgumentParser(description="快照 / 分叉创建延迟基准测试（离线）")
+    parser.add_argument("--requests", type=int, default=20, help="创建次数")
+    parser.add_argument("--scripts", type=int, default=10, help="准备阶段上传的脚本数")
+    parser.add_argument("--setup", type=float, default=1.0,
+                        help="准备阶段的初始化命令耗时（秒），模拟 pip install")
+    parser.add_argument("--create-delay", type=float, default=0.5,
+                        help="模拟的沙箱创建耗时（秒）")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的请求往返延迟（秒）")
+    args = parser.parse_args()
+
+    scripts = {f"/home/user/agents/agent_{i}.py": f"print('agent {i}')\n" * 200
+               for i in range(args.scripts)}
+
+    def factory():
+        return LocalSandbox.create(create_delay=args.create_delay, latency=args.latency)
+
+    def prepare(sandbox):
+        write_many(sandbox, scripts)
+        result = sandbox.commands.run(
+            f"sleep {args.setup} && mkdir -p /home/user/.deps && echo ready > /home/user/.deps/ok")
+        assert result.exit_code == 0, result.stderr
+
+    def run(label, spawn):
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            sandbox = spawn()
+            latencies.append((time.perf_counter() - start) * 1000)
+            result = sandbox.commands.run("cat /home/user/.deps/ok && python3 /home/user/agents/agent_0.py")
+            assert result.exit_code == 0 and result.stdout.startswith("ready"), result.stderr
+            sandbox.kill()
+        print(f"   {label:<14} p50={_percentile(latencies, 50):8.1f} ms"
+              f"   p99={_percentile(latencies, 99):8.1f} ms")
+
+    print("=" * 60)
+    print(f"快照创建基准测试: requests={args.requests}, create_delay={args.create_delay}s, "
+          f"setup={args.setup}s, latency={args.latency * 1000:.0f}ms")
+    print("=" * 60)
+
+    def cold():
+        sandbox = factory()
+        prepare(sandbox)
+        return sandbox
+
+    run("创建 + 准备", cold)
+
+    options = {"create_delay": args.create_delay, "latency": args.latency}
+    with SnapshotFactory(prepare, factory, mode="snapshot", create_options=options) as snap:
+        snap.build()
+        run("从快照创建", snap)
+        print(f"   (快照构建耗时 {snap.stats['build_time']:.2f}s，只发生一次)")
+
+    with SnapshotFactory(prepare, factory, mode="fork") as forker:
+        forker.build()
+        run("fork", forker)
+        start = time.perf_counter()
+        clones = forker.spawn_many(args.requests)
+        elapsed = time.perf_counter() - start
+        for clone in clones:
+            clone.kill()
+        print(f"   spawn_many({args.requests}) 一次请求: {elapsed * 1000:.1f} ms")
+        print(f"\n📊 统计: {forker.stats}")
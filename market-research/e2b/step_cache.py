@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+确定性步骤的结果缓存（Step Cache）
+
+execute_workflow 每次都用固定的 INITIAL_INPUT 跑同样的 Agent A → B → C：
+同样的 (脚本, 输入) 在新沙箱里一遍遍重新执行，结果每次都一样。
+
+StepCache 以 sha256(模板 + 脚本源码 + 规范化 JSON 输入) 为键缓存步骤输出：
+- 内存层：LRU，最多 max_entries 条
+- 磁盘层：<root>/<key[:2]>/<key>.json，超过 max_disk_bytes 时按最近使用时间淘汰，
+  进程重启后仍然有效
+- TTL：每条记录带过期时间，过期视为未命中并删除
+- CachePolicy：按步骤控制是否缓存、TTL、是否写磁盘；有副作用或不确定的步骤用 NO_CACHE
+- 只缓存成功的输出（None 表示失败，不缓存）；输出必须可以 JSON 序列化
+
+缓存是可选的：AgentOrchestrator(step_cache=StepCache(...)) 才会启用，
+所有步骤都命中时连沙箱都不会创建。
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "step-cache")
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    单个步骤的缓存策略
+
+    enabled: 是否使用缓存
+    ttl:     过期时间（秒），None 使用 StepCache 的默认值
+    disk:    是否写入磁盘层（False 时只在内存中缓存）
+    """
+    enabled: bool = True
+    ttl: float = None
+    disk: bool = True
+
+
+DEFAULT_POLICY = CachePolicy()
+NO_CACHE = CachePolicy(enabled=False)
+
+
+def step_key(script, input_data=None, template=None):
+    """计算步骤的缓存键：模板、脚本源码和输入（键排序的紧凑 JSON）共同决定"""
+    digest = hashlib.sha256()
+    for part in (template or "", script,
+                 json.dumps(input_data, sort_keys=True, separators=(",", ":"))):
+        data = part.encode() if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class StepCache:
+    """
+    两级步骤结果缓存
+
+    用法：
+        cache = StepCache()
+        output = cache.get_or_run(script, input_data, lambda: run_in_sandbox(...))
+
+    root:           磁盘层目录，None 时只使用内存层
+    max_entries:    内存层最多保存的条目数
+    max_disk_bytes: 磁盘层总大小上限
+    ttl:            默认过期时间（秒），None 表示不过期
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_entries=1024, max_disk_bytes=256 << 20,
+                 ttl=3600.0):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = collections.OrderedDict()    # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                      "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] is None or entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return True, entry[1]
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry["expires"], entry["value"])
+        return True, entry["value"]
+
+    def put(self, key, value, policy=DEFAULT_POLICY):
+        """保存步骤输出"""
+        ttl = policy.ttl if policy.ttl is not None else self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._remember(key, expires, value)
+            self.stats["stores"] += 1
+        if policy.disk and self.root:
+            self._write_disk(key, {"expires": expires, "value": value})
+
+    def get_or_run(self, script, input_data, run, policy=DEFAULT_POLICY, template=None):
+        """
+        命中时直接返回缓存的输出，否则调用 run() 执行并缓存成功的结果
+
+        返回 (输出, 是否命中)
+        """
+        if not policy.enabled:
+            return run(), False
+        key = step_key(script, input_data, template)
+        hit, value = self.get(key)
+        if hit:
+            return value, True
+        value = run()
+        if value is not None:
+            self.put(key, value, policy)
+        return value, False
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.root:
+            self._remove_disk(self._path(key))
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+        if self.root and os.path.isdir(self.root):
+            for path, _, _ in self._disk_entries():
+                self._remove_disk(path)
+
+    @property
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    # ---------- 内存层 ----------
+
+    def _remember(self, key, expires, value):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # ---------- 磁盘层 ----------
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.root:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] is not None and entry["expires"] <= now:
+            self._remove_disk(path)
+            with self._lock:
+                self.stats["expired"] += 1
+            return None
+        try:
+            # 以修改时间作为最近使用时间，淘汰时优先删除最久未用的
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(entry, separators=(",", ":"))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += len(data) - previous
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        """[(路径, 大小, 最近使用时间)]"""
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        # 淘汰到上限的 90%，避免每次写入都触发一次目录扫描
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            self._remove_disk(path)
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+
+    @staticmethod
+    def _remove_disk(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import shutil
+
+    from local_sandbox import install
+
+    parser = argparse.ArgumentParser(description="步骤结果缓存演示（离线）")
+    parser.add_argument("--runs", type=int, default=5, help="重复执行工作流的次数")
+    parser.add_argument("--create-delay", type=float, default=0.5,
+                        help="模拟的沙箱创建耗时（秒）")
+    args = parser.parse_args()
+
+    install()
+    from benchmark_suite import _FactoryPool
+    from local_sandbox import LocalSandbox
+    from orchestrator_pattern import AgentOrchestrator
+
+    def factory():
+        return LocalSandbox.create(create_delay=args.create_delay)
+
+    root = tempfile.mkdtemp(prefix="step-cache-")
+
+    def run_workflows(label, make_cache):
+        timings = []
+        for _ in range(args.runs):
+            cache = make_cache()
+            orchestrator = AgentOrchestrator(pool=_FactoryPool(factory), step_cache=cache)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    orchestrator.create_sandbox()
+                    result = orchestrator.execute_workflow()
+                finally:
+                    orchestrator.cleanup()
+            timings.append(time.perf_counter() - start)
+            assert result is not None
+        print(f"   {label:<22} 首次 {timings[0] * 1000:7.1f} ms   "
+              f"之后平均 {sum(timings[1:]) / max(len(timings) - 1, 1) * 1000:7.1f} ms")
+        return cache
+
+    print("=" * 60)
+    print(f"重复执行工作流 {args.runs} 次（create_delay={args.create_delay}s）")
+    print("=" * 60)
+    try:
+        run_workflows("无缓存", lambda: None)
+        shared = StepCache(root=None)
+        cache = run_workflows("内存缓存", lambda: shared)
+        print(f"   {'':<22} 命中率 {cache.hit_rate:.0%}, {cache.stats}")
+        # 每次新建 StepCache 模拟进程重启，只有磁盘层能命中
+        cache = run_workflows("磁盘缓存（模拟重启）", lambda: StepCache(root=root))
+        print(f"   {'':<22} {cache.stats}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
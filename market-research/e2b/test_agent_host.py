@@ -0,0 +1,43 @@
+"""AgentHost 在 LocalSandbox 上的启动、调用与进程退出（输出只经由 handle.wait() 送达）"""
+
+import pytest
+
+from agent_host import AgentHost, AgentHostError
+from local_sandbox import LocalSandbox
+
+ECHO = "import json\nprint(json.dumps({'echo': input_data}))\n"
+
+
+@pytest.fixture
+def sandbox():
+    sandbox = LocalSandbox.create()
+    sandbox.files.write("/home/user/echo.py", ECHO)
+    yield sandbox
+    sandbox.kill()
+
+
+def test_start_and_call(sandbox):
+    with AgentHost(sandbox) as host:
+        assert host.alive
+        assert host.call("/home/user/echo.py", {"x": 1}) == {"echo": {"x": 1}}
+        assert host.call("/home/user/echo.py", [1, 2]) == {"echo": [1, 2]}
+
+
+def test_script_error_keeps_host_alive(sandbox):
+    sandbox.files.write("/home/user/fail.py", "raise ValueError('bad input')\n")
+    with AgentHost(sandbox) as host:
+        with pytest.raises(AgentHostError, match="bad input"):
+            host.call("/home/user/fail.py")
+        assert host.alive
+        assert host.call("/home/user/echo.py", 1) == {"echo": 1}
+
+
+def test_host_exit_fails_calls(sandbox):
+    sandbox.files.write("/home/user/die.py", "import os\nos._exit(7)\n")
+    with AgentHost(sandbox) as host:
+        with pytest.raises(AgentHostError, match="exited"):
+            host.call("/home/user/die.py", timeout=5)
+        assert not host.alive
+        with pytest.raises(AgentHostError):
+            host.call("/home/user/echo.py", 1)
+
@@ -0,0 +1,36 @@
+"""CodeSession kernel 后端在 LocalSandbox 上的启动与状态保留（输出只经由 handle.wait() 送达）"""
+
+import pytest
+
+from code_session import CodeSession, CodeSessionError
+from local_sandbox import LocalSandbox
+
+
+@pytest.fixture
+def session():
+    sandbox = LocalSandbox.create()
+    session = CodeSession(sandbox, backend="kernel")
+    yield session
+    session.close()
+    sandbox.kill()
+
+
+def test_variables_persist_between_cells(session):
+    session.run("x = 20")
+    cell = session.run("print('hi'); x + 1")
+    assert cell.text == "21"
+    assert cell.stdout == "hi\n"
+    assert cell.error is None
+
+
+def test_contexts_are_isolated(session):
+    session.run("secret = 42", context="a")
+    cell = session.run("secret", context="b")
+    assert cell.error.name == "NameError"
+    assert session.run("secret", context="a").text == "42"
+
+
+def test_kernel_exit_fails_the_context(session):
+    session.run("import os")
+    with pytest.raises(CodeSessionError):
+        session.run("os._exit(3)", timeout=5)
@@ -0,0 +1,44 @@
+"""
+DagWorkflow.run_sync 的调度语义
+
+同步协调器（orchestrator_pattern）通过 run_sync 执行工作流：不能依赖事件循环，
+步骤失败时只跳过下游，并把错误记录在 StepRun.error 中，而不是变成一个没有原因的 None。
+"""
+
+import asyncio
+
+from dag_workflow import DONE, FAILED, SKIPPED, DagWorkflow
+
+
+def _workflow():
+    return (DagWorkflow()
+            .add_step("a", "")
+            .add_step("b", "", needs=["a"])
+            .add_step("c", "", needs=["a", "b"])
+            .add_step("d", ""))
+
+
+def test_run_sync_passes_outputs_in_topological_order():
+    def run_step(step, payload):
+        return {"a": lambda: payload + 1, "b": lambda: payload * 10,
+                "c": lambda: payload, "d": lambda: "d"}[step.name]()
+
+    run = _workflow().run_sync(run_step, initial_input=1)
+    assert run.ok
+    assert run.outputs == {"a": 2, "b": 20, "c": {"a": 2, "b": 20}, "d": "d"}
+
+
+def test_run_sync_records_errors_and_skips_downstream_inside_event_loop():
+    def run_step(step, payload):
+        if step.name == "b":
+            raise ValueError("boom")
+        return step.name
+
+    async def main():
+        # 调用方本身运行在事件循环中（asyncio.run 在这里会失败）
+        return _workflow().run_sync(run_step)
+
+    run = asyncio.run(main())
+    statuses = {name: step.status for name, step in run.steps.items()}
+    assert statuses == {"a": DONE, "b": FAILED, "c": SKIPPED, "d": DONE}
+    assert run.steps["b"].error == "ValueError: boom"
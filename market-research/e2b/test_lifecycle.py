@@ -0,0 +1,47 @@
+"""
+SandboxRegistry 共享注册表文件时的行为
+
+多个注册表可以使用同一个文件（例如都用默认的 DEFAULT_PATH）：各自的写入不能抹掉对方的记录，
+recover() 也不能把同一进程内另一个注册表仍在使用的沙箱当作遗留沙箱销毁。
+"""
+
+import pytest
+
+from lifecycle import SandboxRegistry
+from local_sandbox import LocalSandbox
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "registry.json")
+
+
+def test_registries_sharing_a_file_keep_each_others_records(path):
+    first, second = SandboxRegistry(path=path), SandboxRegistry(path=path)
+    a = first.factory(LocalSandbox.create)()
+    b = second.factory(LocalSandbox.create)()
+    try:
+        first.release(a)
+        first.sweep()       # 只有 first 的内存里没有 b 的记录
+        alive = {r.sandbox_id for r in SandboxRegistry(path=path).records(alive_only=True)}
+        assert alive == {a.sandbox_id, b.sandbox_id}
+    finally:
+        a.kill()
+        b.kill()
+    assert SandboxRegistry(path=path).records(alive_only=True) == []
+
+
+def test_recover_skips_registry_in_same_process_unless_forced(path):
+    owner = SandboxRegistry(path=path)
+    sandbox = owner.factory(LocalSandbox.create)()
+    try:
+        other = SandboxRegistry(path=path)
+        assert other.recover() == []
+        assert owner.is_alive(sandbox)
+        assert other.stats["survivors_killed"] == 0
+
+        other.recover(force=True, connect=lambda record: sandbox._sandbox)
+        assert other.stats["survivors_killed"] == 1
+        assert not [r for r in SandboxRegistry(path=path).records(alive_only=True)]
+    finally:
+        sandbox.kill()
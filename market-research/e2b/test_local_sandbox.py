@@ -0,0 +1,86 @@
+"""
+LocalSandbox 与 e2b SDK 行为一致性的检查
+
+离线示例全部跑在 LocalSandbox 上：替身与 SDK 的语义不一致时（例如后台命令的回调），
+示例在本地通过、在真实沙箱上失败。这里固定住协调器组件依赖的那部分语义。
+"""
+
+import time
+
+import pytest
+
+from local_sandbox import CommandExitException, LocalSandbox, TimeoutException
+
+
+@pytest.fixture
+def sandbox():
+    sandbox = LocalSandbox.create()
+    yield sandbox
+    sandbox.kill()
+
+
+def test_background_run_ignores_callbacks(sandbox):
+    # e2b 的 run(background=True) 直接返回句柄，传给 run 的回调不会被调用
+    seen = []
+    handle = sandbox.commands.run("echo out; echo err >&2", background=True,
+                                  on_stdout=seen.append, on_stderr=seen.append)
+    time.sleep(0.3)
+    assert seen == []
+    assert handle.wait().stdout == "out\n"
+    assert seen == []
+
+
+def test_wait_delivers_output_to_callbacks(sandbox):
+    handle = sandbox.commands.run("echo err >&2; sleep 0.2; echo a; echo b", background=True)
+    time.sleep(0.1)     # wait() 之前输出的 stderr 也要送达
+    stdout, stderr = [], []
+    result = handle.wait(on_stdout=stdout.append, on_stderr=stderr.append)
+    assert stdout == ["a\n", "b\n"]
+    assert stderr == ["err\n"]
+    assert result.exit_code == 0
+    assert result.stdout == "a\nb\n"
+
+
+def test_wait_raises_on_nonzero_exit(sandbox):
+    handle = sandbox.commands.run("echo partial; echo boom >&2; exit 3", background=True)
+    with pytest.raises(CommandExitException) as info:
+        handle.wait()
+    assert info.value.exit_code == 3
+    assert info.value.stdout == "partial\n"
+    assert info.value.stderr == "boom\n"
+
+
+def test_killed_background_command_raises_from_wait(sandbox):
+    handle = sandbox.commands.run("sleep 30", background=True)
+    assert handle.kill()
+    with pytest.raises(CommandExitException):
+        handle.wait()
+
+
+def test_iterating_handle_then_wait(sandbox):
+    handle = sandbox.commands.run("echo one; echo two >&2; echo three", background=True)
+    stdout = [out for out, _, _ in handle if out is not None]
+    assert stdout == ["one\n", "three\n"]
+    assert handle.wait().exit_code == 0
+
+
+def test_foreground_run_calls_callbacks(sandbox):
+    seen = []
+    with pytest.raises(CommandExitException) as info:
+        sandbox.commands.run("echo hi; exit 2", on_stdout=seen.append)
+    assert seen == ["hi\n"]
+    assert info.value.exit_code == 2
+
+
+def test_foreground_run_raises_on_nonzero_exit(sandbox):
+    # e2b 的前台 run 与 handle.wait() 一样：非零退出码抛出 CommandExitException
+    with pytest.raises(CommandExitException) as info:
+        sandbox.commands.run("echo partial; echo boom >&2; exit 3")
+    assert info.value.exit_code == 3
+    assert info.value.stdout == "partial\n"
+    assert info.value.stderr == "boom\n"
+
+
+def test_foreground_run_raises_on_timeout(sandbox):
+    with pytest.raises(TimeoutException):
+        sandbox.commands.run("sleep 30", timeout=0.2)
@@ -0,0 +1,39 @@
+"""
+MasterWorker.close() 与重试扩容的交互
+
+close() 之后仍在执行的任务失败时会进入重试队列；这时不能再扩容出 close() 看不到的 Worker，
+close() 返回时所有 Worker 线程都已退出、沙箱都已销毁。
+"""
+
+from local_sandbox import LocalSandbox
+from master_worker import MasterWorker
+
+# 每个任务第一次执行失败，第二次成功（以沙箱内的标记文件区分）
+FLAKY_WORKER = """
+import json, os
+task = input_data
+marker = f"/tmp/tried-{task}"
+if not os.path.exists(marker):
+    open(marker, "w").close()
+    raise RuntimeError(f"first attempt of {task} fails")
+print(json.dumps(task))
+"""
+
+
+def test_close_waits_for_workers_spawned_by_retries():
+    created = []
+
+    def factory():
+        sandbox = LocalSandbox.create()
+        created.append(sandbox)
+        return sandbox
+
+    workers = MasterWorker(FLAKY_WORKER, factory=factory, min_workers=1, max_workers=4,
+                           max_attempts=2)
+    futures = [workers.submit(i) for i in range(8)]
+    workers.close()
+
+    assert all(future.done() for future in futures)
+    assert not [t for t in workers._threads if t.is_alive()]
+    assert workers.metrics()["workers"] == 0
+    assert not [sandbox for sandbox in created if sandbox.is_running()]
@@ -0,0 +1,74 @@
+"""
+SandboxRouter 的熔断状态机
+
+熔断到期后只放行一个试探请求：试探失败立即再次熔断，成功才恢复；
+试探进行期间其他请求不会被放给这个供应商。
+"""
+
+import time
+
+import pytest
+
+from providers import CLOSED, HALF_OPEN, OPEN, NoProviderAvailable, Provider, SandboxRouter
+
+
+class _Sandbox:
+    sandbox_id = "fake"
+
+    def kill(self):
+        pass
+
+
+@pytest.fixture
+def flaky():
+    state = {"fail": True}
+
+    def create(**kwargs):
+        if state["fail"]:
+            raise RuntimeError("create failed")
+        return _Sandbox()
+    return state, Provider("flaky", create)
+
+
+def _router(provider):
+    return SandboxRouter([provider], failure_threshold=2, cooldown=0.05, explore=0.0)
+
+
+def _breaker(router):
+    return router.metrics()["flaky"]["breaker"]
+
+
+def test_failed_probe_reopens_immediately(flaky):
+    state, provider = flaky
+    router = _router(provider)
+    for _ in range(2):
+        with pytest.raises(NoProviderAvailable):
+            router.create()
+    assert _breaker(router) == OPEN
+    assert router.rank() == []
+
+    time.sleep(0.06)
+    assert _breaker(router) == HALF_OPEN
+    with pytest.raises(NoProviderAvailable):
+        router.create()             # 试探失败：不需要再攒够 failure_threshold 次
+    assert _breaker(router) == OPEN
+
+
+def test_only_one_probe_and_success_closes(flaky):
+    state, provider = flaky
+    router = _router(provider)
+    for _ in range(2):
+        with pytest.raises(NoProviderAvailable):
+            router.create()
+    time.sleep(0.06)
+
+    probe = router._admit(provider)
+    assert probe is True
+    assert router.rank() == []      # 试探进行中，其他请求不会被放行
+    with pytest.raises(NoProviderAvailable):
+        router._admit(provider)
+    router._record(provider, 0.01, probe)
+    assert _breaker(router) == CLOSED
+
+    state["fail"] = False
+    assert router.create().provider == "flaky"
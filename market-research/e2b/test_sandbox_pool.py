@@ -0,0 +1,29 @@
+"""
+SandboxPool 的补充策略
+
+size 是空闲目标：租出的沙箱归还后放回池中，不会出现 "租用触发补充、归还时再淘汰一个" 的反复创建。
+"""
+
+import time
+
+from local_sandbox import LocalSandbox
+from sandbox_pool import SandboxPool
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_sequential_leases_do_not_churn_sandboxes():
+    with SandboxPool(factory=LocalSandbox.create, size=2, sweep_interval=0.05) as pool:
+        pool.start(wait=True, timeout=5)
+        for _ in range(20):
+            sandbox = pool.lease()
+            sandbox.commands.run("echo ok > /tmp/out.txt")
+            pool.release(sandbox)
+            assert _wait_for(lambda: pool.idle_count() >= pool.size + 1)
+        assert pool.stats["hits"] == 20
+        assert pool.stats["created"] == pool.size + 1
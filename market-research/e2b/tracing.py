@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+结构化追踪（Span Tracing）
+
+AgentOrchestrator.log 只往 execution_log 里追加格式化好的字符串：没有耗时，也无法汇总。
+Tracer 以 span 记录每一段操作：
+- 单调时钟（perf_counter_ns）的开始时间和持续时间
+- 任意属性：沙箱 ID、字节数、退出码……
+- 父子关系：span 可以嵌套，父 span 通过 contextvars 传递，线程和 asyncio 任务都适用
+- event()：瞬时事件（如日志消息），显示在时间线上
+- export_chrome()：导出 Chrome Trace Event 格式的 JSON，
+  可以直接拖进 chrome://tracing 或 https://ui.perfetto.dev 查看
+- 关闭时（Tracer(enabled=False) / NULL_TRACER）span() 返回共享的空对象，几乎没有开销
+
+用法：
+    tracer = Tracer()
+    with tracer.span("run_agent", agent="A") as span:
+        ...
+        span.set(stdout_bytes=len(stdout))
+    tracer.export_chrome("trace.json")
+
+直接运行本文件会用 LocalSandbox 离线跑一遍 AgentOrchestrator 工作流并导出 trace，
+同时测量开启 / 关闭追踪时每个 span 的开销。
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一段被追踪的操作；作为上下文管理器使用"""
+
+    __slots__ = ("tracer", "name", "attrs", "parent", "start", "end", "tid", "_token")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = None
+        self.end = None
+        self.tid = None
+        self._token = None
+
+    def set(self, **attrs):
+        """补充属性（如执行完成后才知道的字节数、退出码）"""
+        self.attrs.update(attrs)
+        return self
+
+    @property
+    def duration_ms(self):
+        if self.end is None:
+            return None
+        return (self.end - self.start) / 1e6
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.tid = threading.get_ident()
+        self._token = _current.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter_ns()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self)
+        return False
+
+
+class _NullSpan:
+    """追踪关闭时使用的空 span"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    span 收集器
+
+    enabled:   False 时所有 span / event 都是空操作
+    max_spans: 最多保留的 span 数，超出后丢弃新的 span（计入 dropped）
+    """
+
+    def __init__(self, enabled=True, max_spans=100_000):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.spans = []
+        self.events = []
+        self.dropped = 0
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def span(self, name, **attrs):
+        """开始一个 span（配合 with 使用）"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attrs)
+
+    def event(self, name, **attrs):
+        """记录一个瞬时事件"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self.events) < self.max_spans:
+                self.events.append((name, time.perf_counter_ns(), threading.get_ident(), attrs))
+
+    def _finish(self, span):
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def summary(self):
+        """按 span 名称汇总：次数、总耗时、平均、最大（毫秒）"""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            stats = totals.setdefault(span.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += span.duration_ms
+            stats["max_ms"] = max(stats["max_ms"], span.duration_ms)
+        for stats in totals.values():
+            stats["mean_ms"] = stats["total_ms"] / stats["count"]
+        return totals
+
+    def print_summary(self):
+        print(f"   {'span':<20} {'次数':>6} {'总耗时':>10} {'平均':>10} {'最大':>10}")
+        for name, s in sorted(self.summary().items(), key=lambda kv: -kv[1]["total_ms"]):
+            print(f"   {name:<20} {s['count']:>6} {s['total_ms']:>8.1f}ms "
+                  f"{s['mean_ms']:>8.1f}ms {s['max_ms']:>8.1f}ms")
+
+    def to_chrome(self):
+        """转换为 Chrome Trace Event 格式（ph=X 完整事件，ph=i 瞬时事件，时间单位微秒）"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            events = list(self.events)
+
+        tids = {}
+
+        def tid(ident):
+            return tids.setdefault(ident, len(tids) + 1)
+
+        trace = []
+        for span in sorted(spans, key=lambda s: s.start):
+            args = dict(span.attrs)
+            if span.parent is not None:
+                args["parent"] = span.parent.name
+            trace.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self._origin) / 1000,
+                "dur": (span.end - span.start) / 1000,
+                "pid": pid,
+                "tid": tid(span.tid),
+                "args": _jsonable(args),
+            })
+        for name, ts, ident, attrs in events:
+            trace.append({
+                "name": name,
+                "ph": "i",
+                "s": "t",
+                "ts": (ts - self._origin) / 1000,
+                "pid": pid,
+                "tid": tid(ident),
+                "args": _jsonable(attrs),
+            })
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, n in tids.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": n,
+                          "args": {"name": names.get(ident, f"thread-{n}")}})
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"dropped_spans": self.dropped}}
+
+    def export_chrome(self, path):
+        """导出为 chrome://tracing / Perfetto 可直接打开的 JSON 文件"""
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+
+def _jsonable(attrs):
+    return {k: v if isinstance(v, (str, int, float, bool, type(None))) else repr(v)
+            for k, v in attrs.items()}
+
+
+# 默认的关闭状态追踪器
+NULL_TRACER = Tracer(enabled=False)
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+
+    from local_sandbox import install
+
+    parser = argparse.ArgumentParser(description="AgentOrchestrator 追踪演示（离线）")
+    parser.add_argument("--output", default="trace.json", help="trace 文件路径")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟的请求往返延迟（秒）")
+    parser.add_argument("--overhead-spans", type=int, default=200_000,
+                        help="测量追踪开销时创建的 span 数")
+    args = parser.parse_args()
+
+    install()
+    from local_sandbox import LocalSandbox
+    from orchestrator_pattern import AgentOrchestrator
+    from sandbox_pool import SandboxPool
+
+    def factory():
+        return LocalSandbox.create(latency=args.latency)
+
+    tracer = Tracer()
+    with SandboxPool(factory=factory, size=1) as pool:
+        pool.start(wait=True)
+        orchestrator = AgentOrchestrator(pool=pool, tracer=tracer)
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                orchestrator.create_sandbox()
+                result = orchestrator.execute_workflow()
+            finally:
+                orchestrator.cleanup()
+
+    print("=" * 60)
+    print(f"AgentOrchestrator 工作流追踪（latency={args.latency * 1000:.0f}ms）")
+    print("=" * 60)
+    print(f"   工作流结果: {'成功' if result else '失败'}")
+    tracer.print_summary()
+    tracer.export_chrome(args.output)
+    print(f"\n💾 已导出 {len(tracer.spans)} 个 span: {args.output}"
+          f"（chrome://tracing 或 https://ui.perfetto.dev 打开）")
+
+    def per_span_ns(t):
+        start = time.perf_counter_ns()
+        for _ in range(args.overhead_spans):
+            with t.span("noop", bytes=1) as span:
+                span.set(ok=True)
+        elapsed = time.perf_counter_ns() - start
+        # 扣除空循环本身的耗时
+        start = time.perf_counter_ns()
+        for _ in range(args.overhead_spans):
+            pass
+        return (elapsed - (time.perf_counter_ns() - start)) / args.overhead_spans
+
+    disabled = per_span_ns(NULL_TRACER)
+    enabled = per_span_ns(Tracer(max_spans=args.overhead_spans))
+    print(f"\n⏱️  每个 span 的开销: 关闭 {disabled:.0f} ns, 开启 {enabled:.0f} ns")
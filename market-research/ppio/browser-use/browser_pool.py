@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+基于 CDP 的浏览器预热池（Browser Pool）
+
+demo.py 每个任务都要：创建 browser-chromium 沙箱 → get_host(9223) → 启动 BrowserSession → 执行 → 全部销毁，
+沙箱创建和浏览器启动的几秒钟都在任务的关键路径上。
+
+BrowserPool 常驻若干已启动浏览器、已建立 CDP 连接的沙箱，agent 租用后归还：
+- 归还后在后台通过 CDP 重置状态，不重启浏览器：
+  isolate="tabs"（默认）新开一个空白标签页，关闭其余标签页和浏览器上下文，清空 Cookie；
+  isolate="context" 每次租用使用独立的浏览器上下文（Target.createBrowserContext），归还时整体销毁
+- 健康检查：后台定期对空闲浏览器发送 Browser.getVersion，超时或失败的浏览器被销毁并补充
+- 每个浏览器最多被租用 max_uses 次（或存活 max_age 秒）后销毁重建，避免长期运行的内存膨胀
+- CDPConnection：基于 websockets（可选依赖）的最小 CDP 客户端，只发送浏览器级命令
+- MockBrowserSandbox：模拟浏览器沙箱和 CDP 命令的离线替身
+
+租用得到的 PooledBrowser 带有本次准备好的 target_id（空白标签页）和 context_id（isolate="context" 时的
+浏览器上下文）；attach(session) 启动 browser_use 的 BrowserSession 并让它驱动这个标签页，
+否则 browser_use 会停留在默认上下文里，得不到上下文隔离。
+
+用法：
+    pool = BrowserPool(size=2, isolate="context")
+    await pool.start()
+    async with pool.leased() as browser:
+        session = BrowserSession(cdp_url=browser.cdp_url)
+        await browser.attach(session)
+        ...
+    await pool.close()
+
+直接运行本文件会用 MockBrowserSandbox 离线对比每个任务新建浏览器与从预热池租用的任务延迟。
+"""
+
+import asyncio
+import collections
+import contextlib
+import itertools
+import json
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+CDP_PORT = 9223
+
+
+class CDPError(RuntimeError):
+    """CDP 命令返回错误"""
+
+
+class CDPConnection:
+    """
+    浏览器级 CDP 连接：send(method, **params) 返回命令结果
+
+    只处理命令响应，忽略 CDP 事件；需要 websockets（pip install websockets）。
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, cdp_url, timeout=10.0):
+        if websockets is None:
+            raise ImportError("CDPConnection needs websockets (pip install websockets)")
+        ws_url = await _debugger_url(cdp_url, timeout)
+        ws = await asyncio.wait_for(websockets.connect(ws_url, max_size=None), timeout)
+        return cls(ws)
+
+    async def send(self, method, timeout=10.0, **params):
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self._ws.send(json.dumps({"id": message_id, "method": method, "params": params}))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def close(self):
+        self._reader.cancel()
+        await self._ws.close()
+
+    async def _read_loop(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                future = self._pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(CDPError(message["error"].get("message", message["error"])))
+                else:
+                    future.set_result(message.get("result", {}))
+        except Exception as e:
+            error = e
+        else:
+            error = ConnectionError("CDP connection closed")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+async def _debugger_url(cdp_url, timeout):
+    """从 /json/version 取浏览器的 WebSocket 地址，并把主机换成沙箱对外暴露的地址"""
+    def fetch():
+        with urllib.request.urlopen(f"{cdp_url}/json/version", timeout=timeout) as response:
+            return json.load(response)["webSocketDebuggerUrl"]
+
+    ws_url = urllib.parse.urlsplit(await asyncio.get_running_loop().run_in_executor(None, fetch))
+    public = urllib.parse.urlsplit(cdp_url)
+    scheme = "wss" if public.scheme == "https" else "ws"
+    return urllib.parse.urlunsplit((scheme, public.netloc, ws_url.path, "", ""))
+
+
+async def _default_launch():
+    """默认使用 browser-chromium 模板创建沙箱（与 demo.py 相同）"""
+    from e2b_code_interpreter import AsyncSandbox
+    return await AsyncSandbox.create(timeout=600, template="browser-chromium")
+
+
+def _cdp_url(sandbox):
+    return f"https://{sandbox.get_host(CDP_PORT)}"
+
+
+async def _default_connect(sandbox):
+    return await CDPConnection.connect(_cdp_url(sandbox))
+
+
+class PooledBrowser:
+    """
+    池中的一个浏览器：沙箱、CDP 地址与连接，以及本次租用准备好的空白标签页 / 上下文
+
+    target_id:  本次租用的空白标签页
+    context_id: isolate="context" 时该标签页所在的浏览器上下文，isolate="tabs" 时为 None
+    """
+
+    def __init__(self, sandbox, cdp):
+        self.sandbox = sandbox
+        self.cdp = cdp
+        self.cdp_url = _cdp_url(sandbox)
+        self.uses = 0
+        self.created_at = time.monotonic()
+        self.target_id = None
+        self.context_id = None
+
+    async def attach(self, session):
+        """
+        启动 browser_use 的 BrowserSession，并把它的焦点切换到本次租用准备好的标签页
+
+        browser_use 版本不支持切换标签页时：isolate="tabs" 下准备好的空白标签页是唯一的页面，
+        BrowserSession 本来就会停在它上面；isolate="context" 下无法进入独立上下文，抛出 RuntimeError。
+        """
+        await session.start()
+        if self.target_id is None:
+            return
+        focus = getattr(session, "get_or_create_cdp_session", None)
+        if focus is None:
+            if self.context_id is None:
+                return
+            raise RuntimeError("this browser_use version cannot switch to a target, so it cannot "
+                               "use the leased browser context; use isolate='tabs'")
+        await focus(self.target_id, focus=True)
+
+
+class BrowserPool:
+    """
+    浏览器预热池
+
+    launch:          协程函数，返回已启动浏览器的沙箱（默认 browser-chromium 模板）
+    connect:         协程函数 (sandbox) → CDP 连接（默认 CDPConnection）
+    size:            常驻的空闲浏览器数
+    isolate:         "tabs" / "context"，租用之间的隔离方式
+    max_uses:        每个浏览器最多被租用的次数，None 表示不限
+    max_age:         每个浏览器最长存活时间（秒），None 表示不限
+    health_interval: 空闲浏览器健康检查间隔（秒）
+    cdp_timeout:     重置和健康检查中每条 CDP 命令的超时（秒）
+    """
+
+    def __init__(self, launch=None, connect=None, size=2, isolate="tabs", max_uses=20,
+                 max_age=None, health_interval=30.0, cdp_timeout=5.0):
+        if isolate not in ("tabs", "context"):
+            raise ValueError(f"unknown isolate {isolate!r}, expected 'tabs' or 'context'")
+        self.launch = launch or _default_launch
+        self.connect = connect or _default_connect
+        self.size = size
+        self.isolate = isolate
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.health_interval = health_interval
+        self.cdp_timeout = cdp_timeout
+
+        self._idle = collections.deque()
+        self._creating = 0
+        self._closed = False
+        self._changed = None
+        self._loops = []
+        self._tasks = set()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,            # 池为空，同步启动浏览器
+            "launched": 0,
+            "launch_failures": 0,
+            "resets": 0,
+            "reset_failures": 0,
+            "retired": 0,           # 达到 max_uses / max_age 后销毁
+            "unhealthy": 0,         # 健康检查失败
+        }
+
+    async def start(self, wait=False, timeout=None):
+        """启动后台补充和健康检查任务；wait=True 时等待池被填满"""
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+            loop = asyncio.get_running_loop()
+            self._loops = [loop.create_task(self._refill_loop()),
+                           loop.create_task(self._health_loop())]
+        if wait:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait_for(
+                    lambda: len(self._idle) >= self.size or self._closed), timeout)
+        return self
+
+    async def lease(self):
+        """租用一个浏览器：优先取空闲浏览器，池为空时同步启动"""
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        if self._changed is None:
+            await self.start()
+        browser = None
+        while self._idle and browser is None:
+            browser = self._idle.pop()
+            if self._expired(browser):
+                # 空闲期间超过了 max_age：不交给调用方，由后台销毁并补充
+                self.stats["retired"] += 1
+                self._spawn(self._destroy(browser))
+                browser = None
+        if browser is not None:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            browser = await self._launch()
+        browser.uses += 1
+        await self._notify()
+        return browser
+
+    async def release(self, browser, discard=False):
+        """归还浏览器；重置在后台进行，不占用调用方时间"""
+        if discard or self._closed or self._expired(browser):
+            if not discard and not self._closed:
+                self.stats["retired"] += 1
+            self._spawn(self._destroy(browser))
+            await self._notify()
+            return
+        self._spawn(self._recycle(browser))
+
+    @contextlib.asynccontextmanager
+    async def leased(self):
+        """以上下文管理器的方式租用浏览器；任务抛出异常时丢弃该浏览器"""
+        browser = await self.lease()
+        try:
+            yield browser
+        except BaseException:
+            await self.release(browser, discard=True)
+            raise
+        await self.release(browser)
+
+    def idle_count(self):
+        return len(self._idle)
+
+    async def close(self):
+        """关闭池：停止后台任务，销毁空闲浏览器（已租出的由调用方归还时销毁）"""
+        self._closed = True
+        await self._notify()
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        # 进行中的启动 / 重置看到 _closed 后会自行销毁浏览器
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        idle, self._idle = list(self._idle), collections.deque()
+        await asyncio.gather(*(self._destroy(b) for b in idle), return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _notify(self):
+        if self._changed is not None:
+            async with self._changed:
+                self._changed.notify_all()
+
+    def _expired(self, browser):
+        if self.max_uses is not None and browser.uses >= self.max_uses:
+            return True
+        return self.max_age is not None and time.monotonic() - browser.created_at > self.max_age
+
+    async def _launch(self):
+        sandbox = await self.launch()
+        try:
+            browser = PooledBrowser(sandbox, await self.connect(sandbox))
+            await self._prepare(browser)
+        except BaseException:
+            await _quietly(sandbox.kill())
+            raise
+        self.stats["launched"] += 1
+        return browser
+
+    async def _send(self, browser, method, **params):
+        return await browser.cdp.send(method, timeout=self.cdp_timeout, **params)
+
+    async def _prepare(self, browser):
+        """把浏览器恢复到干净状态，并为下一次租用准备好空白标签页"""
+        if self.isolate == "context":
+            if browser.context_id:
+                await self._send(browser, "Target.disposeBrowserContext",
+                                 browserContextId=browser.context_id)
+            context = await self._send(browser, "Target.createBrowserContext")
+            browser.context_id = context["browserContextId"]
+            target = await self._send(browser, "Target.createTarget", url="about:blank",
+                                      browserContextId=browser.context_id)
+            browser.target_id = target["targetId"]
+            return
+
+        targets = (await self._send(browser, "Target.getTargets"))["targetInfos"]
+        contexts = (await self._send(browser, "Target.getBrowserContexts"))["browserContextIds"]
+        # 先开新标签页再关闭旧的：关掉最后一个标签页会让部分浏览器退出
+        target = await self._send(browser, "Target.createTarget", url="about:blank")
+        browser.target_id = target["targetId"]
+        # 先销毁其他上下文（连同其中的标签页），再逐个关闭默认上下文里剩下的标签页；
+        # 并发关闭会与销毁上下文竞争，关闭已不存在的标签页时 Chrome 返回错误
+        for context_id in contexts:
+            await self._send(browser, "Target.disposeBrowserContext", browserContextId=context_id)
+        for t in targets:
+            if t["type"] == "page" and t.get("browserContextId") not in contexts:
+                try:
+                    await self._send(browser, "Target.closeTarget", targetId=t["targetId"])
+                except CDPError as e:
+                    if "No target with given id" not in str(e):
+                        raise
+        await self._send(browser, "Storage.clearCookies")
+
+    async def _recycle(self, browser):
+        try:
+            await self._prepare(browser)
+        except Exception:
+            self.stats["reset_failures"] += 1
+            await self._destroy(browser)
+            await self._notify()
+            return
+        self.stats["resets"] += 1
+        if self._closed:
+            await self._destroy(browser)
+            return
+        self._idle.append(browser)
+        surplus = self._idle.popleft() if len(self._idle) > self.size else None
+        await self._notify()
+        if surplus is not None:
+            await self._destroy(surplus)
+
+    async def _create_one(self):
+        try:
+            browser = await self._launch()
+        except Exception:
+            self.stats["launch_failures"] += 1
+            browser = None
+        finally:
+            self._creating -= 1
+        if browser is not None and self._closed:
+            await self._destroy(browser)
+        elif browser is not None:
+            self._idle.append(browser)
+        await self._notify()
+
+    async def _refill_loop(self):
+        while not self._closed:
+            deficit = self.size - len(self._idle) - self._creating
+            if deficit > 0:
+                self._creating += deficit
+                for _ in range(deficit):
+                    self._spawn(self._create_one())
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: self._closed or len(self._idle) + self._creating < self.size)
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_interval)
+            for browser in list(self._idle):
+                if browser not in self._idle:
+                    continue    # 检查期间被租走
+                try:
+                    await self._send(browser, "Browser.getVersion")
+                    healthy = not self._expired(browser)
+                except Exception:
+                    healthy = False
+                    self.stats["unhealthy"] += 1
+                if not healthy and browser in self._idle:
+                    self._idle.remove(browser)
+                    await self._destroy(browser)
+                    await self._notify()
+
+    async def _destroy(self, browser):
+        if hasattr(browser.cdp, "close"):
+            await _quietly(browser.cdp.close())
+        await _quietly(browser.sandbox.kill())
+
+
+async def _quietly(awaitable):
+    try:
+        await awaitable
+    except Exception:
+        pass
+
+
+class MockCDP:
+    """模拟浏览器级 CDP：标签页、浏览器上下文和 Cookie；crash() 之后所有命令失败"""
+
+    def __init__(self, latency=0.005):
+        self.latency = latency
+        self.targets = {}       # targetId → {"type", "url", "browserContextId"}
+        self.contexts = set()
+        self.cookies = []
+        self.crashed = False
+        self.visit("about:blank")
+
+    def visit(self, url, context_id=None):
+        """模拟 agent 打开页面并写入 Cookie"""
+        target_id = uuid.uuid4().hex[:16]
+        self.targets[target_id] = {"targetId": target_id, "type": "page", "url": url,
+                                   "browserContextId": context_id}
+        if url != "about:blank":
+            self.cookies.append({"domain": urllib.parse.urlsplit(url).hostname,
+                                 "browserContextId": context_id})
+        return target_id
+
+    def crash(self):
+        self.crashed = True
+
+    async def send(self, method, timeout=10.0, **params):
+        await asyncio.sleep(self.latency)
+        if self.crashed:
+            raise ConnectionError("browser crashed")
+        if method == "Browser.getVersion":
+            return {"product": "MockChrome/1.0", "protocolVersion": "1.3"}
+        if method == "Target.getTargets":
+            return {"targetInfos": [dict(t) for t in self.targets.values()]}
+        if method == "Target.createTarget":
+            return {"targetId": self.visit(params["url"], params.get("browserContextId"))}
+        if method == "Target.closeTarget":
+            if self.targets.pop(params["targetId"], None) is None:
+                raise CDPError("No target with given id found")
+            return {"success": True}
+        if method == "Target.createBrowserContext":
+            context_id = uuid.uuid4().hex[:16]
+            self.contexts.add(context_id)
+            return {"browserContextId": context_id}
+        if method == "Target.getBrowserContexts":
+            return {"browserContextIds": sorted(self.contexts)}
+        if method == "Target.disposeBrowserContext":
+            context_id = params["browserContextId"]
+            self.contexts.discard(context_id)
+            self.targets = {k: t for k, t in self.targets.items()
+                            if t["browserContextId"] != context_id}
+            self.cookies = [c for c in self.cookies if c["browserContextId"] != context_id]
+            return {}
+        if method == "Storage.clearCookies":
+            self.cookies = [c for c in self.cookies if c["browserContextId"] is not None]
+            return {}
+        raise CDPError(f"'{method}' wasn't found")
+
+
+class MockBrowserSandbox:
+    """
+    模拟 browser-chromium 沙箱：startup 秒后浏览器就绪，cdp 为 MockCDP
+
+    BrowserPool(launch=MockBrowserSandbox.launcher(...), connect=MockBrowserSandbox.connect)
+    """
+
+    def __init__(self, latency):
+        self.sandbox_id = f"mock-{uuid.uuid4().hex[:12]}"
+        self.cdp = MockCDP(latency)
+        self.killed = False
+
+    @classmethod
+    def launcher(cls, startup=2.0, latency=0.005):
+        async def launch():
+            await asyncio.sleep(startup)
+            return cls(latency)
+        return launch
+
+    @staticmethod
+    async def connect(sandbox):
+        await asyncio.sleep(sandbox.cdp.latency)
+        return sandbox.cdp
+
+    def get_host(self, port):
+        return f"{port}-{self.sandbox_id}.localhost"
+
+    async def kill(self):
+        self.killed = True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="浏览器预热池演示（离线，模拟 CDP）")
+    parser.add_argument("--tasks", type=int, default=12, help="依次执行的任务数")
+    parser.add_argument("--startup", type=float, default=1.0,
+                        help="模拟的沙箱创建 + 浏览器启动耗时（秒）")
+    parser.add_argument("--task-time", type=float, default=0.2, help="每个任务本身的耗时（秒）")
+    parser.add_argument("--size", type=int, default=2, help="预热池大小")
+    parser.add_argument("--max-uses", type=int, default=5, help="每个浏览器最多租用次数")
+    args = parser.parse_args()
+
+    launch = MockBrowserSandbox.launcher(startup=args.startup)
+    leftovers = []
+
+    async def task(browser, index):
+        """模拟 agent：检查拿到的浏览器是干净的，然后打开页面、写入 Cookie"""
+        cdp, context_id = browser.cdp, browser.context_id
+        pages = [t for t in cdp.targets.values() if t["browserContextId"] == context_id]
+        if len(pages) != 1 or any(c["browserContextId"] == context_id for c in cdp.cookies):
+            leftovers.append(index)
+        for site in ("https://www.baidu.com", "https://github.com"):
+            cdp.visit(site, context_id)
+        await asyncio.sleep(args.task_time)
+
+    async def cold():
+        timings = []
+        for index in range(args.tasks):
+            start = time.perf_counter()
+            # demo.py 的做法：每个任务新建沙箱和浏览器，用完销毁
+            sandbox = await launch()
+            browser = PooledBrowser(sandbox, await MockBrowserSandbox.connect(sandbox))
+            await task(browser, index)
+            await sandbox.kill()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    async def pooled(isolate):
+        timings = []
+        pool = BrowserPool(launch=launch, connect=MockBrowserSandbox.connect, size=args.size,
+                           isolate=isolate, max_uses=args.max_uses, health_interval=0.2)
+        await pool.start(wait=True)
+        for index in range(args.tasks):
+            if index == args.tasks // 2 and pool._idle:
+                pool._idle[0].cdp.crash()      # 空闲浏览器崩溃，由健康检查发现并替换
+            start = time.perf_counter()
+            async with pool.leased() as browser:
+                await task(browser, index)
+            timings.append(time.perf_counter() - start)
+            await asyncio.sleep(0.05)   # 任务间隔：重置在这段时间里完成
+        await pool.close()
+        return timings, pool.stats
+
+    def report(label, timings):
+        timings = sorted(timings)
+        print(f"   {label:<22} 平均 {sum(timings) / len(timings) * 1000:7.1f} ms"
+              f"   p50={timings[len(timings) // 2] * 1000:7.1f} ms"
+              f"   max={timings[-1] * 1000:7.1f} ms")
+
+    async def main():
+        print("=" * 60)
+        print(f"依次执行 {args.tasks} 个任务（浏览器启动 {args.startup}s，任务 {args.task_time}s）")
+        print("=" * 60)
+        report("每个任务新建浏览器", await cold())
+        for isolate in ("tabs", "context"):
+            timings, stats = await pooled(isolate)
+            report(f"预热池（isolate={isolate}）", timings)
+            print(f"   {'':<22} {stats}")
+        print(f"\n🧹 租用时发现上一个任务残留的标签页 / Cookie: {len(leftovers)} 次")
+
+    asyncio.run(main())
@@ -1,45 +1,39 @@
 import asyncio
 import os
-import time
 
 from browser_use import Agent, BrowserSession
 from browser_use.llm import ChatOpenAI
-from e2b_code_interpreter import Sandbox
-
-async def screenshot(agent: Agent):
-  # 截图功能
-  print("开始截图...")  
-  page = await agent.browser_session.get_current_page()
-  screenshot_bytes = await page.screenshot(full_page=True, type='png')
-  # screenshot 方法返回图像的二进制数据，将其保存为 PNG 文件
-  screenshots_dir = os.path.join(".", "screenshots")
-  os.makedirs(screenshots_dir, exist_ok=True)
-  screenshot_path = os.path.join(screenshots_dir, f"{time.time()}.png")
-  with open(screenshot_path, "wb") as f:
-    f.write(screenshot_bytes)
-  print(f"截图已保存至 {screenshot_path}")
+from e2b_code_interpreter import AsyncSandbox
 
-async def main():
-    # 创建 E2B 沙箱实例
-    sandbox = Sandbox.create(
+from browser_pool import BrowserPool
+from screenshot_pipeline import ScreenshotPipeline
+
+TASKS = [
+    "去百度搜索 Browser-use 的相关信息，并总结出 3 个使用场景",
+]
+
+
+async def launch():
+    # 创建 E2B 沙箱实例（异步 SDK，不阻塞事件循环）
+    return await AsyncSandbox.create(
         timeout=600,  # 超时时间（秒）
         template="browser-chromium",  # 该模板包含 chromium 浏览器，且暴露 9223 端口用于远程连接
     )
 
-    try:
-        # 获取沙箱的 Chrome 调试端口地址
-        host = sandbox.get_host(9223) # 获取沙箱 9223 端口的地址
-        cdp_url = f"https://{host}"
-        print(f"Chrome 调试协议地址: {cdp_url}")
-
-        # 创建 Browser-use 会话
-        browser_session = BrowserSession(cdp_url=cdp_url) # 使用 cdp 协议连接远程沙箱中的浏览器
-        await browser_session.start()
+
+async def run_task(pool, task, screenshots):
+    # 从预热池租用已启动的浏览器；任务结束后在后台通过 CDP 重置，不重启浏览器
+    async with pool.leased() as browser:
+        print(f"Chrome 调试协议地址: {browser.cdp_url}")
+
+        # 创建 Browser-use 会话，并切换到本次租用在独立浏览器上下文中准备好的标签页
+        browser_session = BrowserSession(cdp_url=browser.cdp_url) # 使用 cdp 协议连接远程沙箱中的浏览器
+        await browser.attach(browser_session)
         print("Browser-use 会话创建成功")
 
         # 创建 AI Agent
         agent = Agent(
-            task="去百度搜索 Browser-use 的相关信息，并总结出 3 个使用场景",
+            task=task,
             llm=ChatOpenAI(
                 api_key=os.getenv("LLM_API_KEY"),
                 base_url=os.getenv("LLM_BASE_URL"),
@@ -52,17 +46,35 @@ async def main():
         # 运行 Agent 任务
         print("开始执行 Agent 任务...")
         await agent.run(
-          on_step_end=screenshot, # 在每个步骤结束时调用 screenshot 截图
+          on_step_end=screenshots.hook(), # 在每个步骤结束时安排一次后台截图
         )
 
-        # 关闭浏览器会话
+        # 关闭浏览器会话（浏览器本身留在池中）
         await browser_session.close()
         print("任务执行完成")
 
+
+async def main():
+    # 常驻一个浏览器沙箱；isolate="context" 让每个任务使用独立的浏览器上下文（Cookie / 存储互不可见）
+    pool = BrowserPool(launch=launch, size=1, isolate="context")
+
+    # 截图在后台任务中截取、由写入线程写盘，不阻塞 agent 的每个步骤
+    screenshots = ScreenshotPipeline(directory=os.path.join(".", "screenshots"), format="jpeg")
+
+    try:
+        await pool.start(wait=True)
+        for task in TASKS:
+            await run_task(pool, task, screenshots)
+
     finally:
-        # 清理沙箱资源
-        sandbox.kill()
-        print("沙箱资源已清理")
+        # 等待进行中的截图写完
+        await screenshots.aclose()
+        stats = screenshots.stats
+        print(f"截图已保存 {stats['written']} 张，去重 {stats['duplicates']} 张")
+
+        # 销毁池中的浏览器沙箱
+        await pool.close()
+        print(f"沙箱资源已清理（{pool.stats}）")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+离开事件循环的截图流水线（Screenshot Pipeline）
+
+demo.py 原来的 screenshot 钩子在每个 on_step_end 里：
+- await 一张 full_page=True 的 PNG（页面越长越慢，agent 一直等着）
+- 在事件循环里用阻塞的 open(...).write 写文件，整个循环跟着卡住
+
+ScreenshotPipeline 把这些都移出 agent 的关键路径：
+- hook() 返回的 on_step_end 钩子只安排一个后台截图任务就返回，步骤延迟与截图大小无关
+- 截图字节放进有界队列，由后台写入线程编码转换、去重、写盘；队列满时丢弃新截图而不是阻塞 agent
+- 可选 JPEG（浏览器端直接编码，传输量更小）/ WebP（写入线程用 Pillow 转换）、只截取视口
+- 去重：感知哈希（dHash，需要 Pillow）汉明距离不超过 hash_distance 的帧视为未变化，
+  未安装 Pillow 时退回按内容完全相同去重
+- 按会话限速：同一会话两次截图至少间隔 min_interval 秒，上一张还没截完时跳过
+
+用法：
+    screenshots = ScreenshotPipeline(directory="screenshots", format="jpeg")
+    await agent.run(on_step_end=screenshots.hook())
+    await screenshots.aclose()      # 等待进行中的截图并写完队列
+
+直接运行本文件会用模拟页面离线对比原来的钩子与流水线的步骤延迟和事件循环卡顿。
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FORMATS = ("png", "jpeg", "webp")
+
+
+def dhash(data, size=8):
+    """差值哈希：缩放为 (size+1)×size 灰度图，比较相邻像素，得到 size*size 位整数"""
+    image = Image.open(io.BytesIO(data)).convert("L").resize((size + 1, size))
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = value << 1 | (left > right)
+    return value
+
+
+class ScreenshotPipeline:
+    """
+    截图流水线
+
+    directory:     保存目录，每个会话一个子目录
+    format:        png / jpeg / webp；jpeg 由浏览器直接编码，webp 在写入线程里用 Pillow 转换
+    quality:       jpeg / webp 的质量
+    full_page:     False 时只截取视口（长页面上快得多）
+    max_queue:     等待写入的截图上限，队列满时丢弃新截图
+    min_interval:  同一会话两次截图的最小间隔（秒）
+    dedup:         "phash"（需要 Pillow，否则按 "exact" 处理）/ "exact" / None
+    hash_distance: phash 汉明距离不超过该值视为与上一张相同
+    """
+
+    def __init__(self, directory="screenshots", format="png", quality=80, full_page=True,
+                 max_queue=32, min_interval=0.0, dedup="phash", hash_distance=4):
+        if format not in FORMATS:
+            raise ValueError(f"unknown format {format!r}, expected one of {FORMATS}")
+        if format == "webp" and Image is None:
+            raise ImportError("webp screenshots need Pillow (pip install pillow)")
+        if dedup not in ("phash", "exact", None):
+            raise ValueError(f"unknown dedup {dedup!r}, expected 'phash', 'exact' or None")
+        self.directory = directory
+        self.format = format
+        self.quality = quality
+        self.full_page = full_page
+        self.min_interval = min_interval
+        self.dedup = "exact" if dedup == "phash" and Image is None else dedup
+        self.hash_distance = hash_distance
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._tasks = set()
+        self._last_capture = {}     # 会话 → 最近一次截图的时间（事件循环线程内访问）
+        self._busy = set()          # 正在截图的会话
+        self._last_hash = {}        # 会话 → 最近写入的帧的哈希（写入线程内访问）
+        self._sequence = {}
+        self._lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="screenshot-writer",
+                                        daemon=True)
+        self._closed = False
+
+        self.stats = {
+            "captured": 0,
+            "rate_limited": 0,      # 间隔不足 min_interval
+            "busy": 0,              # 上一张还没截完
+            "dropped": 0,           # 写入队列已满
+            "duplicates": 0,        # 与上一张相同，未写入
+            "written": 0,
+            "bytes_written": 0,
+            "failures": 0,
+            "capture_seconds": 0.0,
+        }
+
+    def start(self):
+        """启动写入线程（第一次截图时自动启动）"""
+        if not self._writer.is_alive():
+            self._writer.start()
+        return self
+
+    def hook(self, session="agent"):
+        """返回 agent.run(on_step_end=...) 钩子：只安排后台截图，立即返回"""
+        async def on_step_end(agent):
+            self.schedule(agent.browser_session.get_current_page, session)
+        return on_step_end
+
+    def schedule(self, get_page, session="agent"):
+        """
+        在后台任务中截图；get_page 为返回页面的协程函数
+
+        按会话限速：间隔不足 min_interval 或上一张还没截完时直接跳过，返回 None。
+        """
+        now = time.monotonic()
+        if session in self._busy:
+            self._count("busy")
+            return None
+        last = self._last_capture.get(session)
+        if last is not None and now - last < self.min_interval:
+            self._count("rate_limited")
+            return None
+        self._last_capture[session] = now
+        self._busy.add(session)
+        task = asyncio.get_running_loop().create_task(self._capture(get_page, session))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def capture(self, page, session="agent"):
+        """立即截取 page 并放入写入队列（不限速）；返回是否入队"""
+        start = time.perf_counter()
+        options = {"full_page": self.full_page,
+                   "type": "jpeg" if self.format == "jpeg" else "png"}
+        if self.format == "jpeg":
+            options["quality"] = self.quality
+        data = await page.screenshot(**options)
+        with self._lock:
+            self.stats["captured"] += 1
+            self.stats["capture_seconds"] += time.perf_counter() - start
+        return self.submit(data, session)
+
+    def submit(self, data, session="agent"):
+        """把截图字节放入写入队列；队列满时丢弃并返回 False"""
+        if self._closed:
+            raise RuntimeError("screenshot pipeline is closed")
+        self.start()
+        try:
+            self._queue.put_nowait((session, time.time(), data))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        return True
+
+    async def aclose(self):
+        """等待进行中的截图，写完队列后停止写入线程"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        """写完队列后停止写入线程（不等待尚未入队的截图）"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    # ---------- 内部实现 ----------
+
+    async def _capture(self, get_page, session):
+        try:
+            await self.capture(await get_page(), session)
+        except Exception:
+            self._count("failures")
+        finally:
+            self._busy.discard(session)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception:
+                self._count("failures")
+
+    def _write(self, session, timestamp, data):
+        if self.dedup:
+            digest = dhash(data) if self.dedup == "phash" else hashlib.sha1(data).digest()
+            previous = self._last_hash.get(session)
+            if previous is not None and self._same(previous, digest):
+                self._count("duplicates")
+                return
+            self._last_hash[session] = digest
+
+        if self.format == "webp":
+            output = io.BytesIO()
+            Image.open(io.BytesIO(data)).save(output, "WEBP", quality=self.quality)
+            data = output.getvalue()
+
+        directory = os.path.join(self.directory, session)
+        os.makedirs(directory, exist_ok=True)
+        sequence = self._sequence[session] = self._sequence.get(session, 0) + 1
+        extension = "jpg" if self.format == "jpeg" else self.format
+        path = os.path.join(directory, f"{sequence:05d}-{timestamp:.3f}.{extension}")
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self.stats["written"] += 1
+            self.stats["bytes_written"] += len(data)
+
+    def _same(self, previous, digest):
+        if self.dedup == "phash":
+            return bin(previous ^ digest).count("1") <= self.hash_distance
+        return previous == digest
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import shutil
+    import struct
+    import tempfile
+    import zlib
+
+    parser = argparse.ArgumentParser(description="截图流水线演示（离线，模拟页面）")
+    parser.add_argument("--steps", type=int, default=30, help="agent 步骤数")
+    parser.add_argument("--step-time", type=float, default=0.05, help="每个步骤本身的耗时（秒）")
+    parser.add_argument("--page-height", type=int, default=12000, help="整页截图的高度（像素）")
+    parser.add_argument("--capture-rate", type=float, default=100.0,
+                        help="模拟浏览器截图编码 + 传输速度（MB/s）")
+    parser.add_argument("--change-every", type=int, default=3, help="页面每隔几步变化一次")
+    args = parser.parse_args()
+
+    def make_png(width, height, seed):
+        """不依赖 Pillow 生成 PNG：噪声行模拟图片和文字，其余为白色背景"""
+        rng = random.Random(seed)
+        white = b"\x00" + b"\xff" * (width * 3)
+        rows = [b"\x00" + rng.randbytes(width * 3) if rng.random() < 0.3 else white
+                for _ in range(height)]
+        raw = zlib.compress(b"".join(rows), 1)
+
+        def chunk(kind, body):
+            return (struct.pack(">I", len(body)) + kind + body
+                    + struct.pack(">I", zlib.crc32(kind + body)))
+
+        return (b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", raw) + chunk(b"IEND", b""))
+
+    versions = (args.steps + args.change_every - 1) // args.change_every
+    full_pages = [make_png(1280, args.page_height, seed) for seed in range(versions)]
+    viewports = [make_png(1280, 720, seed) for seed in range(versions)]
+
+    class FakePage:
+        """模拟页面：截图耗时与图片大小成正比，页面每 change_every 步变化一次"""
+
+        def __init__(self):
+            self.step = 0
+
+        async def screenshot(self, full_page=False, type="png", quality=None):
+            frames = full_pages if full_page else viewports
+            data = frames[self.step // args.change_every]
+            await asyncio.sleep(len(data) / (args.capture_rate * (1 << 20)))
+            return data
+
+    class FakeBrowserSession:
+        def __init__(self, page):
+            self.page = page
+
+        async def get_current_page(self):
+            return self.page
+
+    class FakeAgent:
+        def __init__(self):
+            self.browser_session = FakeBrowserSession(FakePage())
+
+        async def run(self, on_step_end):
+            """返回每个步骤（含 on_step_end 钩子）的耗时"""
+            timings = []
+            for step in range(args.steps):
+                start = time.perf_counter()
+                self.browser_session.page.step = step
+                await asyncio.sleep(args.step_time)
+                await on_step_end(self)
+                timings.append(time.perf_counter() - start)
+            return timings
+
+    async def measure(label, on_step_end, pipeline=None):
+        # 同时运行一个 1ms 的心跳任务，记录事件循环被阻塞的最长时间
+        stall = 0.0
+        running = True
+
+        async def heartbeat():
+            nonlocal stall
+            while running:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                stall = max(stall, time.perf_counter() - start - 0.001)
+
+        ticker = asyncio.get_running_loop().create_task(heartbeat())
+        start = time.perf_counter()
+        timings = await FakeAgent().run(on_step_end)
+        elapsed = time.perf_counter() - start
+        if pipeline:
+            await pipeline.aclose()
+        running = False
+        await ticker
+        overhead = sorted(t - args.step_time for t in timings)
+        print(f"   {label:<26} 每步额外耗时 p50={overhead[len(overhead) // 2] * 1000:7.1f} ms"
+              f"   max={overhead[-1] * 1000:7.1f} ms   事件循环最长卡顿 {stall * 1000:6.1f} ms"
+              f"   总耗时 {elapsed:5.2f} s")
+        if pipeline:
+            stats = pipeline.stats
+            print(f"   {'':<26} 截图 {stats['captured']}，写入 {stats['written']}"
+                  f"（{stats['bytes_written'] / (1 << 20):.1f} MB），去重 {stats['duplicates']}，"
+                  f"限速/跳过 {stats['rate_limited'] + stats['busy']}，丢弃 {stats['dropped']}")
+
+    async def main(root):
+        async def legacy(agent):
+            # demo.py 原来的钩子
+            page = await agent.browser_session.get_current_page()
+            data = await page.screenshot(full_page=True, type="png")
+            os.makedirs(os.path.join(root, "legacy"), exist_ok=True)
+            with open(os.path.join(root, "legacy", f"{time.time()}.png"), "wb") as f:
+                f.write(data)
+
+        print("=" * 60)
+        print(f"{args.steps} 个步骤，整页截图 {len(full_pages[0]) / (1 << 20):.1f} MB，"
+              f"视口截图 {len(viewports[0]) / (1 << 20):.2f} MB")
+        print("=" * 60)
+        await measure("原来的钩子", legacy)
+        pipeline = ScreenshotPipeline(directory=os.path.join(root, "full"))
+        await measure("流水线（整页）", pipeline.hook(), pipeline)
+        pipeline = ScreenshotPipeline(directory=os.path.join(root, "viewport"), full_page=False,
+                                      min_interval=0.1)
+        await measure("流水线（视口 + 限速 0.1s）", pipeline.hook(), pipeline)
+        if Image is None:
+            print("\nℹ️  未安装 Pillow，按内容完全相同去重（pip install pillow 启用感知哈希 / WebP）")
+
+    root = tempfile.mkdtemp(prefix="screenshots-")
+    try:
+        asyncio.run(main(root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+事件驱动的桌面流监管器（Desktop Stream Supervisor）
+
+demo.py 用 while True: time.sleep(0.1) 保持桌面沙箱存活：每个桌面占一个每秒醒来 10 次的线程，
+流断了也没有任何信号，没人看的流还在持续占用编码 CPU。
+
+DesktopSupervisor 在一个进程里管理多个桌面沙箱：
+- 每个桌面在沙箱内运行一个很小的监视脚本，每 watch_interval 秒读取一次 /proc/net/tcp，
+  只在状态变化时输出一行 JSON。沙箱内没有可用的连接事件源，这一层仍是轮询（默认 1 秒，开销在沙箱内）
+- 本地每个桌面一个线程阻塞在监视命令的 handle.wait(on_stdout=...) 上（e2b 只在 wait() / 迭代句柄时
+  送达后台命令的输出，同步 SDK 也没有多路复用接口），只有事件行到达时才被唤醒
+- 事件：stream_started / stream_stopped / viewers（观看连接数变化）/ stream_down（流意外中断）/
+  desktop_lost（沙箱不可用，监视命令退出）
+- 没有观看者超过 idle_stop 秒自动停止流，释放编码 CPU；url() 按需重新启动
+- 流意外中断时自动重启（最多 max_restarts 次）
+- 定时操作由一个调度线程按最近的截止时间等待，没有固定频率的 tick
+- run() 阻塞在一个 Event 上，SIGINT / SIGTERM 时停止所有流并销毁桌面
+
+用法：
+    supervisor = DesktopSupervisor(on_event=print)
+    supervisor.add(Sandbox.create(), name="desk-1")
+    print(supervisor.url("desk-1"))
+    supervisor.run()
+
+直接运行本文件会用 MockDesktop（本地 TCP 端口模拟桌面流）离线演示观看者连接、流中断自动重启、
+空闲自动停止和收到 SIGTERM 后的清理。
+"""
+
+import heapq
+import itertools
+import json
+import shlex
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+
+STREAM_PORT = 6080
+
+# 在沙箱内运行：统计流端口上的已建立连接数和是否在监听，只在变化时输出
+WATCHER = r"""
+import json, sys, time
+port, interval = int(sys.argv[1]), float(sys.argv[2])
+def scan():
+    viewers, listening = 0, False
+    for name in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(name) as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if int(fields[1].rsplit(":", 1)[1], 16) != port:
+                continue
+            if fields[3] == "0A":
+                listening = True
+            elif fields[3] == "01":
+                viewers += 1
+    return viewers, listening
+last = None
+while True:
+    state = scan()
+    if state != last:
+        print(json.dumps({"viewers": state[0], "listening": state[1]}), flush=True)
+        last = state
+    time.sleep(interval)
+"""
+
+
+@dataclass
+class StreamEvent:
+    """一个桌面事件"""
+    desktop: str
+    kind: str           # stream_started / stream_stopped / viewers / stream_down / desktop_lost
+    value: object = None
+    time: float = field(default_factory=time.time)
+
+
+class _Scheduler:
+    """单线程定时器：按最近的截止时间等待，可按 key 取消 / 替换"""
+
+    def __init__(self):
+        self._heap = []
+        self._keys = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="desktop-scheduler", daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, key, fn):
+        """delay 秒后调用 fn()；同一个 key 只保留最后一次安排"""
+        with self._cond:
+            entry = [time.monotonic() + delay, next(self._counter), key, fn]
+            self._keys[key] = entry
+            heapq.heappush(self._heap, entry)
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            entry = self._keys.pop(key, None)
+            if entry is not None:
+                entry[3] = None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    while self._heap and self._heap[0][3] is None:
+                        heapq.heappop(self._heap)
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                entry = heapq.heappop(self._heap)
+                fn, entry[3] = entry[3], None
+                if self._keys.get(entry[2]) is entry:
+                    del self._keys[entry[2]]
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+class _Desktop:
+    """监管器内部的桌面状态"""
+
+    def __init__(self, name, sandbox, port):
+        self.name = name
+        self.sandbox = sandbox
+        self.port = port
+        self.streaming = False      # 期望状态：流应该在运行
+        self.listening = False      # 监视脚本报告的实际状态
+        self.viewers = 0
+        self.restarts = 0
+        self.watcher = None
+        self.buffer = ""
+        self.lock = threading.RLock()
+
+
+class DesktopSupervisor:
+    """
+    多桌面流监管器
+
+    idle_stop:      没有观看者多少秒后停止流（None 表示不自动停止）
+    start_timeout:  启动流后多少秒内没有监听视为启动失败
+    max_restarts:   每个桌面流意外中断后自动重启的次数上限
+    watch_interval: 沙箱内监视脚本的检查间隔（秒）
+    on_event:       事件回调 on_event(StreamEvent)，在监视 / 调度线程中调用
+    history:        保留在 events 中的最近事件数
+    """
+
+    def __init__(self, idle_stop=60.0, start_timeout=15.0, max_restarts=3, watch_interval=1.0,
+                 on_event=None, history=1000):
+        self.idle_stop = idle_stop
+        self.start_timeout = start_timeout
+        self.max_restarts = max_restarts
+        self.watch_interval = watch_interval
+        self.on_event = on_event
+        self.events = []
+        self.history = history
+        self._desktops = {}
+        self._lock = threading.Lock()
+        self._scheduler = _Scheduler()
+        self._stopping = threading.Event()
+        self._closed = False
+
+    def add(self, sandbox, name=None, port=STREAM_PORT, start_stream=True):
+        """开始监管一个桌面沙箱，返回它的名称"""
+        name = name or sandbox.sandbox_id
+        desktop = _Desktop(name, sandbox, port)
+        with self._lock:
+            if name in self._desktops:
+                raise ValueError(f"desktop {name!r} is already supervised")
+            self._desktops[name] = desktop
+        desktop.watcher = sandbox.commands.run(
+            f"python3 -u -c {shlex.quote(WATCHER)} {port} {self.watch_interval}",
+            background=True,
+            timeout=0,
+        )
+        threading.Thread(target=self._wait_watcher, args=(desktop,),
+                         name=f"desktop-watch-{name}", daemon=True).start()
+        if start_stream:
+            self._start_stream(desktop)
+        return name
+
+    def url(self, name, view_only=False, **kwargs):
+        """返回流地址；流已被空闲停止时重新启动"""
+        desktop = self._desktops[name]
+        self._start_stream(desktop)
+        return desktop.sandbox.stream.get_url(view_only=view_only, **kwargs)
+
+    def remove(self, name, kill=True):
+        """停止监管：停止流和监视脚本，kill=True 时销毁沙箱"""
+        with self._lock:
+            desktop = self._desktops.pop(name, None)
+        if desktop is None:
+            return
+        self._scheduler.cancel((name, "idle"))
+        self._scheduler.cancel((name, "start"))
+        self._stop_stream(desktop, reason="removed")
+        if desktop.watcher is not None:
+            _quietly(desktop.watcher.kill)
+        if kill:
+            _quietly(desktop.sandbox.kill)
+
+    def status(self):
+        """{名称: {"streaming", "listening", "viewers", "restarts"}}"""
+        with self._lock:
+            desktops = list(self._desktops.values())
+        return {d.name: {"streaming": d.streaming, "listening": d.listening,
+                         "viewers": d.viewers, "restarts": d.restarts} for d in desktops}
+
+    def run(self, handle_signals=True):
+        """阻塞直到 stop() 或收到 SIGINT / SIGTERM，然后清理所有桌面"""
+        previous = {}
+        if handle_signals and threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous[signum] = signal.signal(signum, lambda *_: self._stopping.set())
+        try:
+            self._stopping.wait()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            self.close()
+
+    def stop(self):
+        """让 run() 返回（可在任意线程调用）"""
+        self._stopping.set()
+
+    def close(self, kill=True):
+        """停止所有流和监视脚本，kill=True 时销毁所有桌面"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        with self._lock:
+            names = list(self._desktops)
+        threads = [threading.Thread(target=self.remove, args=(name, kill)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._scheduler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部实现 ----------
+
+    def _emit(self, desktop, kind, value=None):
+        event = StreamEvent(desktop.name, kind, value)
+        with self._lock:
+            self.events.append(event)
+            del self.events[:-self.history]
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception:
+                pass
+
+    def _start_stream(self, desktop):
+        with desktop.lock:
+            if desktop.streaming:
+                return
+            desktop.sandbox.stream.start()
+            desktop.streaming = True
+        self._emit(desktop, "stream_started")
+        self._scheduler.call_later(self.start_timeout, (desktop.name, "start"),
+                                   lambda: self._check_started(desktop))
+        # 启动后一直没有人连接，同样按空闲处理
+        self._schedule_idle(desktop)
+
+    def _stop_stream(self, desktop, reason):
+        with desktop.lock:
+            if not desktop.streaming:
+                return
+            desktop.streaming = False
+            _quietly(desktop.sandbox.stream.stop)
+        self._scheduler.cancel((desktop.name, "start"))
+        self._emit(desktop, "stream_stopped", reason)
+
+    def _schedule_idle(self, desktop):
+        if self.idle_stop is not None and desktop.viewers == 0:
+            self._scheduler.call_later(self.idle_stop, (desktop.name, "idle"),
+                                       lambda: self._idle_timeout(desktop))
+
+    def _idle_timeout(self, desktop):
+        if desktop.viewers == 0 and desktop.name in self._desktops:
+            self._stop_stream(desktop, reason="idle")
+
+    def _check_started(self, desktop):
+        if desktop.streaming and not desktop.listening:
+            self._stream_down(desktop, "start timeout")
+
+    def _stream_down(self, desktop, reason):
+        self._emit(desktop, "stream_down", reason)
+        with desktop.lock:
+            if not desktop.streaming or self._closed:
+                return
+            desktop.streaming = False
+            _quietly(desktop.sandbox.stream.stop)
+            if desktop.restarts >= self.max_restarts:
+                self._emit(desktop, "stream_stopped", "too many restarts")
+                return
+            desktop.restarts += 1
+        try:
+            self._start_stream(desktop)
+        except Exception as e:
+            self._emit(desktop, "stream_stopped", f"restart failed: {e}")
+
+    def _on_output(self, desktop, chunk):
+        desktop.buffer += chunk
+        *lines, desktop.buffer = desktop.buffer.split("\n")
+        for line in lines:
+            try:
+                state = json.loads(line)
+            except ValueError:
+                continue
+            self._on_state(desktop, state["viewers"], state["listening"])
+
+    def _on_state(self, desktop, viewers, listening):
+        was_listening, desktop.listening = desktop.listening, listening
+        if viewers != desktop.viewers:
+            desktop.viewers = viewers
+            self._emit(desktop, "viewers", viewers)
+            if viewers:
+                self._scheduler.cancel((desktop.name, "idle"))
+            else:
+                self._schedule_idle(desktop)
+        if listening and not was_listening:
+            self._scheduler.cancel((desktop.name, "start"))
+        elif was_listening and not listening and desktop.streaming:
+            self._stream_down(desktop, "stream port closed")
+
+    def _wait_watcher(self, desktop):
+        """阻塞在监视命令上，把输出交给 _on_output；命令意外结束说明沙箱已不可用"""
+        try:
+            desktop.watcher.wait(on_stdout=lambda chunk: self._on_output(desktop, chunk),
+                                 on_stderr=lambda chunk: None)
+        except Exception:
+            pass   # CommandExitException：监视命令被 kill 或沙箱已销毁
+        if desktop.name in self._desktops and not self._closed:
+            self._emit(desktop, "desktop_lost")
+            self.remove(desktop.name, kill=False)
+
+
+def _quietly(fn):
+    try:
+        fn()
+    except Exception:
+        pass
+
+
+class MockDesktop:
+    """
+    模拟 e2b_desktop.Sandbox：stream 在本地端口上监听 TCP 连接，commands.run 在本机执行命令
+
+    connect_viewer() 模拟一个观看者打开 VNC 页面，crash_stream() 模拟流进程崩溃。
+    """
+
+    def __init__(self):
+        import socket
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        self.port = probe.getsockname()[1]
+        probe.close()
+        self.sandbox_id = f"mock-desktop-{self.port}"
+        self.stream = _MockStream(self.port)
+        self.commands = _MockCommands()
+
+    def connect_viewer(self):
+        import socket
+        return socket.create_connection(("127.0.0.1", self.port))
+
+    def crash_stream(self):
+        self.stream._close()
+
+    def kill(self):
+        self.stream._close()
+        self.commands._kill_all()
+
+
+class _MockStream:
+    def __init__(self, port):
+        self.port = port
+        self._server = None
+        self._clients = []
+
+    def start(self):
+        import socket
+        if self._server is not None:
+            raise RuntimeError("stream is already running")
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", self.port))
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+
+    def get_url(self, view_only=False, **kwargs):
+        suffix = "&view_only=true" if view_only else ""
+        return f"http://127.0.0.1:{self.port}/vnc.html?autoconnect=true{suffix}&resize=scale"
+
+    def stop(self):
+        if self._server is None:
+            raise RuntimeError("stream is not running")
+        self._close()
+
+    def _accept(self, server):
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            self._clients.append(client)
+
+    def _close(self):
+        import socket
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
+        clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+
+
+class _MockCommands:
+    def __init__(self):
+        self._procs = []
+
+    def run(self, cmd, background=False, on_stdout=None, timeout=60, **kwargs):
+        import subprocess
+        proc = subprocess.Popen(["/bin/sh", "-c", cmd], stdout=subprocess.PIPE, text=True,
+                                start_new_session=True)
+        self._procs.append(proc)
+        handle = _MockHandle(proc)
+        # 与 e2b 一样：后台命令忽略 run 的回调，前台命令在 wait 中回调
+        return handle if background else handle.wait(on_stdout=on_stdout)
+
+    def _kill_all(self):
+        for proc in self._procs:
+            _kill_group(proc)
+
+
+class _MockHandle:
+    def __init__(self, proc):
+        self._proc = proc
+
+    def wait(self, on_pty=None, on_stdout=None, on_stderr=None):
+        for line in self._proc.stdout:
+            if on_stdout:
+                on_stdout(line)
+        exit_code = self._proc.wait()
+        if exit_code != 0:
+            raise RuntimeError(f"Command exited with code {exit_code}")
+        return exit_code
+
+    def kill(self):
+        _kill_group(self._proc)
+
+
+def _kill_group(proc):
+    import os
+    if proc.poll() is None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import resource
+
+    parser = argparse.ArgumentParser(description="桌面流监管器演示（离线，模拟桌面）")
+    parser.add_argument("--desktops", type=int, default=3, help="监管的桌面数")
+    parser.add_argument("--idle-stop", type=float, default=1.0, help="无观看者自动停止流的时间（秒）")
+    parser.add_argument("--watch-interval", type=float, default=0.1, help="沙箱内监视脚本的检查间隔（秒）")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+
+    def show(event):
+        value = "" if event.value is None else f" {event.value}"
+        print(f"   [{time.monotonic() - start:5.2f}s] {event.desktop:<10} {event.kind}{value}")
+
+    supervisor = DesktopSupervisor(idle_stop=args.idle_stop, start_timeout=2.0,
+                                   watch_interval=args.watch_interval, on_event=show)
+    desktops = {}
+    for i in range(args.desktops):
+        desktop = MockDesktop()
+        desktops[supervisor.add(desktop, name=f"desk-{i + 1}", port=desktop.port)] = desktop
+
+    def scenario():
+        first, second = desktops["desk-1"], desktops["desk-2"]
+        time.sleep(0.3)
+        viewers = [first.connect_viewer(), first.connect_viewer(), second.connect_viewer()]
+        time.sleep(0.5)
+        second.crash_stream()            # 流进程崩溃 → stream_down → 自动重启
+        time.sleep(0.5)
+        viewers[0].close()
+        viewers[1].close()               # desk-1 观看者全部离开 → idle_stop 秒后停止流
+        time.sleep(args.idle_stop + 0.5)
+        url = supervisor.url("desk-1")   # 再次需要时按需启动
+        print(f"   重新获取地址: {url}")
+        time.sleep(0.5)
+        print(f"   状态: {supervisor.status()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    print("=" * 60)
+    print(f"监管 {args.desktops} 个桌面（无观看者 {args.idle_stop}s 后停止流）")
+    print("=" * 60)
+    threading.Thread(target=scenario, daemon=True).start()
+    supervisor.run()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    leftover = sum(d.stream._server is not None for d in desktops.values())
+    print(f"\n🧹 收到 SIGTERM 后清理完成，仍在运行的流: {leftover}，"
+          f"监管进程 CPU {usage.ru_utime + usage.ru_stime:.2f}s")